@@ -0,0 +1,54 @@
+"""
+batch_planner.py — Token-budget batch packing for Claude calls.
+
+Fixed-size batches make a call with three short talks mostly empty and
+one with three long talks push against the context and time out. The
+planner instead estimates tokens per item and packs items into as few
+calls as fit a token budget (first-fit decreasing), with a cap on items
+per call so responses stay a manageable size. An item that alone exceeds
+the budget gets a call to itself.
+"""
+
+CHARS_PER_TOKEN = 4  # rough average for English transcript text
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate for prompt text."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def plan_batches(items: list, sizes: list[int], budget: int,
+                 max_items: int) -> list[list]:
+    """
+    Pack items into batches whose summed size stays within `budget`.
+
+    `sizes` gives each item's estimated token count. Returns batches of
+    items, ordered by the position of their first item in `items` so the
+    plan is deterministic and roughly follows the input order.
+    """
+    if len(items) != len(sizes):
+        raise ValueError("items and sizes must be the same length")
+
+    order = sorted(range(len(items)), key=lambda i: (-sizes[i], i))
+    bins: list[list[int]] = []
+    loads: list[int] = []
+
+    for i in order:
+        size = sizes[i]
+        placed = False
+        if size <= budget:
+            for b, load in enumerate(loads):
+                if load + size <= budget and len(bins[b]) < max_items:
+                    bins[b].append(i)
+                    loads[b] += size
+                    placed = True
+                    break
+        if not placed:
+            # Oversized items always land here, alone
+            bins.append([i])
+            loads.append(size if size <= budget else budget + 1)
+
+    for b in bins:
+        b.sort()
+    bins.sort(key=lambda b: b[0])
+    return [[items[i] for i in b] for b in bins]
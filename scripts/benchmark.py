@@ -0,0 +1,457 @@
+"""
+benchmark.py — Offline benchmarks for the quote matching and prompt
+building hot paths.
+
+A fixed-seed corpus of synthetic talks 5 to 60 minutes long is generated
+in memory, with quotes cut from known offsets:
+
+    exact       whole entries, re-cased and re-punctuated
+    paraphrase  the same, with PARAPHRASE_SWAP of the words swapped for
+                unseen ones and one word dropped
+    absent      only words that never occur in the corpus
+
+Each case times one operation at a time and reports throughput and
+p50/p95/p99 latency. claude_call_overhead times the Claude wrapper's own
+per-call cost against claude_api's in-process FakeBackend. Every matched span is checked against the offset the
+quote was cut from (exact: identical span; paraphrase: start and end
+within one entry of the quote's first and last entry; absent: no match),
+and prompt excerpts must fit their character budget.
+
+Results are compared with a stored baseline (benchmark_baseline.json next
+to this file). Per-operation times are divided by a fixed pure-Python
+calibration loop before comparing, so a baseline recorded on one machine
+stays roughly meaningful on another. The run exits 1 if any correctness
+check fails or any case is more than --tolerance slower than its baseline
+(a slow case is re-measured once before it counts).
+
+Usage:
+    python scripts/benchmark.py                   # run and compare with the baseline
+    python scripts/benchmark.py --save-baseline   # record a new baseline
+    python scripts/benchmark.py --quick           # smaller corpus (no baseline check)
+    python scripts/benchmark.py --case match_paraphrase --case index_build
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import random
+import sys
+import time
+from pathlib import Path
+
+import claude_api
+from text_utils import TranscriptIndex, correct_timestamps, normalize_text
+from transcript_windows import WindowQuery, iter_excerpt_lines
+from tedx_pipeline import (CLIP_PROMPT_CHAR_LIMIT, CLIP_VIDEO_MIN_CHARS,
+                           key_moments_block)
+
+BASELINE_PATH = Path(__file__).parent / "benchmark_baseline.json"
+
+SEED = 20240601
+DURATIONS_MIN = (5, 10, 20, 30, 45, 60)
+TALKS_PER_DURATION = 3       # --quick: 1
+QUOTES_PER_KIND = 10         # per talk and quote kind
+VOCAB_SIZE = 3000
+WORDS_PER_SECOND = 2.5       # ~150 words per minute
+PARAPHRASE_SWAP = 0.2        # share of quote words replaced by unseen words
+CATEGORY_TALKS = 8           # talks sharing one clip prompt's budget
+DEFAULT_REPEAT = 5
+DEFAULT_TOLERANCE = 0.25
+
+CASES = ("normalize_text", "index_build", "match_exact", "match_paraphrase",
+         "match_absent", "correct_timestamps_cold", "clip_excerpt",
+         "key_moments_block", "claude_call_overhead")
+
+FILLER = ("the", "and", "so", "you", "know", "we", "i", "it's", "that", "a",
+          "of", "to", "in", "is", "this", "what", "really")
+ACCENTED = ("café", "naïve", "résumé", "Zürich", "São", "déjà")
+SOUNDS = ("[Applause]", "(Laughter)", "[Music]")
+
+
+# ─── Synthetic corpus ─────────────────────────────────────────────────
+
+def _make_words(rng: random.Random, syllables: list[str], n: int) -> list[str]:
+    words = set()
+    while len(words) < n:
+        words.add("".join(rng.choice(syllables) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def _make_talk(rng: random.Random, vocab: list[str], cum_weights: list[float],
+               minutes: int) -> list[dict]:
+    """Transcript entries for a talk of about `minutes` minutes."""
+    entries = []
+    t = rng.uniform(0, 5)
+    end = minutes * 60
+    while t < end:
+        if rng.random() < 0.01:
+            entries.append({"text": rng.choice(SOUNDS), "start": round(t, 2),
+                            "duration": 2.0})
+            t += 2.0
+            continue
+        n = rng.randint(5, 12)
+        words = []
+        for _ in range(n):
+            r = rng.random()
+            if r < 0.3:
+                words.append(rng.choice(FILLER))
+            elif r < 0.31:
+                words.append(rng.choice(ACCENTED))
+            else:
+                words.append(rng.choices(vocab, cum_weights=cum_weights)[0])
+        if rng.random() < 0.3:
+            words[0] = words[0].capitalize()
+        if rng.random() < 0.4:
+            words[-1] += rng.choice((",", ".", "?", "!"))
+        duration = round(n / WORDS_PER_SECOND * rng.uniform(0.8, 1.2), 2)
+        entry = {"text": " ".join(words), "start": round(t, 2)}
+        if rng.random() < 0.98:  # the occasional entry has no duration
+            entry["duration"] = duration
+        entries.append(entry)
+        t += duration + rng.uniform(0, 0.3)
+    return entries
+
+
+def _quote_range(rng: random.Random, entries: list[dict]) -> tuple[int, int]:
+    """Entries i..j (inclusive) of 2-4 spoken entries."""
+    while True:
+        i = rng.randrange(len(entries) - 4)
+        j = i + rng.randint(1, 3)
+        if not any(e["text"] in SOUNDS for e in entries[i:j + 1]):
+            return i, j
+
+
+def _end(entry: dict) -> float:
+    return entry["start"] + entry.get("duration", 2.0)
+
+
+def _span(entries: list[dict], i: int, j: int) -> tuple[float, float]:
+    return entries[i]["start"], _end(entries[j])
+
+
+def _near_span(entries: list[dict], i: int, j: int) -> tuple[tuple, tuple]:
+    """Allowed (start, end) ranges: one entry either side of entries i..j."""
+    return ((entries[max(i - 1, 0)]["start"], entries[i + 1]["start"]),
+            (_end(entries[j - 1]), _end(entries[min(j + 1, len(entries) - 1)])))
+
+
+def _restyle(rng: random.Random, words: list[str]) -> str:
+    """Change case and punctuation the way a model quoting a talk might."""
+    out = []
+    for w in words:
+        w = w.strip(",.?!")
+        if rng.random() < 0.1:
+            w = w.upper() if rng.random() < 0.3 else w.capitalize()
+        if rng.random() < 0.1:
+            w += rng.choice((",", "—", "...", ";"))
+        out.append(w)
+    return " ".join(out)
+
+
+def build_corpus(quick: bool = False) -> list[dict]:
+    """
+    Talks as dicts with entries, themes, key_quotes and quotes: a list of
+    (kind, text, expected) where expected is the exact span, the allowed
+    (start, end) ranges for a paraphrase, or None.
+    """
+    rng = random.Random(SEED)
+    vocab = _make_words(rng, ["ka", "lo", "mi", "ne", "ru", "sa", "te", "vi",
+                              "do", "pe", "gu", "ba", "fo", "ri", "an", "el"],
+                        VOCAB_SIZE)
+    # Disjoint syllables, so these never occur in any transcript
+    unseen = _make_words(rng, ["zy", "qu", "xo", "wy", "jx", "hq"], 500)
+    weights = list(itertools.accumulate(  # Zipf-like, cumulative for choices()
+        1 / (rank + 1) for rank in range(len(vocab))))
+    talks_per_duration = 1 if quick else TALKS_PER_DURATION
+
+    talks = []
+    for minutes in DURATIONS_MIN:
+        for _ in range(talks_per_duration):
+            entries = _make_talk(rng, vocab, weights, minutes)
+            quotes = []
+            for _ in range(QUOTES_PER_KIND):
+                i, j = _quote_range(rng, entries)
+                words = " ".join(e["text"] for e in entries[i:j + 1]).split()
+                quotes.append(("exact", _restyle(rng, words), _span(entries, i, j)))
+
+                i, j = _quote_range(rng, entries)
+                words = " ".join(e["text"] for e in entries[i:j + 1]).split()
+                swapped = rng.sample(range(len(words)), round(len(words) * PARAPHRASE_SWAP))
+                for k in swapped:
+                    words[k] = rng.choice(unseen)
+                del words[rng.randrange(len(words))]
+                quotes.append(("paraphrase", _restyle(rng, words),
+                               _near_span(entries, i, j)))
+
+                absent = rng.choices(unseen, k=rng.randint(10, 25))
+                quotes.append(("absent", " ".join(absent), None))
+
+            talks.append({
+                "id": len(talks) + 1,
+                "title": f"Synthetic talk {len(talks) + 1} ({minutes} min)",
+                "minutes": minutes,
+                "entries": entries,
+                "themes": [" ".join(rng.choices(vocab, cum_weights=weights, k=2))
+                           for _ in range(4)],
+                "key_quotes": [q for kind, q, _ in quotes if kind == "exact"][:3],
+                "quotes": quotes,
+            })
+    return talks
+
+
+# ─── Measurement ──────────────────────────────────────────────────────
+
+def calibrate() -> float:
+    """Seconds for a fixed pure-Python workload (best of 10)."""
+    best = float("inf")
+    for _ in range(10):
+        t0 = time.perf_counter()
+        counts = {}
+        for i in range(50_000):
+            key = str(i % 1000)
+            counts[key] = counts.get(key, 0) + i
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def _ops(case: str, talks: list[dict], indexes: dict[int, TranscriptIndex]):
+    """
+    Yield (op, check) pairs for a case: op() is the timed call, and
+    check(result) returns an error message or None.
+    """
+    if case == "normalize_text":
+        for talk in talks:
+            for e in talk["entries"]:
+                yield (lambda text=e["text"]: normalize_text(text)), None
+    elif case == "index_build":
+        for talk in talks:
+            yield (lambda entries=talk["entries"]: TranscriptIndex(entries)), None
+    elif case in ("match_exact", "match_paraphrase", "match_absent",
+                  "correct_timestamps_cold"):
+        for talk in talks:
+            quotes = talk["quotes"]
+            if case == "correct_timestamps_cold":
+                # One of each matchable kind per talk; the index is rebuilt
+                # on every call, as for a caller passing plain entries
+                quotes = [q for q in quotes if q[0] == "exact"][:1] + \
+                         [q for q in quotes if q[0] == "paraphrase"][:1]
+                target = talk["entries"]
+            else:
+                kind = case.split("_", 1)[1]
+                quotes = [q for q in quotes if q[0] == kind]
+                target = indexes[talk["id"]]
+            for kind, text, expected in quotes:
+                yield ((lambda text=text, target=target: correct_timestamps(text, target)),
+                       (lambda got, kind=kind, text=text, expected=expected, talk=talk:
+                        _check_match(talk, kind, text, expected, got)))
+    elif case == "clip_excerpt":
+        budget = max(CLIP_VIDEO_MIN_CHARS, CLIP_PROMPT_CHAR_LIMIT // CATEGORY_TALKS)
+        for talk in talks:
+            normalized = [normalize_text(e.get("text", "")) for e in talk["entries"]]
+            yield ((lambda talk=talk, normalized=normalized: list(iter_excerpt_lines(
+                        f"VIDEO_ID: {talk['id']} | TITLE: {talk['title']}",
+                        talk["entries"], normalized,
+                        WindowQuery(talk["themes"], talk["key_quotes"]), budget))),
+                   (lambda lines, talk=talk: None
+                    if sum(len(line) + 1 for line in lines) <= budget
+                    else f"talk {talk['id']}: excerpt exceeds {budget} chars"))
+    elif case == "key_moments_block":
+        for talk in talks:
+            yield (lambda talk=talk: key_moments_block(
+                talk["id"], talk["title"], talk["entries"])), None
+    elif case == "claude_call_overhead":
+        # The wrapper's own cost per call (tracing, retries, JSON parsing)
+        # around an instant in-process backend: a fenced key moments reply
+        moments = [{"video_id": talk["id"], "quote_text": text, "context": "..."}
+                   for talk in talks for kind, text, _ in talk["quotes"][:15]
+                   if kind == "exact"]
+        reply = "```json\n" + json.dumps(moments, indent=2) + "\n```"
+        claude_api.configure(delay_seconds=0,
+                             backend=claude_api.FakeBackend(lambda prompt: reply))
+        for talk in talks:
+            prompt = key_moments_block(talk["id"], talk["title"], talk["entries"])
+            yield ((lambda prompt=prompt: claude_api.call_claude_json(prompt)),
+                   (lambda got: None if got == moments
+                    else "fake backend reply did not round-trip"))
+
+
+def _check_match(talk: dict, kind: str, text: str, expected, got) -> str | None:
+    where = f"talk {talk['id']} {kind} quote {text[:40]!r}"
+    if kind == "absent":
+        return None if got is None else f"{where}: unexpected match {got}"
+    if got is None:
+        return f"{where}: no match (expected {expected})"
+    if kind == "exact" and got != expected:
+        return f"{where}: matched {got}, expected {expected}"
+    if kind == "paraphrase" and not all(
+            lo <= t <= hi for t, (lo, hi) in zip(got, expected)):
+        return f"{where}: matched {got}, expected start/end in {expected}"
+    return None
+
+
+def run_case(case: str, talks: list[dict], indexes: dict, repeat: int) -> dict:
+    """
+    Time every operation of a case `repeat` times, keeping each operation's
+    fastest time (the least disturbed by other load on the machine).
+    """
+    ops = list(_ops(case, talks, indexes))
+    best = [float("inf")] * len(ops)
+    errors = []
+    for round_num in range(repeat):
+        for k, (op, check) in enumerate(ops):
+            t0 = time.perf_counter()
+            result = op()
+            best[k] = min(best[k], time.perf_counter() - t0)
+            if round_num == 0 and check is not None:
+                error = check(result)
+                if error:
+                    errors.append(error)
+    total = sum(best)
+    best.sort()
+    return {
+        "ops": len(best),
+        "total_s": total,
+        "ops_per_s": len(best) / total if total else float("inf"),
+        "mean_us": total / len(best) * 1e6,
+        "p50_us": _percentile(best, 50) * 1e6,
+        "p95_us": _percentile(best, 95) * 1e6,
+        "p99_us": _percentile(best, 99) * 1e6,
+        "errors": errors,
+    }
+
+
+# ─── Reporting ────────────────────────────────────────────────────────
+
+def compare(results: dict, calibration_s: float, baseline: dict,
+            tolerance: float) -> list[str]:
+    """Regression messages for cases slower than baseline by > tolerance."""
+    regressions = []
+    for case, r in results.items():
+        base = baseline["cases"].get(case)
+        if not base:
+            continue
+        ratio = ((r["mean_us"] / calibration_s) /
+                 (base["mean_us"] / baseline["calibration_s"]))
+        r["vs_baseline"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append(f"{case}: {ratio:.2f}x baseline time per op "
+                               f"(tolerance {1 + tolerance:.2f}x)")
+    return regressions
+
+
+def print_table(results: dict) -> None:
+    print(f"\n{'Case':<26} {'Ops':>6} {'Ops/s':>11} {'p50 us':>10} "
+          f"{'p95 us':>10} {'p99 us':>10} {'vs base':>8} {'Errors':>7}")
+    print("-" * 94)
+    for case, r in results.items():
+        vs = f"{r['vs_baseline']:.2f}x" if "vs_baseline" in r else "-"
+        print(f"{case:<26} {r['ops']:>6} {r['ops_per_s']:>11,.0f} "
+              f"{r['p50_us']:>10,.1f} {r['p95_us']:>10,.1f} {r['p99_us']:>10,.1f} "
+              f"{vs:>8} {len(r['errors']):>7}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark quote matching and prompt building")
+    parser.add_argument("--case", action="append", choices=CASES,
+                        help="Run only this case (repeatable; default: all)")
+    parser.add_argument("--quick", action="store_true",
+                        help="One talk per duration instead of "
+                             f"{TALKS_PER_DURATION}; skips the baseline check")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                        help="Rounds per case; each operation's fastest time "
+                             f"is kept (default: {DEFAULT_REPEAT})")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Allowed slowdown vs baseline before failing "
+                             f"(default: {DEFAULT_TOLERANCE:.0%})")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write this run's results as the new baseline")
+    parser.add_argument("--json", type=Path, help="Also write results to this file")
+    args = parser.parse_args()
+    if args.save_baseline and args.case:
+        parser.error("--save-baseline records all cases; drop --case")
+
+    t0 = time.perf_counter()
+    talks = build_corpus(quick=args.quick)
+    indexes = {talk["id"]: TranscriptIndex(talk["entries"]) for talk in talks}
+    n_entries = sum(len(t["entries"]) for t in talks)
+    n_quotes = sum(len(t["quotes"]) for t in talks)
+    print(f"Corpus: {len(talks)} talks ({DURATIONS_MIN[0]}-{DURATIONS_MIN[-1]} min), "
+          f"{n_entries:,} entries, {n_quotes} quotes "
+          f"(built in {time.perf_counter() - t0:.1f}s)")
+
+    # Calibrate between cases and keep the fastest, so a burst of load
+    # during one calibration doesn't skew every comparison
+    calibration_s = calibrate()
+    results = {}
+    for case in args.case or CASES:
+        results[case] = run_case(case, talks, indexes, args.repeat)
+        calibration_s = min(calibration_s, calibrate())
+
+    failed = False
+    errors = [e for r in results.values() for e in r["errors"]]
+
+    baseline = None
+    if args.baseline.exists() and not args.save_baseline:
+        baseline = json.loads(args.baseline.read_text())
+    regressions = []
+    if baseline and baseline.get("quick") == args.quick:
+        regressions = compare(results, calibration_s, baseline, args.tolerance)
+        if regressions:
+            # Re-measure slow cases once before failing on a noisy machine
+            for case, r in results.items():
+                if r.get("vs_baseline", 0) > 1 + args.tolerance:
+                    retry = run_case(case, talks, indexes, args.repeat)
+                    if retry["mean_us"] < r["mean_us"]:
+                        results[case] = {**retry, "errors": r["errors"]}
+            calibration_s = min(calibration_s, calibrate())
+            regressions = compare(results, calibration_s, baseline, args.tolerance)
+    elif baseline:
+        print("Baseline was recorded with a different corpus size; skipping speed check")
+    elif not args.save_baseline:
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one")
+
+    print_table(results)
+    print(f"\nCalibration loop: {calibration_s * 1000:.1f} ms")
+
+    for error in errors[:20]:
+        print(f"  WRONG: {error}")
+    if errors:
+        print(f"{len(errors)} correctness check(s) failed")
+        failed = True
+    for regression in regressions:
+        print(f"  REGRESSION: {regression}")
+    if regressions:
+        failed = True
+
+    record = {
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": args.quick,
+        "calibration_s": calibration_s,
+        "cases": {case: {k: v for k, v in r.items() if k != "errors"}
+                  for case, r in results.items()},
+    }
+    if args.json:
+        args.json.write_text(json.dumps(record, indent=2) + "\n")
+    if args.save_baseline:
+        if failed:
+            print("Not saving a baseline from a run with failed checks")
+        else:
+            args.baseline.write_text(json.dumps(record, indent=2) + "\n")
+            print(f"Baseline saved to {args.baseline}")
+
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
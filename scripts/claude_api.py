@@ -1,14 +1,53 @@
 """
 Claude CLI wrapper with rate limiting, retry, and JSON response parsing.
 
-Calls Claude via subprocess:
-    subprocess.run(['claude', '--print', '--output-format', 'json'], ...)
+How a prompt reaches Claude is up to a backend (CLAUDE_BACKEND or
+configure(backend=...)):
+
+    pool        long-lived `claude --print` sessions taking one prompt
+                after another as stream-json input, so the CLI starts once
+                per session rather than once per call (default)
+    subprocess  one `claude --print ...` run per call, started on demand
+    http        the Messages API over a keep-alive HTTP session
+                (ANTHROPIC_API_KEY, model from CLAUDE_MODEL)
+    fake        in-process canned responses, for tests and for measuring
+                the wrapper's own per-call overhead
+
+Calls may be issued from several worker threads at once (see
+map_claude_json), and from several pipeline stages running side by side
+(run-all); a single token bucket shared by all of them keeps the overall
+call rate within CALL_DELAY_SECONDS, and a shared pool of
+CALL_CONCURRENCY call slots bounds how many are in flight.
+
+Responses are cached on disk (see response_cache.py), so re-running a
+phase or retrying a failed batch does not pay for prompts Claude has
+already answered.
+
+Batch prompts that answer with a JSON array can be streamed
+(stream_claude_json, map_claude_items): each array item is handed over
+as soon as it has arrived, and a truncated answer still yields every
+complete item before the cut. The CLI backends stream with
+`--output-format stream-json` (CLAUDE_STREAM=0 turns this off).
 """
 
+import atexit
 import subprocess
 import json
+import os
+import queue
+import threading
 import time
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+from json_stream import ArrayStream, parse_json_text
+from response_cache import ResponseCache, cache_key
 
 logger = logging.getLogger(__name__)
 
@@ -16,105 +55,807 @@ logger = logging.getLogger(__name__)
 CALL_DELAY_SECONDS = 3.0
 CALL_TIMEOUT_SECONDS = 120
 MAX_RETRIES = 3
+CALL_CONCURRENCY = 3  # max Claude subprocesses in flight at once
+CLAUDE_CMD = ['claude', '--print', '--output-format', 'json']
+CLAUDE_STREAM_CMD = ['claude', '--print', '--output-format', 'stream-json',
+                     '--verbose', '--include-partial-messages']
+CLAUDE_SESSION_CMD = ['claude', '--print', '--input-format', 'stream-json',
+                      '--output-format', 'stream-json', '--verbose',
+                      '--include-partial-messages']
+SESSION_MAX_CALLS = 8  # prompts one pooled CLI session answers before it's replaced
+STREAM_RESPONSES = os.environ.get("CLAUDE_STREAM", "1") != "0"
+BACKENDS = ("pool", "subprocess", "http", "fake")
+DEFAULT_BACKEND = os.environ.get("CLAUDE_BACKEND", "pool")
 
-_last_call_time = 0.0
+# HTTP backend
+API_URL = "https://api.anthropic.com/v1/messages"
+API_VERSION = "2023-06-01"
+API_MAX_TOKENS = 8192
 
 
-def call_claude(prompt: str, timeout: int | None = None) -> str:
+class BackendError(RuntimeError):
+    """A call that failed in a way worth retrying."""
+
+
+class BackendTimeout(BackendError):
+    """A call that ran past its timeout."""
+
+
+def _extract_text(stdout: str) -> str:
+    """Response text from `claude --print --output-format json` output."""
+    stdout = stdout.strip()
+
+    # Try parsing as JSON first (--output-format json)
+    try:
+        response = json.loads(stdout)
+    except json.JSONDecodeError:
+        # Not JSON — CLI returned plain text (newer versions with --print)
+        if stdout:
+            return stdout
+        raise RuntimeError("Claude returned empty output")
+
+    # Handle structured JSON response formats
+    # Format 1: {"content": [{"type": "text", "text": "..."}]}
+    if isinstance(response, dict) and 'content' in response:
+        content_blocks = response.get('content', [])
+        for block in content_blocks:
+            if isinstance(block, dict) and block.get('type') == 'text':
+                text = block.get('text', '').strip()
+                if text:
+                    return text
+
+    # Format 2: {"result": "..."} or {"text": "..."} or {"response": "..."}
+    if isinstance(response, dict):
+        for key in ('result', 'text', 'response', 'output', 'message'):
+            val = response.get(key)
+            if isinstance(val, str) and val.strip():
+                return val.strip()
+
+    # Format 3: response is just a string
+    if isinstance(response, str) and response.strip():
+        return response.strip()
+
+    # Log the actual structure for debugging
+    logger.error(f"Unexpected Claude CLI response structure: "
+                 f"{json.dumps(response, indent=2)[:500]}")
+    raise RuntimeError("Claude returned empty text content")
+
+
+def _cli_result(returncode: int, stdout: str, stderr: str) -> str:
+    if returncode != 0:
+        raise BackendError(f"Claude CLI returned code {returncode}: {stderr[:500]}")
+    return _extract_text(stdout)
+
+
+class StreamingUnsupported(BackendError):
+    """The installed CLI rejected the streaming options."""
+
+
+def _event_text(event: dict) -> str | None:
+    """The text delta carried by a stream-json partial-message event, if any."""
+    if event.get("type") != "stream_event":
+        return None
+    inner = event.get("event") or {}
+    delta = inner.get("delta") or {}
+    if inner.get("type") == "content_block_delta" and delta.get("type") == "text_delta":
+        return delta.get("text") or None
+    return None
+
+
+def _stream_cli(proc: subprocess.Popen, prompt: str, timeout: float):
     """
-    Call Claude CLI and return the text response.
-    Applies rate limiting and retries with exponential backoff.
+    Send a prompt to a stream-json CLI process and yield the response text
+    as it is generated: the partial-message text deltas, or the final
+    result in one piece if the CLI sent none.
     """
-    global _last_call_time
-    timeout = timeout or CALL_TIMEOUT_SECONDS
+    stderr_lines = []
+    drain = threading.Thread(target=lambda: stderr_lines.extend(proc.stderr),
+                             daemon=True)
+    drain.start()
+    expired = threading.Event()
 
-    for attempt in range(1, MAX_RETRIES + 1):
-        # Rate limiting
-        elapsed = time.time() - _last_call_time
-        if elapsed < CALL_DELAY_SECONDS:
-            time.sleep(CALL_DELAY_SECONDS - elapsed)
+    def expire():
+        expired.set()
+        proc.kill()
 
-        cmd = ['claude', '--print', '--output-format', 'json']
-        logger.debug(f"Claude CLI call attempt {attempt}/{MAX_RETRIES} "
-                     f"(prompt: {len(prompt)} chars)")
+    timer = threading.Timer(timeout, expire)
+    timer.start()
+    streamed = False
+    result = None
+    try:
+        try:
+            proc.stdin.write(prompt)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # exited early; reported below from its stderr
+        for line in proc.stdout:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(event, dict):
+                continue
+            text = _event_text(event)
+            if text:
+                streamed = True
+                yield text
+            elif event.get("type") == "result":
+                result = event
+        proc.wait()
+    finally:
+        timer.cancel()
+        if proc.poll() is None:  # abandoned mid-stream
+            proc.kill()
+            proc.wait()
+    drain.join(timeout=5)
+    stderr = "".join(stderr_lines)
+
+    if expired.is_set():
+        raise BackendTimeout(f"Claude CLI timed out after {timeout}s")
+    if result is None:
+        if not streamed and "unknown option" in stderr.lower():
+            raise StreamingUnsupported(stderr.strip()[:200])
+        if proc.returncode != 0:
+            raise BackendError(f"Claude CLI returned code {proc.returncode}: {stderr[:500]}")
+        raise BackendError("Claude CLI stream ended without a result")
+    if result.get("is_error"):
+        raise BackendError(f"Claude CLI error: {str(result.get('result'))[:500]}")
+    if not streamed:
+        text = str(result.get("result") or "").strip()
+        if not text:
+            raise RuntimeError("Claude returned empty output")
+        yield text
+
+
+class Backend:
+    """
+    Sends one prompt to Claude. complete() returns the response text and
+    stream() yields it in pieces as it is generated; both raise
+    BackendError for failures worth retrying. Rate limiting, retries and
+    the response cache are handled above the backend.
+    """
+
+    name = "base"
+    cacheable = True  # whether responses go through the response cache
+
+    @property
+    def cache_options(self) -> list[str]:
+        """Options that shape the response, mixed into the cache key."""
+        return [self.name]
+
+    def complete(self, prompt: str, timeout: float) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, timeout: float):
+        """Response text in pieces; by default all at once."""
+        yield self.complete(prompt, timeout)
+
+    def close(self) -> None:
+        pass
+
+
+class SubprocessBackend(Backend):
+    """
+    One CLI process per call, started when the call is made. Responses
+    stream via `--output-format stream-json` (CLAUDE_STREAM_CMD) unless
+    CLAUDE_STREAM=0 or the installed CLI doesn't know the options, in
+    which case the plain JSON output is read at the end.
+    """
+
+    name = "subprocess"
 
+    def __init__(self, cmd: list[str] | None = None,
+                 stream_cmd: list[str] | None = None):
+        self.cmd = list(cmd or CLAUDE_CMD)
+        self.stream_cmd = (list(stream_cmd or CLAUDE_STREAM_CMD)
+                           if STREAM_RESPONSES else None)
+
+    @property
+    def cache_options(self) -> list[str]:
+        # Streamed and plain output carry the same answer
+        return self.cmd
+
+    def _spawn(self, cmd: list[str]) -> subprocess.Popen:
+        return subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+
+    def _disable_streaming(self, error: Exception) -> None:
+        if self.stream_cmd is not None:
+            logger.warning(f"Claude CLI can't stream responses ({error}); "
+                           f"reading whole responses instead")
+            self.stream_cmd = None
+
+    def _run(self, prompt: str, timeout: float) -> str:
+        """One plain (non-streaming) CLI run."""
         try:
-            _last_call_time = time.time()
             result = subprocess.run(
-                cmd,
+                self.cmd,
                 input=prompt,
                 capture_output=True,
                 text=True,
                 timeout=timeout,
                 encoding="utf-8",
             )
+        except subprocess.TimeoutExpired:
+            raise BackendTimeout(f"Claude CLI timed out after {timeout}s")
+        return _cli_result(result.returncode, result.stdout, result.stderr)
 
-            if result.returncode != 0:
-                logger.warning(f"Claude CLI returned code {result.returncode}: "
-                               f"{result.stderr[:200]}")
-                if attempt < MAX_RETRIES:
-                    time.sleep(2 ** attempt)
-                    continue
-                raise RuntimeError(
-                    f"Claude CLI failed after {MAX_RETRIES} attempts: "
-                    f"{result.stderr[:500]}"
-                )
+    def _stream_with_fallback(self, proc: subprocess.Popen, prompt: str,
+                              timeout: float):
+        try:
+            yield from _stream_cli(proc, prompt, timeout)
+        except StreamingUnsupported as e:
+            self._disable_streaming(e)
+            yield self._run(prompt, timeout)
+
+    def stream(self, prompt: str, timeout: float):
+        if self.stream_cmd is None:
+            yield self._run(prompt, timeout)
+        else:
+            yield from self._stream_with_fallback(
+                self._spawn(self.stream_cmd), prompt, timeout)
+
+    def complete(self, prompt: str, timeout: float) -> str:
+        return "".join(self.stream(prompt, timeout)).strip()
+
+
+class _CLISession:
+    """
+    One long-lived CLI process in stream-json input mode (CLAUDE_SESSION_CMD),
+    answering one prompt at a time. Its stderr is drained in the background
+    so a chatty CLI can't block on a full pipe.
+    """
 
-            stdout = result.stdout.strip()
+    def __init__(self, cmd: list[str]):
+        self.proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+        )
+        self.calls = 0
+        self.stderr_lines = deque(maxlen=50)
+        threading.Thread(target=self.stderr_lines.extend, args=(self.proc.stderr,),
+                         daemon=True).start()
 
-            # Try parsing as JSON first (--output-format json)
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def ask(self, prompt: str, timeout: float):
+        """
+        Send one prompt and yield the response text as it is generated.
+        Returns once the turn's result event has arrived, leaving the
+        process ready for the next prompt.
+        """
+        self.calls += 1
+        message = json.dumps({"type": "user",
+                              "message": {"role": "user", "content": prompt}})
+        expired = threading.Event()
+
+        def expire():
+            expired.set()
+            self.proc.kill()
+
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+        streamed = False
+        result = None
+        try:
             try:
-                response = json.loads(stdout)
-            except json.JSONDecodeError:
-                # Not JSON — CLI returned plain text (newer versions with --print)
-                if stdout:
-                    return stdout
+                self.proc.stdin.write(message + "\n")
+                self.proc.stdin.flush()
+            except OSError:
+                pass  # exited; reported below from its stderr
+            for line in self.proc.stdout:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if not isinstance(event, dict):
+                    continue
+                text = _event_text(event)
+                if text:
+                    streamed = True
+                    yield text
+                elif event.get("type") == "result":
+                    result = event
+                    break
+        finally:
+            timer.cancel()
+
+        if expired.is_set():
+            raise BackendTimeout(f"Claude CLI timed out after {timeout}s")
+        if result is None:
+            try:
+                self.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+            stderr = "".join(self.stderr_lines)
+            if not streamed and "unknown option" in stderr.lower():
+                raise StreamingUnsupported(stderr.strip()[:200])
+            raise BackendError(f"Claude CLI session exited mid-call "
+                               f"(code {self.proc.returncode}): {stderr[-500:]}")
+        if result.get("is_error"):
+            raise BackendError(f"Claude CLI error: {str(result.get('result'))[:500]}")
+        if not streamed:
+            text = str(result.get("result") or "").strip()
+            if not text:
                 raise RuntimeError("Claude returned empty output")
+            yield text
+
+    def close(self) -> None:
+        """End the session: close its stdin, then kill it if it lingers."""
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.proc.wait(timeout=2)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+
+
+class CLIPoolBackend(SubprocessBackend):
+    """
+    Keeps up to `size` CLI sessions alive between calls, so the CLI's
+    startup (Node, config and credential loading) is paid once per session
+    rather than once per call. Each session is one `claude --print` process
+    reading prompts as stream-json messages on stdin and answering each
+    with a result event; a call takes an idle session, or starts one, and
+    hands it back once the answer is complete.
+
+    A session is one conversation, so earlier prompts stay in its context.
+    The pipeline's prompts are self-contained, so that only adds input
+    tokens; a session is retired after `max_calls` prompts to bound it,
+    and its replacement is started right away so it boots while idle.
+    Sessions found dead when taken are replaced, and one that fails,
+    times out or is abandoned mid-answer is ended rather than reused.
+    If the installed CLI can't take stream-json input, calls fall back to
+    one process per call, as SubprocessBackend does.
+    """
+
+    name = "pool"
+
+    def __init__(self, size: int, cmd: list[str] | None = None,
+                 stream_cmd: list[str] | None = None,
+                 session_cmd: list[str] | None = None,
+                 max_calls: int = SESSION_MAX_CALLS):
+        super().__init__(cmd, stream_cmd)
+        self.session_cmd = [arg for arg in session_cmd or CLAUDE_SESSION_CMD
+                            if STREAM_RESPONSES or arg != "--include-partial-messages"]
+        self.size = max(1, size)
+        self.max_calls = max(1, max_calls)
+        self.started = 0  # sessions started so far
+        self._idle: list[_CLISession] = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _take(self) -> _CLISession | None:
+        """A live idle session, or a new one (None once closed or unsupported)."""
+        with self._lock:
+            if self._closed or self.session_cmd is None:
+                return None
+            while self._idle:
+                session = self._idle.pop()
+                if session.alive():
+                    return session
+                logger.warning(f"A pooled Claude CLI session exited while idle "
+                               f"(code {session.proc.returncode}); starting another")
+                session.close()
+            cmd = self.session_cmd
+            self.started += 1
+        try:
+            return _CLISession(cmd)
+        except OSError as e:
+            logger.warning(f"Could not start a Claude CLI session: {e}")
+            return None
+
+    def _give_back(self, session: _CLISession) -> None:
+        with self._lock:
+            keep = not self._closed and len(self._idle) < self.size
+            if keep and session.alive() and session.calls < self.max_calls:
+                self._idle.append(session)
+                return
+            # A retired session's replacement boots while it waits for a call
+            cmd = self.session_cmd
+            replace = keep and session.alive() and cmd is not None
+            if replace:
+                self.started += 1
+        session.close()
+        if replace:
+            try:
+                replacement = _CLISession(cmd)
+            except OSError as e:
+                logger.warning(f"Could not start a Claude CLI session: {e}")
+                return
+            with self._lock:
+                if self._closed:
+                    replacement.close()
+                else:
+                    self._idle.append(replacement)
+
+    def _disable_sessions(self, error: Exception) -> None:
+        logger.warning(f"Claude CLI can't keep a session ({error}); "
+                       "starting one process per call instead")
+        with self._lock:
+            self.session_cmd = None
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+    def stream(self, prompt: str, timeout: float):
+        session = self._take()
+        if session is None:
+            yield from super().stream(prompt, timeout)
+            return
+        answered = False
+        try:
+            yield from session.ask(prompt, timeout)
+            answered = True
+        except StreamingUnsupported as e:
+            self._disable_sessions(e)
+            yield from super().stream(prompt, timeout)
+        finally:
+            if answered:
+                self._give_back(session)
+            else:
+                session.close()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+
+class HTTPBackend(Backend):
+    """
+    The Messages API over one requests.Session, keeping up to `pool_size`
+    connections alive between calls. stream() reads the server-sent
+    events of a streaming request.
+    """
+
+    name = "http"
+
+    def __init__(self, model: str, api_key: str, pool_size: int,
+                 max_tokens: int = API_MAX_TOKENS, url: str = API_URL):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.url = url
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1,
+                                                   pool_maxsize=pool_size))
+        self.session.headers.update({
+            "x-api-key": api_key,
+            "anthropic-version": API_VERSION,
+            "content-type": "application/json",
+        })
+
+    @property
+    def cache_options(self) -> list[str]:
+        return [self.name, self.model, str(self.max_tokens)]
+
+    def _post(self, prompt: str, timeout: float, stream: bool):
+        try:
+            response = self.session.post(self.url, timeout=timeout, stream=stream, json={
+                "model": self.model,
+                "max_tokens": self.max_tokens,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": stream,
+            })
+        except requests.Timeout:
+            raise BackendTimeout(f"Claude API timed out after {timeout}s")
+        except requests.RequestException as e:
+            raise BackendError(f"Claude API request failed: {e}")
+        if response.status_code != 200:
+            raise BackendError(f"Claude API returned {response.status_code}: "
+                               f"{response.text[:500]}")
+        return response
 
-            # Handle structured JSON response formats
-            # Format 1: {"content": [{"type": "text", "text": "..."}]}
-            if isinstance(response, dict) and 'content' in response:
-                content_blocks = response.get('content', [])
-                for block in content_blocks:
-                    if isinstance(block, dict) and block.get('type') == 'text':
-                        text = block.get('text', '').strip()
-                        if text:
-                            return text
-
-            # Format 2: {"result": "..."} or {"text": "..."} or {"response": "..."}
-            if isinstance(response, dict):
-                for key in ('result', 'text', 'response', 'output', 'message'):
-                    val = response.get(key)
-                    if isinstance(val, str) and val.strip():
-                        return val.strip()
-
-            # Format 3: response is just a string
-            if isinstance(response, str) and response.strip():
-                return response.strip()
-
-            # Log the actual structure for debugging
-            logger.error(f"Unexpected Claude CLI response structure: "
-                         f"{json.dumps(response, indent=2)[:500]}")
+    def complete(self, prompt: str, timeout: float) -> str:
+        response = self._post(prompt, timeout, stream=False)
+        text = "".join(block.get("text", "")
+                       for block in response.json().get("content", [])
+                       if block.get("type") == "text").strip()
+        if not text:
             raise RuntimeError("Claude returned empty text content")
+        return text
 
-        except subprocess.TimeoutExpired:
-            logger.warning(f"Claude CLI timed out after {timeout}s "
-                           f"(attempt {attempt})")
-            if attempt < MAX_RETRIES:
-                time.sleep(2 ** attempt)
-                continue
-            raise RuntimeError(
-                f"Claude CLI timed out after {MAX_RETRIES} attempts"
-            )
+    def stream(self, prompt: str, timeout: float):
+        response = self._post(prompt, timeout, stream=True)
+        response.encoding = "utf-8"
+        with response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[5:])
+                    if event.get("type") == "content_block_delta":
+                        delta = event.get("delta", {})
+                        if delta.get("type") == "text_delta":
+                            yield delta.get("text", "")
+                    elif event.get("type") == "error":
+                        raise BackendError(f"Claude API stream error: {event.get('error')}")
+            except requests.Timeout:
+                raise BackendTimeout(f"Claude API timed out after {timeout}s")
+            except requests.RequestException as e:
+                raise BackendError(f"Claude API stream failed: {e}")
 
-        except json.JSONDecodeError as e:
-            logger.warning(f"Failed to parse Claude CLI JSON: {e}")
-            if attempt < MAX_RETRIES:
-                time.sleep(2 ** attempt)
-                continue
+    def close(self) -> None:
+        self.session.close()
+
+
+class FakeBackend(Backend):
+    """
+    Answers in-process with responder(prompt) (default: an empty JSON
+    array) after `latency` seconds, and records the prompts it was sent.
+    stream() hands the answer over `chunk_chars` at a time. Responses
+    bypass the response cache.
+    """
+
+    name = "fake"
+    cacheable = False
+
+    def __init__(self, responder=None, latency: float = 0.0, chunk_chars: int = 256):
+        self.responder = responder or (lambda prompt: "[]")
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.prompts: list[str] = []
+        self._lock = threading.Lock()
+
+    def complete(self, prompt: str, timeout: float) -> str:
+        with self._lock:
+            self.prompts.append(prompt)
+        if self.latency:
+            time.sleep(self.latency)
+        return self.responder(prompt)
+
+    def stream(self, prompt: str, timeout: float):
+        text = self.complete(prompt, timeout)
+        for start in range(0, len(text), self.chunk_chars):
+            yield text[start:start + self.chunk_chars]
+
+
+def make_backend(name: str, concurrency: int | None = None) -> Backend:
+    """Build a backend by name (see BACKENDS)."""
+    concurrency = concurrency or CALL_CONCURRENCY
+    if name == "pool":
+        return CLIPoolBackend(size=concurrency)
+    if name == "subprocess":
+        return SubprocessBackend()
+    if name == "http":
+        api_key = os.environ.get("ANTHROPIC_API_KEY")
+        model = os.environ.get("CLAUDE_MODEL")
+        if not api_key or not model:
+            raise RuntimeError("The http backend needs ANTHROPIC_API_KEY and "
+                               "CLAUDE_MODEL set")
+        return HTTPBackend(model=model, api_key=api_key, pool_size=concurrency)
+    if name == "fake":
+        return FakeBackend()
+    raise ValueError(f"Unknown Claude backend: {name!r}")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket. Tokens refill at `rate` per second up to
+    `capacity`; acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping as needed. Returns seconds slept."""
+        slept = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return slept
+                wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+            slept += wait
+
+
+_rate_limiter = TokenBucket(rate=1.0 / CALL_DELAY_SECONDS, capacity=1.0)
+# Calls in flight across every thread and stage of the process
+_call_slots = threading.BoundedSemaphore(CALL_CONCURRENCY)
+_cache = ResponseCache()
+_backend: Backend | None = None  # built on first call, see get_backend()
+_backend_name = DEFAULT_BACKEND
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> Backend:
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend(_backend_name)
+        return _backend
+
+
+@atexit.register
+def close_backend() -> None:
+    """Release the backend's processes or connections."""
+    global _backend
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+            _backend = None
+
+
+def configure(concurrency: int | None = None,
+              delay_seconds: float | None = None,
+              burst: float | None = None,
+              cache_mode: str | None = None,
+              cache_path: str | None = None,
+              backend: "str | Backend | None" = None) -> None:
+    """
+    Adjust concurrency, the shared rate limit, the response cache and the
+    backend (a name from BACKENDS or a Backend instance).
+    """
+    global CALL_CONCURRENCY, CALL_DELAY_SECONDS, _rate_limiter, _cache
+    global _backend, _backend_name, _call_slots
+    if concurrency is not None:
+        CALL_CONCURRENCY = max(1, concurrency)
+        _call_slots = threading.BoundedSemaphore(CALL_CONCURRENCY)
+    if backend is not None:
+        close_backend()
+        if isinstance(backend, Backend):
+            _backend = backend
+        else:
+            if backend not in BACKENDS:
+                raise ValueError(f"Unknown Claude backend: {backend!r}")
+            _backend_name = backend
+    if delay_seconds is not None or burst is not None:
+        if delay_seconds is not None:
+            CALL_DELAY_SECONDS = delay_seconds
+        rate = 1.0 / CALL_DELAY_SECONDS if CALL_DELAY_SECONDS > 0 else float("inf")
+        _rate_limiter = TokenBucket(rate=rate, capacity=burst or _rate_limiter.capacity)
+    if cache_mode is not None or cache_path is not None:
+        _cache.close()
+        _cache = ResponseCache(path=cache_path or _cache.path,
+                               ttl_seconds=_cache.ttl_seconds,
+                               max_bytes=_cache.max_bytes,
+                               mode=cache_mode or _cache.mode)
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for the current process."""
+    return {"hits": _cache.hits, "misses": _cache.misses}
+
+
+def call_claude(prompt: str, timeout: int | None = None) -> str:
+    """
+    Call Claude CLI and return the text response.
+    Serves from the response cache when possible; otherwise applies rate
+    limiting and retries with exponential backoff.
+    Safe to call from multiple threads.
+    """
+    with tracing.span("claude_call", prompt_chars=len(prompt)):
+        return _cached_call(prompt, timeout)
+
+
+def _cached_call(prompt: str, timeout: int | None) -> str:
+    backend = get_backend()
+    tracing.set_attrs(backend=backend.name)
+    if not backend.cacheable:
+        text = _call_backend(backend, prompt, timeout)
+        tracing.set_attrs(response_chars=len(text))
+        return text
+
+    key = cache_key(prompt, backend.cache_options)
+    cached = _cache.get(key)
+    if cached is not None:
+        logger.debug(f"Claude response cache hit ({key[:12]})")
+        tracing.set_attrs(cache="hit", response_chars=len(cached))
+        return cached
+
+    text = _call_backend(backend, prompt, timeout)
+    _cache.put(key, text)
+    tracing.set_attrs(cache="miss", response_chars=len(text))
+    return text
+
+
+def _backoff(attempt: int) -> None:
+    """Sleep before retrying a failed call (exponential backoff)."""
+    delay = 2 ** attempt
+    tracing.add("retries", 1)
+    tracing.add("sleep_s", delay)
+    time.sleep(delay)
+
+
+def _retry_or_raise(error: BackendError, attempt: int) -> None:
+    """Back off before the next attempt, or give up after the last one."""
+    if isinstance(error, BackendTimeout):
+        logger.warning(f"{error} (attempt {attempt})")
+        if attempt >= MAX_RETRIES:
             raise RuntimeError(
-                f"Claude CLI returned invalid JSON after {MAX_RETRIES} attempts"
-            )
+                f"Claude call timed out after {MAX_RETRIES} attempts"
+            ) from error
+    else:
+        logger.warning(str(error)[:200])
+        if attempt >= MAX_RETRIES:
+            raise RuntimeError(
+                f"Claude call failed after {MAX_RETRIES} attempts: {error}"
+            ) from error
+    _backoff(attempt)
+
+
+@contextmanager
+def _call_slot():
+    """Hold one of the shared call slots, then wait for the rate limiter."""
+    slots = _call_slots
+    t0 = time.monotonic()
+    with slots:
+        tracing.add("slot_wait_s", time.monotonic() - t0)
+        # Rate limiting (shared across worker threads)
+        tracing.add("sleep_s", _rate_limiter.acquire())
+        yield
+
+
+def _call_backend(backend: Backend, prompt: str, timeout: int | None = None) -> str:
+    """Call the backend (uncached) with rate limiting and retries."""
+    timeout = timeout or CALL_TIMEOUT_SECONDS
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        tracing.add("attempts", 1)
+        logger.debug(f"Claude {backend.name} call attempt {attempt}/{MAX_RETRIES} "
+                     f"(prompt: {len(prompt)} chars)")
+        # The slot is given back before backing off
+        with _call_slot():
+            try:
+                return backend.complete(prompt, timeout)
+            except BackendError as e:
+                error = e
+        _retry_or_raise(error, attempt)
+
+    raise RuntimeError("All retries exhausted")
+
+
+def _stream_backend(backend: Backend, prompt: str, timeout: int | None = None):
+    """
+    Stream the backend's response (uncached) with rate limiting and
+    retries. Once a piece has been handed on, a failure is raised rather
+    than retried, since the caller may already have acted on it.
+    """
+    timeout = timeout or CALL_TIMEOUT_SECONDS
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        tracing.add("attempts", 1)
+        logger.debug(f"Claude {backend.name} streaming call attempt "
+                     f"{attempt}/{MAX_RETRIES} (prompt: {len(prompt)} chars)")
+        started = False
+        with _call_slot():
+            try:
+                for chunk in backend.stream(prompt, timeout):
+                    started = True
+                    yield chunk
+                return
+            except BackendError as e:
+                if started:
+                    raise
+                error = e
+        _retry_or_raise(error, attempt)
 
     raise RuntimeError("All retries exhausted")
 
@@ -122,38 +863,162 @@ def call_claude(prompt: str, timeout: int | None = None) -> str:
 def call_claude_json(prompt: str, timeout: int | None = None) -> dict | list:
     """
     Call Claude CLI and parse the response as JSON.
-    Handles markdown code fence wrapping and extra text after the JSON.
+    Handles markdown code fence wrapping and extra text around the JSON.
     """
-    text = call_claude(prompt, timeout)
+    with tracing.span("claude_call", prompt_chars=len(prompt)):
+        text = _cached_call(prompt, timeout)
+        with tracing.timer("parse_ms"):
+            return _parse_json_response(prompt, text)
 
-    # Strip markdown code fences if present
-    if text.startswith("```"):
-        lines = text.split("\n")
-        lines = [l for l in lines if not l.strip().startswith("```")]
-        text = "\n".join(lines)
 
-    # Try parsing directly first
+def _parse_json_response(prompt: str, text: str) -> dict | list:
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
+        return parse_json_text(text)
+    except ValueError:
         pass
 
-    # Fallback: extract the first JSON array or object from the text.
-    # Claude sometimes adds commentary before or after the JSON.
-    for start_char, end_char in [("[", "]"), ("{", "}")]:
-        start = text.find(start_char)
-        if start == -1:
-            continue
-        # Walk from the end to find the matching closing bracket
-        end = text.rfind(end_char)
-        if end == -1 or end <= start:
-            continue
-        candidate = text[start:end + 1]
-        try:
-            return json.loads(candidate)
-        except json.JSONDecodeError:
-            pass
-
+    # Don't let an unparseable response stick in the cache
+    forget_response(prompt)
     raise RuntimeError(
         f"Claude did not return valid JSON.\nResponse: {text[:500]}"
     )
+
+
+def forget_response(prompt: str) -> None:
+    """Drop the cached answer to `prompt` (e.g. one that turned out unusable)."""
+    backend = get_backend()
+    if backend.cacheable:
+        _cache.invalidate(cache_key(prompt, backend.cache_options))
+
+
+class IncompleteResponse(RuntimeError):
+    """
+    A JSON array answer that was cut short or had malformed items; every
+    complete item before the problem has already been yielded.
+    """
+
+
+def stream_claude_json(prompt: str, timeout: int | None = None,
+                       refresh: bool = False):
+    """
+    Call Claude for a JSON array and yield each item as soon as it has
+    fully arrived (see json_stream.py); cached answers replay the same
+    way, unless `refresh` asks Claude again (the new answer replaces the
+    cached one). After the last salvageable item, raises
+    IncompleteResponse if the answer was truncated or had malformed
+    items. Such answers are not cached.
+    """
+    with tracing.span("claude_call", prompt_chars=len(prompt)):
+        backend = get_backend()
+        tracing.set_attrs(backend=backend.name)
+        key = cache_key(prompt, backend.cache_options) if backend.cacheable else None
+        cached = _cache.get(key, refresh=refresh) if key else None
+        if cached is not None:
+            logger.debug(f"Claude response cache hit ({key[:12]})")
+            tracing.set_attrs(cache="hit")
+            chunks = [cached]
+        else:
+            if key:
+                tracing.set_attrs(cache="miss")
+            chunks = _stream_backend(backend, prompt, timeout)
+
+        parser = ArrayStream()
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            with tracing.timer("parse_ms"):
+                items = parser.feed(chunk)
+            yield from items
+
+        text = "".join(parts).strip()
+        tracing.set_attrs(response_chars=len(text), items=parser.items_seen)
+        if parser.complete and not parser.errors:
+            if key and cached is None:
+                _cache.put(key, text)
+            return
+        if cached is not None:
+            _cache.invalidate(key)
+        problem = (parser.errors[0] if parser.errors
+                   else "the JSON array never closed")
+        raise IncompleteResponse(f"Claude returned incomplete JSON after "
+                                 f"{parser.items_seen} items: {problem}")
+
+
+def map_claude_items(jobs, timeout: int | None = None,
+                     concurrency: int | None = None, refresh: bool = False):
+    """
+    Stream many JSON array prompts on a bounded thread pool (with
+    `refresh`, none of them served from the cache; see stream_claude_json).
+
+    `jobs` is an iterable of (key, prompt) pairs. Yields (key, "item", item)
+    for each array item as soon as it arrives, then (key, "done", error)
+    once per job, where error is None for a complete answer or the
+    exception that cut it short (items before it were already yielded).
+    Everything is handed back on the calling thread, so the caller can
+    write each item to the database while other answers still stream.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    workers = min(concurrency or CALL_CONCURRENCY, len(jobs))
+    parent = tracing.current()
+    events = queue.Queue()
+
+    def run(key, prompt):
+        with tracing.attach(parent):
+            try:
+                for item in stream_claude_json(prompt, timeout, refresh):
+                    events.put((key, "item", item))
+            except Exception as e:
+                events.put((key, "done", e))
+            else:
+                events.put((key, "done", None))
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="claude")
+    try:
+        for key, prompt in jobs:
+            pool.submit(run, key, prompt)
+        remaining = len(jobs)
+        while remaining:
+            event = events.get()
+            if event[1] == "done":
+                remaining -= 1
+            yield event
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def map_claude_json(jobs, timeout: int | None = None,
+                    concurrency: int | None = None):
+    """
+    Run call_claude_json for many prompts on a bounded thread pool.
+
+    `jobs` is an iterable of (key, prompt) pairs. Yields (key, result, error)
+    tuples in completion order, where exactly one of result/error is None.
+    Results are handed back to the calling thread, so the caller can keep
+    all database writes on a single connection.
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    workers = min(concurrency or CALL_CONCURRENCY, len(jobs))
+
+    # Calls on the pool's threads are traced under the caller's span
+    parent = tracing.current()
+
+    def run(prompt):
+        with tracing.attach(parent):
+            return call_claude_json(prompt, timeout)
+
+    with ThreadPoolExecutor(max_workers=workers,
+                            thread_name_prefix="claude") as pool:
+        futures = {
+            pool.submit(run, prompt): key
+            for key, prompt in jobs
+        }
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                yield key, future.result(), None
+            except Exception as e:
+                yield key, None, e
@@ -0,0 +1,53 @@
+"""Shared pytest fixtures: a scratch pipeline database and a fake Claude."""
+
+import sqlite3
+
+import pytest
+
+import claude_api
+import fingerprints
+import job_queue
+from pipeline_db import configure_connection
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A pipeline-owned database with the job and fingerprint tables."""
+    conn = configure_connection(sqlite3.connect(tmp_path / "pipeline.db"))
+    job_queue.ensure_table(conn)
+    fingerprints.ensure_table(conn)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+class CachedFakeBackend(claude_api.FakeBackend):
+    """FakeBackend whose answers go through the response cache."""
+
+    cacheable = True
+
+
+@pytest.fixture
+def fake_claude(tmp_path, monkeypatch):
+    """
+    Returns a function installing responder(prompt) as Claude, with no
+    rate limit and a fresh response cache (used when `cached`), on a
+    FakeBackend or the given subclass of it.
+    """
+    monkeypatch.setattr(claude_api, "_rate_limiter",
+                        claude_api.TokenBucket(rate=1000.0, capacity=100.0))
+    monkeypatch.setattr(claude_api, "_cache",
+                        ResponseCache(path=tmp_path / "cache.db"))
+
+    def install(responder, cached: bool = False, backend_class=None, **options):
+        if backend_class is None:
+            backend_class = CachedFakeBackend if cached else claude_api.FakeBackend
+        elif cached:
+            backend_class = type(f"Cached{backend_class.__name__}", (backend_class,),
+                                 {"cacheable": True})
+        backend = backend_class(responder, **options)
+        monkeypatch.setattr(claude_api, "_backend", backend)
+        return backend
+
+    return install
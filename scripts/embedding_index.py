@@ -0,0 +1,370 @@
+"""
+embedding_index.py — Offline semantic index over transcript windows.
+
+Every transcript is cut into sliding windows (WINDOW_SECONDS long, one
+every STRIDE_SECONDS). Windows are embedded with latent semantic
+analysis: sublinear TF-IDF over a document-frequency-pruned vocabulary,
+reduced to DIMS dimensions with a randomized truncated SVD. This runs
+on the CPU with NumPy only, with no model download and no API calls.
+
+On disk (EMBEDDING_INDEX_DIR, default <project>/embedding_index/):
+    vectors.npy   float32 [windows x DIMS], unit length, memory-mapped on load
+    windows.npy   float64 [windows x 5]: video_id, first_entry, last_entry,
+                  start_time, end_time (rows grouped by video)
+    model.npz     vocabulary, idf, SVD projection, IVF centroids and lists
+    meta.json     format, transcript-set signature, build stats
+
+Nearest-neighbour queries use an inverted-file (IVF) index: windows are
+clustered with spherical k-means and a query scans only the NPROBE
+closest clusters. Queries restricted to a few videos (phase 3's
+per-category pre-ranking) scan those videos' rows exactly instead.
+
+The index is rebuilt whenever the set of transcripts changes (LSA is fit
+on the whole corpus); see ensure_index().
+
+Requires NumPy, which the rest of the pipeline does not, so
+tedx_pipeline.py imports this module only when it's used.
+"""
+
+import json
+import logging
+import math
+import os
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from fingerprints import digest
+from transcript_store import load_transcripts
+from transcript_windows import STOPWORDS, time_windows
+
+logger = logging.getLogger(__name__)
+
+INDEX_FORMAT = 1
+DEFAULT_INDEX_DIR = Path(__file__).parent.parent / "embedding_index"
+
+WINDOW_SECONDS = 45.0
+STRIDE_SECONDS = 15.0
+DIMS = 128
+MIN_DF = 2
+MAX_DF_RATIO = 0.5
+MAX_VOCAB = 30000
+SVD_OVERSAMPLE = 10
+SVD_POWER_ITERS = 2
+KMEANS_ITERS = 10
+NPROBE = 8
+SEED = 1234
+ROW_BLOCK = 2048  # rows per sparse-product block (bounds temporary memory)
+
+
+def index_dir() -> Path:
+    return Path(os.environ.get("EMBEDDING_INDEX_DIR") or DEFAULT_INDEX_DIR)
+
+
+def transcript_signature(conn) -> str:
+    """Identity of the transcript set the index was built from."""
+    return digest(conn.execute(
+        "SELECT video_id, id, fetched_at FROM transcripts ORDER BY video_id"
+    ).fetchall())
+
+
+def tokenize(normalized_text: str) -> list[str]:
+    return [w for w in normalized_text.split()
+            if len(w) > 2 and w not in STOPWORDS]
+
+
+# ─── Sparse TF-IDF matrix ─────────────────────────────────────────────
+
+class _CSR:
+    """Minimal row-compressed sparse matrix: just what the SVD needs."""
+
+    def __init__(self, indptr, indices, data, n_cols):
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.shape = (len(indptr) - 1, n_cols)
+
+    def dot(self, m):
+        """self @ m, for dense m of shape (n_cols, k)."""
+        out = np.zeros((self.shape[0], m.shape[1]), dtype=np.float32)
+        for r0 in range(0, self.shape[0], ROW_BLOCK):
+            r1 = min(r0 + ROW_BLOCK, self.shape[0])
+            lo, hi = self.indptr[r0], self.indptr[r1]
+            if lo == hi:
+                continue
+            prod = self.data[lo:hi, None] * m[self.indices[lo:hi]]
+            starts = self.indptr[r0:r1] - lo
+            nonempty = self.indptr[r0 + 1:r1 + 1] > self.indptr[r0:r1]
+            sums = np.add.reduceat(prod, starts[nonempty], axis=0)
+            out[r0:r1][nonempty] = sums
+        return out
+
+    def transpose(self) -> "_CSR":
+        rows = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        order = np.argsort(self.indices, kind="stable")
+        indptr = np.zeros(self.shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=self.shape[1]), out=indptr[1:])
+        return _CSR(indptr, rows[order], self.data[order], n_cols=self.shape[0])
+
+
+def _tfidf_rows(docs: list[list[str]], vocab: dict[str, int], idf):
+    """Sublinear TF-IDF rows, L2-normalized, as CSR arrays."""
+    indptr = [0]
+    indices = []
+    data = []
+    for tokens in docs:
+        counts = Counter(vocab[t] for t in tokens if t in vocab)
+        cols = sorted(counts)
+        vals = [(1.0 + math.log(counts[c])) * idf[c] for c in cols]
+        norm = math.sqrt(sum(v * v for v in vals)) or 1.0
+        indices.extend(cols)
+        data.extend(v / norm for v in vals)
+        indptr.append(len(indices))
+    return (np.asarray(indptr, dtype=np.int64),
+            np.asarray(indices, dtype=np.int64),
+            np.asarray(data, dtype=np.float32))
+
+
+def _randomized_svd(x: _CSR, k: int, rng):
+    """Top-k singular triplets of x (Halko et al. range finder)."""
+    xt = x.transpose()
+    omega = rng.standard_normal((x.shape[1], k + SVD_OVERSAMPLE)).astype(np.float32)
+    q, _ = np.linalg.qr(x.dot(omega))
+    for _ in range(SVD_POWER_ITERS):
+        z, _ = np.linalg.qr(xt.dot(q))
+        q, _ = np.linalg.qr(x.dot(z))
+    b = xt.dot(q).T  # (k + p) x n_cols
+    ub, s, vt = np.linalg.svd(b, full_matrices=False)
+    return (q @ ub)[:, :k], s[:k], vt[:k]
+
+
+def _normalize_rows(m):
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (m / norms).astype(np.float32)
+
+
+def _kmeans(vectors, n_clusters: int, rng):
+    """Spherical k-means; returns (centroids, assignment)."""
+    n = vectors.shape[0]
+    centroids = vectors[rng.choice(n, size=n_clusters, replace=False)].copy()
+    assign = np.zeros(n, dtype=np.int64)
+    for _ in range(KMEANS_ITERS):
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, vectors)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        if empty.any():
+            # Re-seed empty clusters with random windows
+            sums[empty] = vectors[rng.choice(n, size=int(empty.sum()), replace=False)]
+        centroids = _normalize_rows(sums)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+# ─── Index ────────────────────────────────────────────────────────────
+
+class EmbeddingIndex:
+    """A loaded index: window vectors, window metadata and the LSA model."""
+
+    def __init__(self, vectors, windows, vocab: list[str], idf, components,
+                 centroids, list_offsets, list_rows, signature: str):
+        self.vectors = vectors
+        self.windows = windows
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.idf = idf
+        self.components = components
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.signature = signature
+        self._video_ids = windows[:, 0].astype(np.int64)
+        # Rows are sorted by video: video_id -> (first_row, end_row)
+        uniq, first = np.unique(self._video_ids, return_index=True)
+        ends = np.append(first[1:], len(self._video_ids))
+        self._video_rows = {int(v): (int(a), int(b))
+                            for v, a, b in zip(uniq, first, ends)}
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    # ── Embedding ────────────────────────────────────────────────────
+
+    def embed_text(self, normalized_text: str):
+        """Unit vector for normalized text (zero vector if no known terms)."""
+        counts = Counter(self.vocab[t] for t in tokenize(normalized_text)
+                         if t in self.vocab)
+        if not counts:
+            return np.zeros(self.components.shape[0], dtype=np.float32)
+        cols = np.fromiter(counts, dtype=np.int64)
+        vals = np.array([(1.0 + math.log(counts[c])) * self.idf[c] for c in cols],
+                        dtype=np.float32)
+        vals /= np.linalg.norm(vals) or 1.0
+        vec = self.components[:, cols] @ vals
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+    def rows_for_video(self, video_id: int) -> range:
+        first, end = self._video_rows.get(video_id, (0, 0))
+        return range(first, end)
+
+    def window(self, row: int) -> dict:
+        vid, first, last, start, end = self.windows[row]
+        return {"video_id": int(vid), "first_entry": int(first),
+                "last_entry": int(last), "start_time": float(start),
+                "end_time": float(end)}
+
+    def span_vector(self, video_id: int, start: float, end: float):
+        """Mean vector of a video's windows overlapping [start, end]."""
+        rows = [r for r in self.rows_for_video(video_id)
+                if self.windows[r, 3] < end and self.windows[r, 4] > start]
+        if not rows:
+            return None
+        vec = np.asarray(self.vectors[rows]).mean(axis=0)
+        return vec / (np.linalg.norm(vec) or 1.0)
+
+    # ── Search ───────────────────────────────────────────────────────
+
+    def search(self, query_vec, k: int = 10, video_ids=None,
+               exclude_video: int | None = None, nprobe: int = NPROBE):
+        """
+        Top-k (row, score) by cosine similarity.
+
+        With `video_ids`, scans exactly those videos' windows; otherwise
+        probes the `nprobe` nearest IVF lists.
+        """
+        if video_ids is not None:
+            rows = np.concatenate([
+                np.arange(r.start, r.stop) for r in
+                (self.rows_for_video(v) for v in video_ids)
+            ] or [np.zeros(0, dtype=np.int64)])
+        else:
+            probe = np.argsort(-(self.centroids @ query_vec))[:nprobe]
+            rows = np.concatenate([
+                self.list_rows[self.list_offsets[c]:self.list_offsets[c + 1]]
+                for c in probe
+            ])
+        if exclude_video is not None and len(rows):
+            rows = rows[self._video_ids[rows] != exclude_video]
+        if not len(rows):
+            return []
+        scores = np.asarray(self.vectors[rows]) @ query_vec
+        top = np.argsort(-scores, kind="stable")[:k]
+        return [(int(rows[i]), float(scores[i])) for i in top]
+
+
+def distinct_hits(index: EmbeddingIndex, hits, limit: int):
+    """Drop hits overlapping a better hit from the same video."""
+    kept = []
+    for row, score in hits:
+        w = index.window(row)
+        if any(k["video_id"] == w["video_id"]
+               and k["start_time"] < w["end_time"] and w["start_time"] < k["end_time"]
+               for k, _ in kept):
+            continue
+        kept.append((w, score))
+        if len(kept) >= limit:
+            break
+    return kept
+
+
+def build_index(conn, path: Path | None = None) -> EmbeddingIndex:
+    """Fit the LSA model on all transcripts and write the index to disk."""
+    path = path or index_dir()
+    signature = transcript_signature(conn)
+    video_ids = [r[0] for r in conn.execute(
+        "SELECT video_id FROM transcripts ORDER BY video_id")]
+    transcripts = load_transcripts(conn, video_ids)
+
+    windows = []
+    docs = []
+    for vid_id in video_ids:
+        transcript = transcripts.get(vid_id)
+        if transcript is None:
+            continue
+        entries = transcript.entries
+        normalized = transcript.normalized or []
+        for first, last in time_windows(entries, WINDOW_SECONDS, STRIDE_SECONDS):
+            end_entry = entries[last - 1]
+            windows.append((vid_id, first, last, entries[first]["start"],
+                            end_entry["start"] + end_entry.get("duration", 2.0)))
+            docs.append(tokenize(" ".join(normalized[first:last])))
+
+    n_docs = len(docs)
+    df = Counter(t for tokens in docs for t in set(tokens))
+    max_df = max(MIN_DF, int(MAX_DF_RATIO * n_docs))
+    terms = [t for t, c in df.most_common() if MIN_DF <= c <= max_df][:MAX_VOCAB]
+    terms.sort()
+    vocab = {t: i for i, t in enumerate(terms)}
+    idf = np.array([math.log((1 + n_docs) / (1 + df[t])) + 1.0 for t in terms],
+                   dtype=np.float32)
+
+    rng = np.random.default_rng(SEED)
+    x = _CSR(*_tfidf_rows(docs, vocab, idf), n_cols=len(terms))
+    k = max(1, min(DIMS, n_docs - 1, len(terms) - 1))
+    if n_docs > 1 and len(terms) > 1:
+        u, s, components = _randomized_svd(x, k, rng)
+        vectors = _normalize_rows(u * s)
+    else:
+        components = np.zeros((k, len(terms)), dtype=np.float32)
+        vectors = np.zeros((n_docs, k), dtype=np.float32)
+
+    n_lists = max(1, int(math.sqrt(n_docs)))
+    if n_docs:
+        centroids, assign = _kmeans(vectors, min(n_lists, n_docs), rng)
+    else:
+        centroids, assign = np.zeros((1, k), dtype=np.float32), np.zeros(0, dtype=np.int64)
+    list_rows = np.argsort(assign, kind="stable")
+    list_offsets = np.searchsorted(assign[list_rows], np.arange(len(centroids) + 1))
+
+    path.mkdir(parents=True, exist_ok=True)
+    window_arr = np.asarray(windows, dtype=np.float64).reshape(-1, 5)
+    np.save(path / "vectors.npy", vectors)
+    np.save(path / "windows.npy", window_arr)
+    np.savez(path / "model.npz", vocab=np.asarray(terms, dtype=str), idf=idf,
+             components=components.astype(np.float32), centroids=centroids,
+             list_offsets=list_offsets, list_rows=list_rows)
+    (path / "meta.json").write_text(json.dumps({
+        "format": INDEX_FORMAT,
+        "signature": signature,
+        "windows": n_docs,
+        "videos": len(transcripts),
+        "vocabulary": len(terms),
+        "dims": int(k),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+    }, indent=2))
+    logger.info(f"Embedding index: {n_docs:,} windows from {len(transcripts)} "
+                f"talks, {len(terms):,} terms, {k} dims")
+    return load_index(path)
+
+
+def load_index(path: Path | None = None) -> EmbeddingIndex | None:
+    """Load an index from disk (vectors memory-mapped), or None if absent."""
+    path = path or index_dir()
+    try:
+        meta = json.loads((path / "meta.json").read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+    if meta.get("format") != INDEX_FORMAT:
+        return None
+    model = np.load(path / "model.npz")
+    return EmbeddingIndex(
+        vectors=np.load(path / "vectors.npy", mmap_mode="r"),
+        windows=np.load(path / "windows.npy"),
+        vocab=list(model["vocab"]),
+        idf=model["idf"],
+        components=model["components"],
+        centroids=model["centroids"],
+        list_offsets=model["list_offsets"],
+        list_rows=model["list_rows"],
+        signature=meta["signature"],
+    )
+
+
+def ensure_index(conn, rebuild: bool = False) -> EmbeddingIndex:
+    """The on-disk index, rebuilt first if transcripts changed since."""
+    index = None if rebuild else load_index()
+    if index is None or index.signature != transcript_signature(conn):
+        index = build_index(conn)
+    return index
@@ -0,0 +1,128 @@
+"""
+fingerprints.py — Input fingerprints for pipeline outputs.
+
+Phases used to skip work whenever an output row existed, so a re-fetched
+transcript or an edited prompt template silently kept stale summaries,
+clips and key moments until a full reset. Instead, each output unit now
+records a fingerprint of everything it was generated from, and phases
+recompute only the units whose current fingerprint differs.
+
+Output units and their inputs:
+    summary      per video:    transcript hash, SUMMARY_PROMPT version
+    tags         per video:    summary hash, category set, TAG_PROMPT version
+    clips        per category: category definition, member videos and their
+                               transcript hashes, CLIP_PROMPT version
+    key_moments  per video:    transcript hash, KEY_MOMENTS_PROMPT version
+
+Fingerprints live in the pipeline-owned `output_fingerprints` table, keyed
+by (kind, key), since the output tables themselves belong to the web app's
+schema. Outputs written before fingerprinting have no row; they are
+adopted as current on first sight rather than regenerated.
+"""
+
+import hashlib
+import json
+from datetime import datetime, timezone
+
+SUMMARY = "summary"
+TAGS = "tags"
+CLIPS = "clips"
+KEY_MOMENTS = "key_moments"
+
+
+def ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS output_fingerprints (
+            kind TEXT NOT NULL,
+            key INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        )
+    """)
+
+
+def digest(*parts) -> str:
+    """Stable hash of JSON-serializable parts."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True,
+                         separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def template_version(template: str) -> str:
+    """Version of a prompt template: any edit to its text changes it."""
+    return hashlib.sha1(template.encode("utf-8")).hexdigest()[:12]
+
+
+def transcript_hashes(conn, video_ids=None) -> dict[int, str]:
+    """
+    Content hash of each transcript's entries, as {video_id: hash}.
+
+    Hashes the stored JSON text directly (no decoding), so a re-fetch that
+    returns identical entries keeps the same hash.
+    """
+    if video_ids is None:
+        rows = conn.execute("SELECT video_id, entries FROM transcripts")
+        return {vid: hashlib.sha1(entries.encode("utf-8")).hexdigest()
+                for vid, entries in rows}
+
+    video_ids = list(dict.fromkeys(video_ids))
+    result = {}
+    for chunk_start in range(0, len(video_ids), 500):
+        chunk = video_ids[chunk_start:chunk_start + 500]
+        marks = ",".join("?" * len(chunk))
+        for vid, entries in conn.execute(
+                f"SELECT video_id, entries FROM transcripts "
+                f"WHERE video_id IN ({marks})", chunk):
+            result[vid] = hashlib.sha1(entries.encode("utf-8")).hexdigest()
+    return result
+
+
+def load(conn, kind: str) -> dict[int, str]:
+    """Stored fingerprints of one kind, as {key: fingerprint}."""
+    return dict(conn.execute(
+        "SELECT key, fingerprint FROM output_fingerprints WHERE kind = ?", (kind,)
+    ).fetchall())
+
+
+UPSERT_SQL = """
+    INSERT OR REPLACE INTO output_fingerprints (kind, key, fingerprint, computed_at)
+    VALUES (?, ?, ?, ?)
+"""
+
+
+def params(kind: str, key: int, fingerprint: str) -> tuple:
+    """Parameters for UPSERT_SQL."""
+    return (kind, key, fingerprint, datetime.now(timezone.utc).isoformat())
+
+
+def select_stale(conn, kind: str, current: dict, existing) -> list:
+    """
+    Keys of `current` ({key: fingerprint}) whose outputs need computing.
+
+    A key is stale when it has no output (not in `existing`) or when its
+    stored fingerprint differs from the current one. Existing outputs with
+    no stored fingerprint are adopted: their current fingerprint is
+    recorded and they are left alone. Order follows `current`.
+    """
+    stored = load(conn, kind)
+    existing = set(existing)
+    stale = []
+    adopt = []
+    for key, fingerprint in current.items():
+        if key not in existing:
+            stale.append(key)
+        elif key not in stored:
+            adopt.append(params(kind, key, fingerprint))
+        elif stored[key] != fingerprint:
+            stale.append(key)
+    if adopt:
+        with conn:
+            conn.executemany(UPSERT_SQL, adopt)
+    return stale
+
+
+def clear(conn, *kinds: str) -> None:
+    """Forget stored fingerprints (e.g. when a phase is reset)."""
+    conn.executemany("DELETE FROM output_fingerprints WHERE kind = ?",
+                     [(k,) for k in kinds])
@@ -1,22 +1,35 @@
 """
-fix_clip_timestamps.py — One-time backfill to correct existing clip timestamps.
+fix_clip_timestamps.py — Backfill to correct existing clip and key moment
+timestamps.
 
-Loads each clip and its video's transcript entries, runs correct_timestamps()
-against the quote_snippet, and updates start_time/end_time in the DB.
+Aligns each clip's quote_snippet and each key moment's quote_text against
+its video's transcript entries with correct_timestamps(), and updates
+start_time/end_time in the DB.
+
+Quotes are grouped by video so each transcript is decoded and indexed
+once; video groups are spread across a process pool, and all updates are
+written with one executemany per table in a single transaction.
+
+With --dry-run the database is opened read-only, in the parent and the
+workers alike, and transcripts are decoded without packing the sidecar.
 
 Usage:
-    python scripts/fix_clip_timestamps.py [--db PATH] [--dry-run]
+    python scripts/fix_clip_timestamps.py [--db PATH] [--dry-run] [--workers N]
 
 Defaults to local.db in the project root.
 """
 
 import argparse
-import json
 import logging
+import os
 import sqlite3
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+import transcript_store
+from pipeline_db import configure_connection
 from text_utils import correct_timestamps
+from worker_pool import READ_PRAGMAS
 
 logging.basicConfig(
     level=logging.INFO,
@@ -25,82 +38,148 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# (label, table, quote column) for each kind of timestamped quote
+TARGETS = (
+    ("Clip", "clips", "quote_snippet"),
+    ("Key moment", "video_key_moments", "quote_text"),
+)
+GROUPS_PER_WORKER = 4  # smaller tasks even out long and short transcripts
+
+
+def _load_quotes(conn) -> dict[int, list[tuple]]:
+    """{video_id: [(table, row_id, quote, start, end), ...]} for all targets."""
+    by_video: dict[int, list[tuple]] = {}
+    for _, table, column in TARGETS:
+        for row_id, vid_id, start, end, quote in conn.execute(f"""
+            SELECT q.id, q.video_id, q.start_time, q.end_time, q.{column}
+            FROM {table} q
+            JOIN transcripts t ON t.video_id = q.video_id
+            WHERE q.{column} IS NOT NULL AND q.{column} != ''
+            ORDER BY q.id
+        """):
+            by_video.setdefault(vid_id, []).append((table, row_id, quote, start, end))
+    return by_video
+
+
+def _connect(db_path: str, read_only: bool) -> sqlite3.Connection:
+    """A pipeline connection, or one that cannot write anything (dry runs)."""
+    if not read_only:
+        return configure_connection(sqlite3.connect(db_path))
+    conn = sqlite3.connect(f"{Path(db_path).resolve().as_uri()}?mode=ro", uri=True)
+    for name, value in READ_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def _correct_group(db_path: str, group: dict[int, list[tuple]],
+                   dry_run: bool = False) -> list[tuple]:
+    """
+    Align one group of videos' quotes. Runs in a worker process with its own
+    connection; returns (table, row_id, quote, old_start, old_end,
+    has_transcript, match) per quote.
+    """
+    conn = _connect(db_path, read_only=dry_run)
+    try:
+        transcripts = transcript_store.load_transcripts(conn, list(group),
+                                                        repack=not dry_run)
+    finally:
+        conn.close()
+
+    results = []
+    for vid_id, quotes in group.items():
+        transcript = transcripts.get(vid_id)
+        for table, row_id, quote, start, end in quotes:
+            match = correct_timestamps(quote, transcript.index) if transcript else None
+            results.append((table, row_id, quote, start, end,
+                            transcript is not None, match))
+    return results
+
+
+def _split_groups(by_video: dict, n_groups: int) -> list[dict]:
+    """Deal videos into n_groups groups of similar quote counts."""
+    groups = [{} for _ in range(max(1, n_groups))]
+    loads = [0] * len(groups)
+    for vid_id, quotes in sorted(by_video.items(), key=lambda kv: -len(kv[1])):
+        i = loads.index(min(loads))
+        groups[i][vid_id] = quotes
+        loads[i] += len(quotes)
+    return [g for g in groups if g]
+
+
+def run_backfill(db_path: str, dry_run: bool = False, workers: int | None = None) -> None:
+    workers = workers or os.cpu_count() or 1
+    conn = _connect(db_path, read_only=dry_run)
+    if not dry_run:
+        transcript_store.ensure_table(conn)
+        conn.commit()
 
-def run_backfill(db_path: str, dry_run: bool = False) -> None:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-
-    clips = conn.execute("""
-        SELECT c.id, c.video_id, c.start_time, c.end_time, c.quote_snippet,
-               t.entries
-        FROM clips c
-        JOIN transcripts t ON t.video_id = c.video_id
-        WHERE c.quote_snippet IS NOT NULL AND c.quote_snippet != ''
-        ORDER BY c.id
-    """).fetchall()
-
-    logger.info(f"Found {len(clips)} clips with quotes to process")
-
-    corrected = 0
+    by_video = _load_quotes(conn)
+    total = sum(len(q) for q in by_video.values())
+    logger.info(f"Found {total} quotes to process across {len(by_video)} videos")
+
+    if workers > 1 and len(by_video) > 1:
+        groups = _split_groups(by_video, workers * GROUPS_PER_WORKER)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            batches = list(pool.map(_correct_group, [db_path] * len(groups), groups,
+                                    [dry_run] * len(groups)))
+        results = [r for batch in batches for r in batch]
+    else:
+        results = _correct_group(db_path, by_video, dry_run)
+
+    labels = {table: label for label, table, _ in TARGETS}
+    updates: dict[str, list[tuple]] = {table: [] for _, table, _ in TARGETS}
     unchanged = 0
     unmatched = 0
 
-    for clip in clips:
-        clip_id = clip["id"]
-        quote = clip["quote_snippet"]
-        old_start = clip["start_time"]
-        old_end = clip["end_time"]
-
-        try:
-            entries = json.loads(clip["entries"])
-        except (json.JSONDecodeError, TypeError):
-            logger.warning(f"  Clip {clip_id}: invalid transcript entries, skipping")
+    for table, row_id, quote, old_start, old_end, has_transcript, match in sorted(
+            results, key=lambda r: (r[0], r[1])):
+        label = labels[table]
+        if not has_transcript:
+            logger.warning(f"  {label} {row_id}: invalid transcript entries, skipping")
             unmatched += 1
             continue
-
-        result = correct_timestamps(quote, entries)
-
-        if result is None:
-            logger.warning(f"  Clip {clip_id}: no match for quote: {quote[:60]!r}")
+        if match is None:
+            logger.warning(f"  {label} {row_id}: no match for quote: {quote[:60]!r}")
             unmatched += 1
             continue
 
-        new_start, new_end = result
+        new_start, new_end = match
         delta_start = abs(new_start - old_start)
         delta_end = abs(new_end - old_end)
 
         if delta_start < 1.0 and delta_end < 1.0:
-            logger.debug(f"  Clip {clip_id}: already accurate (delta <1s), skipping")
+            logger.debug(f"  {label} {row_id}: already accurate (delta <1s), skipping")
             unchanged += 1
             continue
 
         logger.info(
-            f"  Clip {clip_id}: {old_start:.1f}-{old_end:.1f}s → {new_start:.1f}-{new_end:.1f}s "
+            f"  {label} {row_id}: {old_start:.1f}-{old_end:.1f}s → {new_start:.1f}-{new_end:.1f}s "
             f"(Δ{delta_start:.1f}s) | {quote[:50]!r}"
         )
+        updates[table].append((new_start, new_end, row_id))
 
-        if not dry_run:
-            conn.execute(
-                "UPDATE clips SET start_time = ?, end_time = ? WHERE id = ?",
-                (new_start, new_end, clip_id),
-            )
-            corrected += 1
-        else:
-            corrected += 1
-
-    if not dry_run:
-        conn.commit()
+    corrected = sum(len(rows) for rows in updates.values())
+    if not dry_run and corrected:
+        with conn:
+            for table, rows in updates.items():
+                conn.executemany(
+                    f"UPDATE {table} SET start_time = ?, end_time = ? WHERE id = ?",
+                    rows,
+                )
 
     conn.close()
 
     logger.info(
         f"\nDone {'(dry run) ' if dry_run else ''}"
-        f"— corrected: {corrected}, unchanged: {unchanged}, unmatched: {unmatched}"
+        f"— corrected: {corrected} "
+        f"({len(updates['clips'])} clips, {len(updates['video_key_moments'])} key moments), "
+        f"unchanged: {unchanged}, unmatched: {unmatched}"
     )
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Backfill clip timestamps from transcript data")
+    parser = argparse.ArgumentParser(
+        description="Backfill clip and key moment timestamps from transcript data")
     parser.add_argument(
         "--db",
         default=str(Path(__file__).parent.parent / "local.db"),
@@ -111,10 +190,16 @@ if __name__ == "__main__":
         action="store_true",
         help="Show what would change without writing to DB",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes (default: CPU count; 1 runs in-process)",
+    )
     args = parser.parse_args()
 
     logger.info(f"Database: {args.db}")
     if args.dry_run:
         logger.info("DRY RUN — no changes will be written")
 
-    run_backfill(args.db, dry_run=args.dry_run)
+    run_backfill(args.db, dry_run=args.dry_run, workers=args.workers)
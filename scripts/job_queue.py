@@ -0,0 +1,243 @@
+"""
+job_queue.py — Durable per-item work queue for the pipeline phases.
+
+Every unit of work a phase does (fetch a transcript, summarize or tag a
+video, find a category's clips, extract a video's key moments) is a row
+in the pipeline-owned `pipeline_jobs` table, keyed by (stage, key):
+
+    pending  waiting for a worker
+    leased   claimed by a worker until lease_expires
+    done     output written (marked in the same transaction)
+    failed   gave up after MAX_ATTEMPTS; skipped until its inputs change
+
+Phases enqueue the units whose output is missing or stale, then lease
+them in small chunks, so several pipeline processes sharing one database
+split the work instead of repeating it. A worker that stops cleanly
+(including Ctrl-C) hands its unfinished leases back; one that crashed
+loses them when the lease expires, or at once when it ran on this host
+and its process is gone. Each lost lease counts as an attempt, so a unit
+that keeps killing its worker ends up failed rather than looping.
+
+Jobs carry the input fingerprint of their unit (see fingerprints.py); a
+failed job is retried once its fingerprint changes, or after
+`reset --phase N`.
+"""
+
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+LEASE_SECONDS = 1800
+MAX_ATTEMPTS = 3
+
+_HOST = socket.gethostname()
+
+
+def worker_id() -> str:
+    """Lease owner name of this process."""
+    return f"{_HOST}:{os.getpid()}"
+
+
+def ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_jobs (
+            stage TEXT NOT NULL,
+            key INTEGER NOT NULL,
+            fingerprint TEXT,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            last_error TEXT,
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY (stage, key)
+        )
+    """)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def enqueue(conn, stage: str, work: dict) -> list:
+    """
+    Queue the units in `work` ({key: fingerprint}), which all need their
+    output (re)computed. New units, units whose fingerprint changed and
+    units marked done whose output has gone missing become pending;
+    pending and leased units are left alone. Returns the keys that
+    already failed on the same inputs, which stay failed.
+    """
+    existing = {
+        key: (fingerprint, state) for key, fingerprint, state in conn.execute(
+            "SELECT key, fingerprint, state FROM pipeline_jobs WHERE stage = ?",
+            (stage,))
+    }
+    now = _now()
+    queued = []
+    given_up = []
+    for key, fingerprint in work.items():
+        old = existing.get(key)
+        if old is not None and old[0] == fingerprint:
+            if old[1] == FAILED:
+                given_up.append(key)
+                continue
+            if old[1] != DONE:
+                continue
+        queued.append((stage, key, fingerprint, PENDING, now))
+    if queued:
+        with conn:
+            conn.executemany("""
+                INSERT OR REPLACE INTO pipeline_jobs
+                    (stage, key, fingerprint, state, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            """, queued)
+    return given_up
+
+
+def _lease_lost(owner: str | None, expires: float | None, now: float) -> bool:
+    """Whether a leased job's worker is gone (lease expired or process dead)."""
+    if expires is None or expires < now:
+        return True
+    host, _, pid = (owner or "").rpartition(":")
+    if host != _HOST or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def lease(conn, stage: str, keys, limit: int, owner: str | None = None) -> list:
+    """
+    Claim up to `limit` pending jobs among `keys` (in their order) for
+    LEASE_SECONDS, taking over jobs whose worker is gone. Returns the
+    claimed keys.
+    """
+    owner = owner or worker_id()
+    now = time.time()
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")  # one worker claims at a time
+    try:
+        jobs = {
+            key: (state, attempts, lease_owner, lease_expires)
+            for key, state, attempts, lease_owner, lease_expires in conn.execute("""
+                SELECT key, state, attempts, lease_owner, lease_expires
+                FROM pipeline_jobs WHERE stage = ? AND state IN (?, ?)
+            """, (stage, PENDING, LEASED))
+        }
+        claimed = []
+        lost = []
+        for key in keys:
+            if len(claimed) >= limit:
+                break
+            if key not in jobs:
+                continue
+            state, attempts, lease_owner, lease_expires = jobs[key]
+            if state == LEASED:
+                if not _lease_lost(lease_owner, lease_expires, now):
+                    continue
+                attempts += 1
+                if attempts >= MAX_ATTEMPTS:
+                    lost.append((attempts, f"worker {lease_owner} never finished",
+                                 _now(), stage, key))
+                    continue
+            claimed.append((owner, now + LEASE_SECONDS, attempts, _now(), stage, key))
+        conn.executemany(f"""
+            UPDATE pipeline_jobs SET state = '{LEASED}', lease_owner = ?,
+                lease_expires = ?, attempts = ?, updated_at = ?
+            WHERE stage = ? AND key = ?
+        """, claimed)
+        conn.executemany(f"""
+            UPDATE pipeline_jobs SET state = '{FAILED}', attempts = ?,
+                lease_owner = NULL, lease_expires = NULL, last_error = ?,
+                updated_at = ?
+            WHERE stage = ? AND key = ?
+        """, lost)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return [c[-1] for c in claimed]
+
+
+def release(conn, stage: str, owner: str | None = None) -> None:
+    """Hand this worker's unfinished leases back to the queue."""
+    with conn:
+        conn.execute(f"""
+            UPDATE pipeline_jobs SET state = '{PENDING}', lease_owner = NULL,
+                lease_expires = NULL, updated_at = ?
+            WHERE stage = ? AND state = '{LEASED}' AND lease_owner = ?
+        """, (_now(), stage, owner or worker_id()))
+
+
+@contextmanager
+def held(conn, stage: str, owner: str | None = None):
+    """Release this worker's leases of `stage` when the block ends."""
+    try:
+        yield
+    finally:
+        release(conn, stage, owner)
+
+
+# Statements for a BatchWriter, so a job's state commits with its output
+
+DONE_SQL = f"""
+    UPDATE pipeline_jobs SET state = '{DONE}', lease_owner = NULL,
+        lease_expires = NULL, last_error = NULL, updated_at = ?
+    WHERE stage = ? AND key = ?
+"""
+
+RETRY_SQL = f"""
+    UPDATE pipeline_jobs SET attempts = attempts + 1,
+        state = CASE WHEN attempts + 1 >= {MAX_ATTEMPTS}
+                     THEN '{FAILED}' ELSE '{PENDING}' END,
+        lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ?
+    WHERE stage = ? AND key = ?
+"""
+
+GIVE_UP_SQL = f"""
+    UPDATE pipeline_jobs SET state = '{FAILED}', attempts = ?,
+        lease_owner = NULL, lease_expires = NULL, last_error = ?, updated_at = ?
+    WHERE stage = ? AND key = ?
+"""
+
+
+def done_params(stage: str, key: int) -> tuple:
+    """Parameters for DONE_SQL."""
+    return (_now(), stage, key)
+
+
+def retry_params(stage: str, key: int, error: str) -> tuple:
+    """Parameters for RETRY_SQL: one failed attempt, failed after the last."""
+    return (error[:500], _now(), stage, key)
+
+
+def give_up_params(stage: str, key: int, attempts: int, error: str) -> tuple:
+    """Parameters for GIVE_UP_SQL."""
+    return (attempts, error[:500], _now(), stage, key)
+
+
+def counts(conn) -> dict[str, dict[str, int]]:
+    """Number of jobs per stage and state."""
+    result = {}
+    for stage, state, n in conn.execute(
+            "SELECT stage, state, COUNT(*) FROM pipeline_jobs GROUP BY stage, state"):
+        result.setdefault(stage, {})[state] = n
+    return result
+
+
+def clear(conn, *stages: str) -> None:
+    """Forget jobs (e.g. when a phase is reset)."""
+    conn.executemany("DELETE FROM pipeline_jobs WHERE stage = ?",
+                     [(s,) for s in stages])
@@ -0,0 +1,133 @@
+"""
+json_stream.py — Incremental parsing of a JSON array answer as it streams in.
+
+Batch prompts ask Claude for a JSON array of per-video objects, which may
+arrive wrapped in a ```json fence or with commentary around it.
+ArrayStream is fed the response text chunk by chunk and returns each
+top-level item as soon as its closing bracket arrives, so callers can act
+on early items while later ones are still being generated. When the
+response stops early or an item is malformed, every complete item before
+that point has already been handed over; `complete` and `errors` tell the
+caller whether anything was lost.
+
+A response whose top-level value is an object rather than an array yields
+that one object.
+"""
+
+import json
+import re
+
+_STRUCTURAL = re.compile(r'["\[\]{},]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+_START = re.compile(r"[\[{]|```")
+
+
+class ArrayStream:
+    """Splits a streamed JSON array into its parsed top-level items."""
+
+    def __init__(self):
+        self.top: str | None = None   # "[" or "{" once the value starts
+        self.complete = False         # the top-level value was closed
+        self.items_seen = 0
+        self.errors: list[str] = []   # malformed items that were skipped
+        self._text = ""
+        self._pos = 0                 # next character to scan
+        self._item_start = 0
+        self._depth = 0
+        self._in_string = False
+
+    def feed(self, chunk: str) -> list:
+        """Add response text; returns the items completed by it."""
+        if self.complete:
+            return []
+        self._text += chunk
+        items = []
+        self._scan(items)
+        # Drop text no longer needed for the item in progress
+        if self.top is not None and self._item_start:
+            self._text = self._text[self._item_start:]
+            self._pos -= self._item_start
+            self._item_start = 0
+        return items
+
+    def _emit(self, items: list, text: str) -> None:
+        text = text.strip()
+        if not text:
+            return
+        try:
+            items.append(json.loads(text))
+            self.items_seen += 1
+        except json.JSONDecodeError as e:
+            self.errors.append(f"{e}: {text[:80]!r}")
+
+    def _scan(self, items: list) -> None:
+        text = self._text
+        while not self.complete:
+            if self.top is None:
+                m = _START.search(text, self._pos)
+                if m is None:
+                    self._pos = max(self._pos, len(text) - 2)  # a fence may be split
+                    return
+                if m.group() == "```":
+                    # Skip the fence line (e.g. ```json) once it is whole
+                    newline = text.find("\n", m.end())
+                    if newline == -1:
+                        self._pos = m.start()
+                        return
+                    self._pos = newline + 1
+                    continue
+                self.top = m.group()
+                self._depth = 1
+                self._pos = m.end()
+                self._item_start = m.start() if self.top == "{" else m.end()
+                continue
+
+            if self._in_string:
+                m = _STRING_SPECIAL.search(text, self._pos)
+                if m is None:
+                    self._pos = len(text)
+                    return
+                if m.group() == "\\":
+                    if m.end() >= len(text):
+                        self._pos = m.start()  # escape split across chunks
+                        return
+                    self._pos = m.end() + 1
+                else:
+                    self._in_string = False
+                    self._pos = m.end()
+                continue
+
+            m = _STRUCTURAL.search(text, self._pos)
+            if m is None:
+                self._pos = len(text)
+                return
+            c = m.group()
+            self._pos = m.end()
+            if c == '"':
+                self._in_string = True
+            elif c in "[{":
+                self._depth += 1
+            elif c in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    end = m.end() if self.top == "{" else m.start()
+                    self._emit(items, text[self._item_start:end])
+                    self.complete = True
+            elif self._depth == 1 and self.top == "[":  # item separator
+                self._emit(items, text[self._item_start:m.start()])
+                self._item_start = m.end()
+
+
+def parse_json_text(text: str):
+    """
+    Parse a whole response: the array (as a list) or object it contains.
+    Raises ValueError if it is incomplete or has malformed items.
+    """
+    stream = ArrayStream()
+    items = stream.feed(text)
+    if not stream.complete or stream.errors:
+        problem = stream.errors[0] if stream.errors else "no complete JSON value"
+        raise ValueError(f"Invalid JSON response ({problem})")
+    if stream.top == "{":
+        return items[0]
+    return items
@@ -0,0 +1,289 @@
+"""
+pipeline_dag.py — Run pipeline stages as a dependency graph.
+
+run-all used to run phase 1 → 2 → 3 → 4 strictly in order, although key
+moments only need transcripts and could be extracted while phase 2 is
+still summarizing, discovering and tagging. Instead each stage declares
+the stages it needs, and stages whose inputs are ready run side by side,
+each on a thread with its own database connection. Claude calls from all
+of them share one rate limit and pool of call slots (see claude_api.py),
+and writes stay serialized by SQLite (WAL, busy_timeout).
+
+A stage that works per video can be marked `streams`: it does not wait
+for its upstream stages to finish, but runs in rounds on the videos whose
+inputs have appeared so far. Every DAG_POLL_SECONDS it asks each upstream
+stage for the keys it wrote past a watermark (e.g. a row id), so a poll
+only reads what is new, and it holds those keys until there are `batch`
+of them (enough to fill a Claude call), rather than starting a round for
+every one or two videos. Once the upstream stages have finished it runs
+once more over everything, which also picks up any keys still held.
+Phases already skip units that are done and lease the rest from the job
+queue, so a round only does new work.
+
+A stage that fails is logged; the stages that need it are skipped, the
+others run to the end, and run_dag then raises the first failure. On
+Ctrl-C no further stage or round is started; stages already running end
+with the process (their job leases are handed back as they unwind).
+
+run_stream is the per-item counterpart: keys (video ids) flow through a
+chain of steps connected by bounded queues, each step on its own thread
+taking a small batch at a time, so the first items come out the far end
+while later ones are still being fetched, and a slow step holds back
+the ones before it instead of letting work pile up in memory.
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import tracing
+
+logger = logging.getLogger("dag")
+
+DAG_POLL_SECONDS = 15.0
+
+STREAM_BATCH = 4        # most keys a stream step takes at once
+STREAM_QUEUE_SIZE = 8   # keys waiting between two stream steps
+
+_END = object()  # end of the stream
+
+
+class Stage:
+    """
+    One node of the graph.
+
+        Stage("key_moments", run_phase4, needs=("transcripts",), streams=True,
+              batch=6)
+
+    `run(conn)` does the stage's work on the given connection; a streaming
+    stage's rounds call `run(conn, keys)` with just the keys that are new
+    since its last round. `output(conn, after)` returns (keys, watermark):
+    the keys of the output written since watermark `after` (None for
+    everything) and the watermark to pass next time, for stages that
+    others stream from. `batch` is how many new keys a streaming stage
+    waits for before it starts a round while its upstream is running.
+    """
+
+    def __init__(self, name: str, run, needs: tuple = (), streams: bool = False,
+                 output=None, batch: int = 1):
+        self.name = name
+        self.run = run
+        self.needs = tuple(needs)
+        self.streams = streams
+        self.output = output
+        self.batch = batch
+
+
+def run_dag(stages: list[Stage], connect, poll_seconds: float | None = None) -> dict:
+    """
+    Run `stages`, each on its own thread and `connect()` connection, as
+    soon as what it needs is ready. Returns {stage name: last result of
+    its run}; raises the first stage failure once every stage has ended.
+    """
+    poll_seconds = DAG_POLL_SECONDS if poll_seconds is None else poll_seconds
+    by_name = {stage.name: stage for stage in stages}
+    for stage in stages:
+        for need in stage.needs:
+            if need not in by_name:
+                raise ValueError(f"Stage {stage.name!r} needs unknown stage {need!r}")
+            if stage.streams and by_name[need].output is None:
+                raise ValueError(f"Stage {stage.name!r} streams from {need!r}, "
+                                 f"which has no output")
+    _check_acyclic(by_name)
+
+    changed = threading.Condition()
+    finished: dict[str, bool] = {}  # stage name -> succeeded
+    results = {}
+    errors = []
+    stopping = threading.Event()
+    parent = tracing.current()
+
+    def drive(stage: Stage):
+        conn = None
+        succeeded = False
+        try:
+            with tracing.attach(parent):
+                conn = connect()
+                marks = dict.fromkeys(stage.needs)  # upstream stage -> watermark
+                seen = {need: set() for need in stage.needs}
+                ready = {}  # keys with all their inputs, waiting for a round
+                rounds = 0
+                while not stopping.is_set():
+                    with changed:
+                        upstream_done = all(n in finished for n in stage.needs)
+                        if not upstream_done and not stage.streams:
+                            changed.wait()
+                            continue
+                    if upstream_done:
+                        break
+                    # Streaming: collect what the upstream stages wrote since
+                    # the last poll, and run a round once a batch is ready
+                    for need in stage.needs:
+                        keys, marks[need] = by_name[need].output(conn, marks[need])
+                        seen[need].update(keys)
+                        ready.update(dict.fromkeys(
+                            k for k in keys if all(k in seen[n] for n in stage.needs)))
+                    if len(ready) >= stage.batch:
+                        rounds += 1
+                        logger.info(f"Stage {stage.name}: round {rounds}, "
+                                    f"{len(ready)} new (upstream still running)")
+                        keys, ready = list(ready), {}
+                        with tracing.span(stage.name, round=rounds, keys=len(keys)):
+                            results[stage.name] = stage.run(conn, keys)
+                    with changed:
+                        if not all(n in finished for n in stage.needs):
+                            changed.wait(poll_seconds)
+
+                if stopping.is_set():
+                    return
+                failed = [n for n in stage.needs if not finished[n]]
+                if failed:
+                    logger.error(f"Stage {stage.name}: skipped, "
+                                 f"{', '.join(failed)} failed")
+                    return
+                logger.info(f"Stage {stage.name}: starting")
+                t0 = time.monotonic()
+                with tracing.span(stage.name):
+                    results[stage.name] = stage.run(conn)
+                logger.info(f"Stage {stage.name}: finished in "
+                            f"{time.monotonic() - t0:.1f}s")
+                succeeded = True
+        except Exception as e:
+            if stopping.is_set():
+                logger.debug(f"Stage {stage.name} stopped: {e}")
+                return
+            logger.exception(f"Stage {stage.name} failed: {e}")
+            errors.append(e)
+        finally:
+            if conn is not None:
+                conn.close()
+            with changed:
+                finished[stage.name] = succeeded
+                changed.notify_all()
+
+    threads = [threading.Thread(target=drive, args=(stage,), name=f"stage-{stage.name}",
+                                daemon=True)
+               for stage in stages]
+    for thread in threads:
+        thread.start()
+    # Joined with a timeout so Ctrl-C still reaches this thread
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        stopping.set()
+        with changed:
+            changed.notify_all()
+        raise
+    if errors:
+        raise errors[0]
+    return results
+
+
+def _check_acyclic(by_name: dict[str, Stage]) -> None:
+    state = {}  # name -> "visiting" | "done"
+
+    def visit(name: str, path: list[str]):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise ValueError(f"Stage cycle: {' -> '.join(path + [name])}")
+        state[name] = "visiting"
+        for need in by_name[name].needs:
+            visit(need, path + [name])
+        state[name] = "done"
+
+    for name in by_name:
+        visit(name, [])
+
+
+def run_stream(source, steps: list[tuple], connect, batch: int | None = None,
+               queue_size: int | None = None) -> dict[str, dict]:
+    """
+    Push the keys of `source` (consumed lazily) through `steps`, a list
+    of (name, fn) pairs, in order. Each step runs on its own thread and
+    `connect()` connection, calling fn(conn, keys) on whatever keys are
+    waiting (up to `batch`, at least one) and then handing them on. A
+    batch that raises is logged and handed on all the same, since later
+    steps check their own inputs. Returns {step name: {"keys", "errors"}}.
+    """
+    batch = batch or STREAM_BATCH
+    queue_size = queue_size or STREAM_QUEUE_SIZE
+    queues = [queue.Queue(maxsize=queue_size) for _ in steps]
+    stats = {name: {"keys": 0, "errors": 0} for name, _ in steps}
+    stopping = threading.Event()
+    parent = tracing.current()
+
+    def put(q: queue.Queue, item) -> bool:
+        while not stopping.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def feed():
+        for key in source:
+            if not put(queues[0], key):
+                return
+        put(queues[0], _END)
+
+    def step(i: int):
+        name, fn = steps[i]
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(queues) else None
+        conn = None
+        try:
+            with tracing.attach(parent):
+                conn = connect()
+                ended = False
+                while not ended and not stopping.is_set():
+                    try:
+                        keys = [inbox.get(timeout=0.5)]
+                    except queue.Empty:
+                        continue
+                    while len(keys) < batch:
+                        try:
+                            keys.append(inbox.get_nowait())
+                        except queue.Empty:
+                            break
+                    if keys[-1] is _END:
+                        keys.pop()
+                        ended = True
+                    if keys:
+                        with tracing.span(name, keys=len(keys)):
+                            try:
+                                fn(conn, keys)
+                            except Exception as e:
+                                if stopping.is_set():
+                                    return
+                                logger.exception(f"Step {name} failed for {keys}: {e}")
+                                stats[name]["errors"] += 1
+                        stats[name]["keys"] += len(keys)
+                        if outbox is not None:
+                            for key in keys:
+                                if not put(outbox, key):
+                                    return
+                if ended and outbox is not None:
+                    put(outbox, _END)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    threads = [threading.Thread(target=feed, name="stream-source", daemon=True)]
+    threads += [threading.Thread(target=step, args=(i,), name=f"stream-{name}",
+                                 daemon=True)
+                for i, (name, _) in enumerate(steps)]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(0.5)
+    except KeyboardInterrupt:
+        stopping.set()
+        raise
+    return stats
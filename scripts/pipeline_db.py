@@ -0,0 +1,160 @@
+"""
+pipeline_db.py — SQLite connection tuning and batched writes for the pipeline.
+
+The web app reads local.db while the pipeline runs, so connections use WAL
+journaling (readers never block on the writer) with synchronous=NORMAL,
+which in WAL mode is still durable against application crashes.
+
+BatchWriter buffers statements in order and writes runs of the same
+statement with executemany inside one explicit transaction. Flushes only ever happen at
+commit points the caller marks between work units (a batch, a category),
+so a killed run leaves whole units or nothing: every phase skips units
+that already have rows, and resumes cleanly from the first missing one.
+"""
+
+import logging
+import sqlite3
+import time
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+# Flush thresholds (checked at each commit point)
+WRITE_BATCH_ROWS = 500
+WRITE_BATCH_SECONDS = 5.0
+
+# Errors caused by the rows themselves rather than the database (a lock
+# or I/O error is raised as before, keeping the rows for the next flush)
+ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.InterfaceError, sqlite3.DataError)
+
+PRAGMAS = (
+    ("journal_mode", "WAL"),
+    ("synchronous", "NORMAL"),
+    ("cache_size", -64 * 1024),        # KiB when negative: 64 MiB page cache
+    ("mmap_size", 256 * 1024 * 1024),
+    ("busy_timeout", 10000),           # ms to wait for the app's locks
+    ("temp_store", "MEMORY"),
+    ("foreign_keys", "ON"),
+)
+
+
+def configure_connection(conn):
+    """Apply the pipeline's PRAGMA settings to a connection."""
+    for name, value in PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+class BatchWriter:
+    """
+    Buffered writer for one connection.
+
+        with BatchWriter(conn) as writer:
+            for unit in work:
+                for row in rows_for(unit):
+                    writer.add(INSERT_SQL, row)
+                writer.commit_point()
+
+    Statements run in the order they were added, within and across
+    units, so a unit may replace rows (DELETE, then INSERT) that an
+    earlier unit in the same flush wrote. Consecutive rows for the same
+    statement go to one executemany.
+    Leaving the `with` block flushes everything queued before the last
+    commit point, including when an exception (e.g. Ctrl-C) is raised;
+    rows added after the last commit point are discarded.
+
+    If a flush fails on a bad row (ROW_ERRORS: a broken constraint, a
+    value SQLite can't bind), it is retried one unit per transaction:
+    the units that fail again are logged and dropped, with nothing of
+    them written, and the others are kept. The writer carries on either
+    way; `units_dropped` counts the losses.
+    """
+
+    def __init__(self, conn, max_rows: int | None = None,
+                 max_seconds: float | None = None):
+        self.conn = conn
+        self.max_rows = max_rows or WRITE_BATCH_ROWS
+        self.max_seconds = max_seconds if max_seconds is not None else WRITE_BATCH_SECONDS
+        self.rows_written = 0
+        self.flushes = 0
+        self.units_dropped = 0
+        # Per unit: runs of consecutive rows for one statement, in order
+        self._committed: list[list[tuple[str, list[tuple]]]] = []
+        self._pending: list[tuple[str, list[tuple]]] = []
+        self._committed_count = 0
+        self._last_flush = time.monotonic()
+
+    def add(self, sql: str, params: tuple) -> None:
+        """Queue one row for the current unit of work."""
+        if self._pending and self._pending[-1][0] == sql:
+            self._pending[-1][1].append(params)
+        else:
+            self._pending.append((sql, [params]))
+
+    def commit_point(self) -> None:
+        """Mark the end of a unit; flush if a size/time threshold is reached."""
+        if self._pending:
+            self._committed.append(self._pending)
+            self._committed_count += sum(len(rows) for _, rows in self._pending)
+        self._pending = []
+        if (self._committed_count >= self.max_rows
+                or time.monotonic() - self._last_flush >= self.max_seconds):
+            self.flush()
+
+    def discard(self) -> None:
+        """Drop rows added since the last commit point (a failed unit)."""
+        self._pending = []
+
+    def flush(self) -> None:
+        """Write all committed rows in one transaction."""
+        self._last_flush = time.monotonic()
+        if not self._committed:
+            return
+        statements: list[tuple[str, list[tuple]]] = []
+        for unit in self._committed:
+            for sql, rows in unit:
+                if statements and statements[-1][0] == sql:
+                    statements[-1][1].extend(rows)
+                else:
+                    statements.append((sql, list(rows)))
+        written = self._committed_count
+        try:
+            with tracing.span("db_flush", rows=self._committed_count,
+                              statements=len(statements)), self.conn:
+                for sql, rows in statements:
+                    self.conn.executemany(sql, rows)
+        except ROW_ERRORS as e:
+            logger.warning(f"Flushing {self._committed_count} rows failed ({e}); "
+                           f"writing {len(self._committed)} units one at a time")
+            written = self._write_units()
+        logger.debug(f"Flushed {written} rows in {len(statements)} statements")
+        self.rows_written += written
+        self.flushes += 1
+        self._committed = []
+        self._committed_count = 0
+
+    def _write_units(self) -> int:
+        """Write each committed unit in its own transaction, dropping failures."""
+        written = 0
+        for unit in self._committed:
+            count = sum(len(rows) for _, rows in unit)
+            try:
+                with self.conn:
+                    for sql, rows in unit:
+                        self.conn.executemany(sql, rows)
+            except ROW_ERRORS as e:
+                self.units_dropped += 1
+                logger.error(f"Dropped a unit of {count} rows that cannot be "
+                             f"written: {e}")
+                continue
+            written += count
+        return written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._pending = []
+        self.flush()
+        return False
@@ -0,0 +1,164 @@
+"""
+response_cache.py — Content-addressed on-disk cache for Claude responses.
+
+Responses are keyed by a SHA-256 of the prompt text plus the CLI options
+used to produce them, and stored in a small SQLite file next to the
+project's local.db. Entries expire after a TTL, and the least recently
+used entries are evicted once the cache grows past its size limit.
+
+Modes:
+    "readwrite"  check the cache first, store new responses (default)
+    "off"        bypass the cache entirely
+    "replay"     serve only from the cache; a miss raises CacheMiss
+                 (for replaying a pipeline run offline)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = Path(__file__).parent.parent / "claude_cache.db"
+DEFAULT_TTL_SECONDS = 30 * 24 * 3600
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+MODES = ("readwrite", "off", "replay")
+
+
+class CacheMiss(RuntimeError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+def cache_key(prompt: str, options: list[str] | tuple[str, ...]) -> str:
+    """Hash of the prompt plus the options that shape the response."""
+    payload = json.dumps({"options": list(options), "prompt": prompt},
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Thread-safe SQLite-backed cache with TTL and size-based LRU eviction."""
+
+    def __init__(self, path: str | Path | None = None,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 mode: str = "readwrite"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cache mode: {mode!r}")
+        self.path = Path(path or os.environ.get("CLAUDE_CACHE_PATH")
+                         or DEFAULT_CACHE_PATH)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_responses_accessed "
+                "ON responses(accessed_at)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, key: str, refresh: bool = False) -> str | None:
+        """
+        Return the cached response, or None (CacheMiss in replay mode).
+        With `refresh`, a cached response is ignored (except in replay
+        mode, which has nothing else to serve), so the caller asks again.
+        """
+        if self.mode == "off":
+            return None
+        if refresh and self.mode == "readwrite":
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is not None and self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                db.commit()
+                row = None
+            if row is not None:
+                db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                           (now, key))
+                db.commit()
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+        if self.mode == "replay":
+            raise CacheMiss(f"No cached response for key {key[:12]}")
+        return None
+
+    def put(self, key: str, response: str) -> None:
+        if self.mode != "readwrite":
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                """INSERT OR REPLACE INTO responses
+                   (key, response, size, created_at, accessed_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (key, response, size, now, now),
+            )
+            self._evict(db, now)
+            db.commit()
+
+    def invalidate(self, key: str) -> None:
+        """Drop an entry (e.g. a response that turned out to be unusable)."""
+        if self.mode != "readwrite":
+            return
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            db.commit()
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds:
+            db.execute("DELETE FROM responses WHERE created_at < ?",
+                       (now - self.ttl_seconds,))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until we're back under the limit
+        excess = total - self.max_bytes
+        victims = []
+        for key, size in db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at"):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", victims)
+        logger.debug(f"Evicted {len(victims)} cached responses (size limit)")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
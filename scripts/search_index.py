@@ -0,0 +1,228 @@
+"""
+search_index.py — Local full-text search over transcripts, summaries and
+key moments.
+
+An FTS5 table holds three kinds of rows per video:
+    transcript  overlapping ~CHUNK_SECONDS runs of consecutive entries
+    summary     the talk summary, themes and key quotes
+    moment      each video_key_moments quote
+
+Queries are ranked with FTS5's built-in BM25. A transcript hit is mapped
+back to entry-level timestamps by matching the query against the chunk's
+entries with correct_timestamps(), the same alignment the pipeline uses
+for clip and key moment quotes.
+
+The index is kept in sync per video: `search_index_state` stores a cheap
+signature of each video's indexed inputs (transcript id/fetch time,
+summary time, key moment ids and times), and sync() reindexes only the
+videos whose signature changed. The pipeline syncs after each phase that
+writes indexed data, and the search command syncs before querying.
+"""
+
+import logging
+import re
+
+from fingerprints import digest
+from text_utils import correct_timestamps
+from transcript_store import load_transcripts
+from transcript_windows import time_windows
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SECONDS = 30.0  # transcript chunk length; chunks overlap by half
+DEFAULT_LIMIT = 20
+KINDS = ("transcript", "summary", "moment")
+
+
+def ensure_tables(conn):
+    conn.executescript("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+            text,
+            kind UNINDEXED,
+            video_id UNINDEXED,
+            first_entry UNINDEXED,
+            last_entry UNINDEXED,
+            start_time UNINDEXED,
+            end_time UNINDEXED,
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        );
+
+        CREATE TABLE IF NOT EXISTS search_index_state (
+            video_id INTEGER PRIMARY KEY,
+            signature TEXT NOT NULL
+        );
+    """)
+
+
+INSERT_SQL = """
+    INSERT INTO search_fts
+    (text, kind, video_id, first_entry, last_entry, start_time, end_time)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _signatures(conn) -> dict[int, str]:
+    rows = conn.execute("""
+        SELECT v.id, t.id, t.fetched_at, vs.summarized_at,
+               km.n, km.max_id, km.starts, km.ends
+        FROM videos v
+        LEFT JOIN transcripts t ON t.video_id = v.id
+        LEFT JOIN video_summaries vs ON vs.video_id = v.id
+        LEFT JOIN (
+            SELECT video_id, COUNT(*) AS n, MAX(id) AS max_id,
+                   TOTAL(start_time) AS starts, TOTAL(end_time) AS ends
+            FROM video_key_moments GROUP BY video_id
+        ) km ON km.video_id = v.id
+        WHERE t.id IS NOT NULL OR vs.id IS NOT NULL OR km.n IS NOT NULL
+    """).fetchall()
+    return {r[0]: digest(*r[1:]) for r in rows}
+
+
+def chunk_entries(entries: list[dict]) -> list[tuple[int, int]]:
+    """
+    Entry ranges [first, last) covering about CHUNK_SECONDS each, starting
+    every CHUNK_SECONDS / 2 so a phrase on a chunk boundary is still
+    indexed whole in the neighbouring chunk.
+    """
+    return time_windows(entries, CHUNK_SECONDS, CHUNK_SECONDS / 2)
+
+
+def _index_rows(conn, video_ids: list[int]) -> list[tuple]:
+    rows = []
+    transcripts = load_transcripts(conn, video_ids)
+    for vid_id, transcript in transcripts.items():
+        entries = transcript.entries
+        for first, last in chunk_entries(entries):
+            end_entry = entries[last - 1]
+            rows.append((
+                " ".join(e.get("text", "") for e in entries[first:last]),
+                "transcript", vid_id, first, last,
+                entries[first]["start"],
+                end_entry["start"] + end_entry.get("duration", 2.0),
+            ))
+
+    marks = ",".join("?" * len(video_ids))
+    for vid_id, summary, themes, key_quotes in conn.execute(
+            f"SELECT video_id, summary, themes, key_quotes FROM video_summaries "
+            f"WHERE video_id IN ({marks})", video_ids):
+        text = "\n".join(part for part in (summary, themes, key_quotes) if part)
+        rows.append((text, "summary", vid_id, None, None, None, None))
+
+    for vid_id, quote, start, end in conn.execute(
+            f"SELECT video_id, quote_text, start_time, end_time FROM video_key_moments "
+            f"WHERE video_id IN ({marks})", video_ids):
+        rows.append((quote, "moment", vid_id, None, None, start, end))
+    return rows
+
+
+def sync(conn, rebuild: bool = False) -> int:
+    """Reindex videos whose inputs changed; returns how many were reindexed."""
+    ensure_tables(conn)
+    if rebuild:
+        with conn:
+            conn.execute("DELETE FROM search_fts")
+            conn.execute("DELETE FROM search_index_state")
+
+    current = _signatures(conn)
+    stored = dict(conn.execute("SELECT video_id, signature FROM search_index_state"))
+    changed = [v for v, sig in current.items() if stored.get(v) != sig]
+    removed = [v for v in stored if v not in current]
+    if not changed and not removed:
+        return 0
+
+    # Build rows before the write transaction (loading transcripts may
+    # commit repacked sidecar rows); chunks stay well under SQLite's
+    # bound-parameter limit
+    rows = []
+    for chunk_start in range(0, len(changed), 500):
+        rows.extend(_index_rows(conn, changed[chunk_start:chunk_start + 500]))
+
+    with conn:
+        conn.executemany("DELETE FROM search_fts WHERE video_id = ?",
+                         [(v,) for v in changed + removed])
+        conn.executemany("DELETE FROM search_index_state WHERE video_id = ?",
+                         [(v,) for v in removed])
+        conn.executemany(INSERT_SQL, rows)
+        conn.executemany(
+            "INSERT OR REPLACE INTO search_index_state (video_id, signature) "
+            "VALUES (?, ?)",
+            [(v, current[v]) for v in changed],
+        )
+    logger.debug(f"Search index: reindexed {len(changed)} videos, "
+                 f"dropped {len(removed)}")
+    return len(changed) + len(removed)
+
+
+def fts_queries(text: str) -> list[str]:
+    """
+    FTS5 queries for free text, best first: the exact phrase, then all
+    of its words anywhere in the row.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return []
+    queries = [" ".join(f'"{w}"' for w in words)]
+    if len(words) > 1:
+        queries.insert(0, '"' + " ".join(words) + '"')
+    return queries
+
+
+def search(conn, text: str, limit: int = DEFAULT_LIMIT,
+           kinds: tuple[str, ...] = KINDS) -> list[dict]:
+    """
+    Ranked hits for `text` as dicts with youtube_id, title, kind,
+    start_time, end_time (None for summary hits that can't be located in
+    the transcript) and snippet.
+    """
+    marks = ",".join("?" * len(kinds))
+    rows = []
+    seen_rows = set()
+    # Phrase matches rank ahead of rows that merely contain every word
+    for query in fts_queries(text):
+        for row in conn.execute(f"""
+            SELECT f.rowid, f.kind, f.video_id, f.first_entry, f.last_entry,
+                   f.start_time, f.end_time,
+                   snippet(search_fts, 0, '[', ']', '...', 12),
+                   v.youtube_id, v.title
+            FROM search_fts f
+            JOIN videos v ON v.id = f.video_id
+            WHERE search_fts MATCH ? AND f.kind IN ({marks})
+            ORDER BY bm25(search_fts)
+            LIMIT ?
+        """, (query, *kinds, limit * 2)):
+            if row[0] not in seen_rows:
+                seen_rows.add(row[0])
+                rows.append(row[1:])
+        if len(rows) >= limit * 2:
+            break
+
+    transcripts = load_transcripts(conn, [r[1] for r in rows if r[0] != "moment"])
+    hits = []
+    seen = set()
+    for kind, vid_id, first, last, start, end, snippet, yt_id, title in rows:
+        transcript = transcripts.get(vid_id)
+        if kind == "transcript" and transcript:
+            span = correct_timestamps(text, transcript.entries[first:last])
+            if span:
+                start, end = span
+        elif kind == "summary" and transcript:
+            span = correct_timestamps(text, transcript.index)
+            if span:
+                start, end = span
+
+        # Overlapping chunks can report the same passage twice
+        key = (kind, vid_id, None if start is None else round(start))
+        if key in seen:
+            continue
+        seen.add(key)
+        hits.append({
+            "youtube_id": yt_id,
+            "title": title,
+            "kind": kind,
+            "start_time": start,
+            "end_time": end,
+            "snippet": snippet.replace("\n", " "),
+        })
+        if len(hits) >= limit:
+            break
+    return hits
@@ -0,0 +1,255 @@
+"""
+tag_classifier.py — Local category tagger trained on Claude's tags.
+
+Phase 2 pass 3 used to send every untagged video to Claude, although the
+videos tagged so far are labeled examples of the same task. This module
+fits a linear model on them: one-vs-rest logistic regression (plain SGD
+with L2) over sparse features of each talk's summary words, theme words
+and whole theme phrases, TF-IDF weighted and unit length. Pure Python;
+a few hundred videos train in a second or two.
+
+For a new video the model gives each category a probability of applying.
+The most likely one is the primary, the others at SECONDARY_PROBABILITY
+or more are secondaries, and the probabilities are the relevance scores.
+A prediction's confidence is that of its least certain yes/no decision;
+only videos at `threshold` or more (CONFIDENCE_THRESHOLD, --tag-confidence)
+are tagged locally, the rest still go to Claude.
+
+Every HOLDOUT_EVERY-th video (by a hash of its id, so the split is stable)
+is held out of training and used to report the model's accuracy: how
+often its primary matches Claude's, overall and among the confident
+predictions, and how many of them were confident.
+
+Only Claude's tags are training data. Videos tagged here are recorded
+in the pipeline-owned `local_tags` table and left out, so the model never
+learns from its own guesses. Each record keeps the threshold and the
+signature of the model that made it (a digest of its training data and
+settings); once either changes, the video is predicted again, and goes
+to Claude if the new model is not confident about it.
+"""
+
+import math
+import random
+from collections import Counter
+from datetime import datetime, timezone
+
+from fingerprints import digest
+from text_utils import normalize_text
+from transcript_windows import STOPWORDS
+
+CONFIDENCE_THRESHOLD = 0.8
+SECONDARY_PROBABILITY = 0.5
+MIN_TRAINING_VIDEOS = 30  # fewer labeled videos: everything goes to Claude
+HOLDOUT_EVERY = 5         # every 5th video is held out for evaluation
+EPOCHS = 30
+LEARNING_RATE = 2.0
+L2 = 1e-4
+SEED = 1234
+
+
+def ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS local_tags (
+            video_id INTEGER PRIMARY KEY REFERENCES videos(id) ON DELETE CASCADE,
+            confidence REAL NOT NULL,
+            threshold REAL NOT NULL,
+            model TEXT NOT NULL,
+            tagged_at TEXT NOT NULL
+        )
+    """)
+
+
+RECORD_SQL = """
+    INSERT OR REPLACE INTO local_tags (video_id, confidence, threshold, model, tagged_at)
+    VALUES (?, ?, ?, ?, ?)
+"""
+FORGET_SQL = "DELETE FROM local_tags WHERE video_id = ?"
+
+
+def record_params(video_id: int, confidence: float, threshold: float,
+                  model: "TagClassifier") -> tuple:
+    """Parameters for RECORD_SQL."""
+    return (video_id, round(confidence, 3), threshold, model.signature,
+            datetime.now(timezone.utc).isoformat())
+
+
+def load(conn) -> dict[int, tuple[float, str]]:
+    """Locally tagged videos, as {video_id: (threshold, model signature)}."""
+    return {vid: (threshold, model) for vid, threshold, model in conn.execute(
+        "SELECT video_id, threshold, model FROM local_tags")}
+
+
+def clear(conn) -> None:
+    """Forget which videos were tagged locally (e.g. when tags are reset)."""
+    conn.execute("DELETE FROM local_tags")
+
+
+def configure(threshold: float | None = None) -> None:
+    """Set the confidence a prediction needs to skip Claude."""
+    global CONFIDENCE_THRESHOLD
+    if threshold is not None:
+        CONFIDENCE_THRESHOLD = threshold
+
+
+def _words(normalized: str) -> list[str]:
+    return [w for w in normalized.split()
+            if len(w) > 2 and w not in STOPWORDS and not w.isdigit()]
+
+
+def features(themes: list[str], summary: str | None) -> Counter:
+    """Raw feature counts of a talk: summary words, theme words, theme phrases."""
+    counts = Counter(_words(normalize_text(summary or "")))
+    for theme in themes:
+        phrase = normalize_text(theme)
+        if phrase:
+            counts["theme:" + phrase] += 1
+            counts.update("t:" + w for w in _words(phrase))
+    return counts
+
+
+def held_out(video_id: int) -> bool:
+    """Whether a video belongs to the evaluation split."""
+    return int(digest(video_id)[:8], 16) % HOLDOUT_EVERY == 0
+
+
+def _sigmoid(z: float) -> float:
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+class TagClassifier:
+    """
+    One-vs-rest logistic regression over `slugs`.
+
+        model = TagClassifier(slugs)
+        model.fit(feature_counts, category_sets)
+        primary, secondaries, scores, confidence = model.predict(counts)
+    """
+
+    def __init__(self, slugs: list[str]):
+        self.slugs = list(slugs)
+        self.idf: dict[str, float] = {}
+        self.weights: dict[str, list[float]] = {}
+        self.bias = [0.0] * len(self.slugs)
+        self.signature = ""  # digest of the training data and settings
+
+    def _vector(self, counts: Counter) -> dict[str, float]:
+        vec = {f: (1.0 + math.log(c)) * self.idf[f]
+               for f, c in counts.items() if f in self.idf}
+        norm = math.sqrt(sum(v * v for v in vec.values())) or 1.0
+        return {f: v / norm for f, v in vec.items()}
+
+    def fit(self, docs: list[Counter], labels: list[set[str]]) -> "TagClassifier":
+        self.signature = digest(
+            self.slugs, EPOCHS, LEARNING_RATE, L2, SEED, SECONDARY_PROBABILITY,
+            [[sorted(counts.items()), sorted(cats)] for counts, cats in zip(docs, labels)])
+        df = Counter(f for counts in docs for f in counts)
+        n = len(docs)
+        # Features seen once can't generalize; they only memorize a video
+        self.idf = {f: math.log(n / d) + 1.0 for f, d in df.items() if d > 1}
+        vectors = [self._vector(counts) for counts in docs]
+        targets = [[1.0 if s in cats else 0.0 for s in self.slugs] for cats in labels]
+        k = len(self.slugs)
+        self.weights = {f: [0.0] * k for f in self.idf}
+        bias = self.bias = [0.0] * k
+
+        order = list(range(n))
+        rng = random.Random(SEED)
+        for epoch in range(EPOCHS):
+            rng.shuffle(order)
+            rate = LEARNING_RATE / (1.0 + epoch / 10)
+            for i in order:
+                vec, y = vectors[i], targets[i]
+                z = bias[:]
+                for f, v in vec.items():
+                    w = self.weights[f]
+                    for j in range(k):
+                        z[j] += v * w[j]
+                g = [_sigmoid(z[j]) - y[j] for j in range(k)]
+                for f, v in vec.items():
+                    w = self.weights[f]
+                    for j in range(k):
+                        w[j] -= rate * (g[j] * v + L2 * w[j])
+                for j in range(k):
+                    bias[j] -= rate * g[j]
+        return self
+
+    def probabilities(self, counts: Counter) -> dict[str, float]:
+        z = self.bias[:]
+        for f, v in self._vector(counts).items():
+            w = self.weights[f]
+            for j in range(len(z)):
+                z[j] += v * w[j]
+        return {s: _sigmoid(zj) for s, zj in zip(self.slugs, z)}
+
+    def predict(self, counts: Counter) -> tuple[str, list[str], dict[str, float], float]:
+        """(primary slug, secondary slugs, relevance scores, confidence)."""
+        probs = self.probabilities(counts)
+        primary = max(self.slugs, key=lambda s: probs[s])
+        secondaries = [s for s in self.slugs
+                       if s != primary and probs[s] >= SECONDARY_PROBABILITY]
+        confidence = min([probs[primary]] + [max(p, 1.0 - p) for s, p in probs.items()
+                                             if s != primary])
+        scores = {s: round(probs[s], 2) for s in [primary] + secondaries}
+        return primary, secondaries, scores, confidence
+
+
+def train(examples: list[tuple], slugs: list[str],
+          threshold: float | None = None) -> tuple["TagClassifier | None", dict]:
+    """
+    Fit a model on (video_id, feature counts, primary slug, category slugs)
+    examples outside the held-out split and evaluate it on the rest.
+    Returns (model, or None if there are too few examples, and the
+    evaluate() report).
+    """
+    fit_on = [e for e in examples if not held_out(e[0])]
+    test_on = [e for e in examples if held_out(e[0])]
+    if len(fit_on) < MIN_TRAINING_VIDEOS:
+        report = evaluate(None, [], threshold)
+        report["trained"] = len(fit_on)
+        return None, report
+    model = TagClassifier(slugs).fit([e[1] for e in fit_on], [e[3] for e in fit_on])
+    report = evaluate(model, test_on, threshold)
+    report["trained"] = len(fit_on)
+    return model, report
+
+
+def evaluate(model: "TagClassifier | None", examples: list[tuple],
+             threshold: float | None = None) -> dict:
+    """
+    Score `model` on train()-style examples: "held_out" (how many),
+    "accuracy" (primary matches), "confident" (how many at `threshold`)
+    and "confident_accuracy"; accuracies are None with nothing to measure.
+    """
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+    report = {"held_out": len(examples), "accuracy": None, "threshold": threshold,
+              "confident": 0, "confident_accuracy": None}
+    if model is None or not examples:
+        return report
+    correct = confident = confident_correct = 0
+    for _, counts, primary, _ in examples:
+        guess, _, _, confidence = model.predict(counts)
+        correct += guess == primary
+        if confidence >= threshold:
+            confident += 1
+            confident_correct += guess == primary
+    report["accuracy"] = correct / len(examples)
+    report["confident"] = confident
+    if confident:
+        report["confident_accuracy"] = confident_correct / confident
+    return report
+
+
+def describe(report: dict) -> str:
+    """One-line summary of a train() report."""
+    if report["accuracy"] is None:
+        return (f"trained on {report['trained']} videos, "
+                "no held-out videos to evaluate on")
+    text = (f"trained on {report['trained']} videos; held-out primary accuracy "
+            f"{report['accuracy']:.0%} over {report['held_out']}, "
+            f"{report['confident']} at confidence >= {report['threshold']:g}")
+    if report["confident_accuracy"] is not None:
+        text += f" ({report['confident_accuracy']:.0%} correct)"
+    return text
@@ -10,9 +10,27 @@ Usage:
     python scripts/tedx_pipeline.py phase2              # Summarize + categorize + tag (requires Claude CLI)
     python scripts/tedx_pipeline.py phase3              # Find clips per category (requires Claude CLI)
     python scripts/tedx_pipeline.py phase4              # Extract key moments per video (requires Claude CLI)
-    python scripts/tedx_pipeline.py run-all             # All phases
+    python scripts/tedx_pipeline.py run-all             # All phases, overlapping where inputs allow
+    python scripts/tedx_pipeline.py stream --event ID   # One event's videos, each through phases 1, 2 and 4 as it goes
     python scripts/tedx_pipeline.py status              # Show pipeline status
+    python scripts/tedx_pipeline.py search "QUERY"      # Full-text search transcripts/summaries/moments
+    python scripts/tedx_pipeline.py embed               # Build the offline semantic index (needs numpy)
+    python scripts/tedx_pipeline.py similar --clip ID   # "More clips like this", no API calls
     python scripts/tedx_pipeline.py reset --phase N     # Reset a phase
+    python scripts/tedx_pipeline.py compact-transcripts # One-shot: compact stored transcript entries
+    python scripts/tedx_pipeline.py profile TRACE       # Summarize a --trace file per stage
+
+Global options (before the command):
+    --concurrency N     Max Claude calls in flight at once (shared rate limit)
+    --workers N         Processes for transcript encoding, clip excerpts and
+                        timestamp alignment in phases 1, 3 and 4 (default 1:
+                        in-process); phase 2 always runs in-process
+    --no-cache          Always call Claude, ignoring cached responses
+    --cache-replay      Serve Claude calls only from the response cache (offline)
+    --claude-backend B  pool (default: persistent CLI sessions), subprocess, http or
+                        fake (see claude_api.py; default: $CLAUDE_BACKEND)
+    --trace PATH        Append per-stage timing spans to a JSONL file
+                        (default: $PIPELINE_TRACE; off when unset)
 """
 
 import argparse
@@ -21,6 +39,8 @@ import logging
 import os
 import sys
 import time
+from concurrent.futures import wait
+from contextlib import closing
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -33,9 +53,27 @@ if sys.platform == "win32":
 # Add scripts dir to path for local imports
 sys.path.insert(0, str(Path(__file__).parent))
 
-from transcript_api import get_transcript, format_timestamp
-from claude_api import call_claude, call_claude_json
-from text_utils import correct_timestamps
+from transcript_api import TranscriptFetcher, format_timestamp
+import claude_api
+from claude_api import call_claude, call_claude_json, map_claude_items, map_claude_json
+from text_utils import correct_timestamps, normalize_text
+import transcript_store
+from transcript_store import load_transcripts
+import fingerprints
+import job_queue
+from fingerprints import digest, template_version
+import search_index
+import tag_classifier
+import theme_clusters
+import tracing
+from pipeline_db import BatchWriter, configure_connection
+from pipeline_dag import Stage, run_dag, run_stream
+from worker_pool import WorkerPool
+import worker_pool
+from batch_planner import CHARS_PER_TOKEN, estimate_tokens, plan_batches
+from transcript_windows import (
+    WindowQuery, iter_excerpt_lines, iter_range_lines, merge_ranges,
+)
 
 # ─── Database Connection ──────────────────────────────────────────────
 
@@ -52,7 +90,7 @@ def get_db():
         sys.exit(1)
 
     conn = sqlite3.connect(str(full_path))
-    conn.execute("PRAGMA foreign_keys = ON")
+    configure_connection(conn)  # WAL, foreign keys, cache/mmap sizing
     return conn
 
 
@@ -118,6 +156,10 @@ def ensure_tables(conn):
             generated_at TEXT NOT NULL
         );
     """)
+    transcript_store.ensure_table(conn)
+    fingerprints.ensure_table(conn)
+    job_queue.ensure_table(conn)
+    tag_classifier.ensure_table(conn)
     conn.commit()
 
 
@@ -142,15 +184,217 @@ def progress(current: int, total: int, prefix: str = ""):
     print(f"\r{prefix} [{bar}] {current}/{total} ({pct:.0%})", end="", flush=True)
 
 
+# ─── Job Queue ────────────────────────────────────────────────────────
+
+JOB_LEASE_SIZE = 50  # units a worker claims from the job queue at a time
+
+
+def leased_chunks(writer, stage: str, work: dict, rows, logger, label: str):
+    """
+    Queue `rows` as `stage` jobs (keyed by their first column, with input
+    fingerprints from `work`) and yield the chunks of them this process
+    leases, until there are none left to claim. Everything written so
+    far is flushed before each claim, and unfinished leases are handed
+    back at the end, including on Ctrl-C; close() the generator when
+    leaving it early.
+    """
+    conn = writer.conn
+    given_up = set(job_queue.enqueue(conn, stage, {r[0]: work.get(r[0]) for r in rows}))
+    if given_up:
+        logger.info(f"  Skipping {len(given_up)} {label} jobs that failed before "
+                    f"(unchanged since)")
+    remaining = {r[0]: r for r in rows if r[0] not in given_up}
+    try:
+        while remaining:
+            writer.flush()
+            leased = job_queue.lease(conn, stage, list(remaining), JOB_LEASE_SIZE)
+            if not leased:
+                logger.info(f"  {len(remaining)} {label} jobs are leased by "
+                            f"other workers")
+                break
+            yield [remaining.pop(key) for key in leased]
+    finally:
+        writer.flush()
+        job_queue.release(conn, stage)
+
+
+# ─── Streamed Per-Video Batches ───────────────────────────────────────
+
+ITEM_ATTEMPTS = 3  # failures per video before its job is marked failed
+
+
+def _item_video_id(item):
+    vid_id = item.get("video_id") if isinstance(item, dict) else None
+    if isinstance(vid_id, str) and vid_id.isdigit():
+        vid_id = int(vid_id)
+    return vid_id
+
+
+def stream_video_results(rows, build_jobs, writer, stage: str, input_fps: dict,
+                         timeout: int, logger, label: str, progress_label: str,
+                         pool=None, prepare=None):
+    """
+    Run batch prompts whose answers are JSON arrays of per-video items,
+    yielding (row, items) for each video as soon as its items have
+    arrived, while other answers are still streaming.
+
+    `rows` start with the video id. They are queued as `stage` jobs and
+    worked through in leased chunks (see leased_chunks); the caller's
+    unit for a yielded video also marks its job done. Within a chunk,
+    build_jobs(rows) packs them into (batch_rows, prompt) jobs. A video's
+    items are complete once its answer moves on to another video or ends
+    cleanly. A video is yielded again if an answer comes back to it after
+    other videos.
+
+    Videos without a result are retried in rounds. The videos left out of
+    a failed answer (timeout, error, cut short) are split into two halves
+    requested separately, so a video that breaks its batch ends up alone;
+    those an otherwise good answer skipped are re-batched together. Only
+    a failure on its own or a skip counts against a video's ITEM_ATTEMPTS
+    budget. Videos out of attempts have their job marked failed, which
+    later runs skip until the video's input_fps fingerprint changes.
+
+    With `prepare`, each video's items first go through the pool task
+    prepare(conn, row, items), and what it returns is yielded in their
+    place, while the answers keep streaming.
+    """
+    attempts = dict.fromkeys((r[0] for r in rows), 0)
+    done_ids = set()
+    dead = []
+    preparing = {}  # future -> row
+
+    def finished(block: bool):
+        ready = (wait(preparing).done if block
+                 else [f for f in preparing if f.done()])
+        for future in ready:
+            row = preparing.pop(future)
+            if future.exception() is not None:
+                logger.error(f"  Preparing {label} of video {row[0]} failed: "
+                             f"{future.exception()}")
+                continue
+            writer.add(job_queue.DONE_SQL, job_queue.done_params(stage, row[0]))
+            yield row, future.result()
+
+    chunks = leased_chunks(writer, stage, input_fps, rows, logger, label)
+    try:
+        for chunk in chunks:
+            groups = [chunk]
+            first_round = True
+            while groups:
+                jobs = [job for group in groups for job in build_jobs(group)]
+                retrying = sum(len(g) for g in groups)
+                if retrying == len(chunk):
+                    logger.info(f"  {len(chunk)} videos in {len(jobs)} calls")
+                else:
+                    print()
+                    logger.info(f"  Retrying {retrying} videos in {len(jobs)} calls")
+
+                batch_rows = [{r[0]: r for r in batch} for batch, _ in jobs]
+                streaming = {}  # job -> (row, items) of the video in progress
+                failed = {}     # job -> error
+                # Retries ask Claude again: a cached answer that skipped or
+                # broke on a video would only repeat itself
+                for job, event, value in map_claude_items(
+                        [(i, prompt) for i, (_, prompt) in enumerate(jobs)],
+                        timeout=timeout, refresh=not first_round):
+                    if event == "item":
+                        row = batch_rows[job].get(_item_video_id(value))
+                        if row is None:
+                            logger.warning(f"  Ignoring {label} item for a video "
+                                           f"not in the batch: {str(value)[:80]}")
+                            continue
+                        open_row, items = streaming.get(job, (None, None))
+                        if open_row is row:
+                            items.append(value)
+                            continue
+                        streaming[job] = (row, [value])
+                        if open_row is None:
+                            continue
+                    else:
+                        open_row, items = streaming.pop(job, (None, None))
+                        if value is not None:
+                            # The video in progress may be missing items; drop it
+                            failed[job] = str(value)
+                            logger.error(f"  Batch {label} failed: {value}")
+                            continue
+                        if open_row is None:
+                            continue
+                    done_ids.add(open_row[0])
+                    progress(len(done_ids), len(rows), progress_label)
+                    if prepare is not None:
+                        preparing[pool.submit(prepare, open_row, items)] = open_row
+                        yield from finished(block=False)
+                        continue
+                    writer.add(job_queue.DONE_SQL,
+                               job_queue.done_params(stage, open_row[0]))
+                    yield open_row, items
+                yield from finished(block=True)
+
+                first_round = False
+                groups = []
+                skipped = []
+                for job, (batch, prompt) in enumerate(jobs):
+                    missing = [r for r in batch if r[0] not in done_ids]
+                    if missing and job not in failed:
+                        # A complete answer that left videos out isn't worth
+                        # replaying on the next run either
+                        claude_api.forget_response(prompt)
+                    error = failed.get(job, "left out of the answer").strip()
+                    if job in failed and len(missing) > 1:
+                        half = len(missing) // 2
+                        groups.extend([missing[:half], missing[half:]])
+                        continue
+                    for r in missing:
+                        attempts[r[0]] += 1
+                        if attempts[r[0]] >= ITEM_ATTEMPTS:
+                            dead.append(r[0])
+                            writer.add(job_queue.GIVE_UP_SQL, job_queue.give_up_params(
+                                stage, r[0], attempts[r[0]], error))
+                    retry = [r for r in missing if attempts[r[0]] < ITEM_ATTEMPTS]
+                    if job in failed:
+                        groups.extend([r] for r in retry)
+                    else:
+                        skipped.extend(retry)
+                if skipped:
+                    groups.append(skipped)
+                writer.commit_point()
+    finally:
+        chunks.close()
+
+    print()
+    if dead:
+        logger.warning(f"  Gave up on {len(dead)} videos after {ITEM_ATTEMPTS} "
+                       f"{label} attempts: {', '.join(str(v) for v in dead[:20])}")
+
+
 # ═══════════════════════════════════════════════════════════════════════
 # PHASE 1: Transcript Collection
 # ═══════════════════════════════════════════════════════════════════════
 
-TRANSCRIPT_DELAY = 1.0  # seconds between YouTube API calls
+TRANSCRIPT_DELAY = 1.0  # initial seconds between YouTube requests (adapts)
+TRANSCRIPT_WORKERS = 4
+TRANSCRIPT_WRITE_BATCH = 20  # transcripts per write transaction
+TRANSCRIPT_JOBS = "transcript"  # job queue stage
+
+TRANSCRIPT_INSERT_SQL = """
+    INSERT INTO transcripts
+    (video_id, language, is_generated, word_count, full_text, entries, fetched_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _encode_transcript_task(conn, data: dict | None) -> tuple | None:
+    """Worker task: (word count, entries JSON, packed sidecar) of a fetch."""
+    if data is None:
+        return None  # the fetch failed
+    return (len(data['text'].split()),
+            transcript_store.encode_entries(data['entries']),
+            transcript_store.pack_entries(data['entries']))
 
 
-def run_phase1(conn):
-    """Fetch transcripts for all videos that don't have one yet."""
+def run_phase1(conn, workers: int = TRANSCRIPT_WORKERS,
+               pool: WorkerPool | None = None, video_ids=None):
+    """Fetch transcripts for all videos (or `video_ids`) that don't have one yet."""
     logger = logging.getLogger("phase1")
 
     # Get all videos — skip entertainment (musical/dance performances etc.
@@ -159,12 +403,17 @@ def run_phase1(conn):
         "SELECT id, youtube_id, title FROM videos "
         "WHERE format != 'entertainment' ORDER BY id"
     ).fetchall()
+    wanted = set(video_ids) if video_ids is not None else None
+    if wanted is not None:
+        rows = [r for r in rows if r[0] in wanted]
 
     # Get videos that already have transcripts
     done_rows = conn.execute(
         "SELECT video_id FROM transcripts"
     ).fetchall()
     done_ids = {r[0] for r in done_rows}
+    if wanted is not None:
+        done_ids &= wanted
 
     pending = [(r[0], r[1], r[2]) for r in rows if r[0] not in done_ids]
     total = len(rows)
@@ -174,37 +423,53 @@ def run_phase1(conn):
                 f"{total} total videos")
 
     stats = {"fetched": 0, "failed": 0, "skipped": already}
+    fetcher = TranscriptFetcher(workers=workers, initial_delay=TRANSCRIPT_DELAY)
+
+    # Fetches run on worker threads and are encoded and normalized on the
+    # worker processes, if any; inserts stay on this thread and are
+    # committed in batches (three rows per transcript: entries, packed
+    # and job state). Videos are claimed from the job queue in chunks; a
+    # failed fetch is retried by later runs up to job_queue.MAX_ATTEMPTS.
+    pool = pool or WorkerPool(conn)
+    done = 0
+    with BatchWriter(conn, max_rows=3 * TRANSCRIPT_WRITE_BATCH) as writer, \
+            closing(leased_chunks(writer, TRANSCRIPT_JOBS,
+                                  {r[0]: r[1] for r in pending}, pending,
+                                  logger, "transcript")) as chunks:
+        for chunk in chunks:
+            by_yt_id = {yt_id: (vid_id, title) for vid_id, yt_id, title in chunk}
+            fetched = (((yt_id, data, error), (data,))
+                       for yt_id, data, error in fetcher.fetch_many(by_yt_id))
+            for (yt_id, data, error), encoded, encode_error in pool.imap_unordered(
+                    _encode_transcript_task, fetched):
+                error = error or encode_error
+                done += 1
+                progress(done, len(pending), "Fetching transcripts")
+                vid_id, title = by_yt_id[yt_id]
+                if error is not None:
+                    logger.error(f"Failed [{yt_id}] {title}: {error}")
+                    writer.add(job_queue.RETRY_SQL, job_queue.retry_params(
+                        TRANSCRIPT_JOBS, vid_id, str(error)))
+                    writer.commit_point()
+                    stats["failed"] += 1
+                    continue
 
-    for i, (vid_id, yt_id, title) in enumerate(pending):
-        progress(i + 1, len(pending), "Fetching transcripts")
-
-        try:
-            data = get_transcript(yt_id)
-            now = datetime.now(timezone.utc).isoformat()
-            word_count = len(data['text'].split())
-
-            conn.execute(
-                """INSERT INTO transcripts
-                   (video_id, language, is_generated, word_count, full_text, entries, fetched_at)
-                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                (
+                word_count, entries_json, packed = encoded
+                now = datetime.now(timezone.utc).isoformat()
+                writer.add(TRANSCRIPT_INSERT_SQL, (
                     vid_id,
                     data['language'],
                     1 if data['is_generated'] else 0,
                     word_count,
                     data['text'],
-                    json.dumps(data['entries']),
+                    entries_json,
                     now,
-                ),
-            )
-            conn.commit()
-            stats["fetched"] += 1
-
-        except Exception as e:
-            logger.error(f"Failed [{yt_id}] {title}: {e}")
-            stats["failed"] += 1
-
-        time.sleep(TRANSCRIPT_DELAY)
+                ))
+                writer.add(transcript_store.PACKED_INSERT_SQL, transcript_store.packed_params(
+                    vid_id, now, packed))
+                writer.add(job_queue.DONE_SQL, job_queue.done_params(TRANSCRIPT_JOBS, vid_id))
+                writer.commit_point()
+                stats["fetched"] += 1
 
     print()  # newline after progress bar
     logger.info(f"Phase 1 complete: {stats}")
@@ -215,8 +480,12 @@ def run_phase1(conn):
 # PHASE 2: AI Categorization (3 passes)
 # ═══════════════════════════════════════════════════════════════════════
 
-SUMMARY_BATCH_SIZE = 3
-TRANSCRIPT_CHAR_LIMIT = 28000
+# Summarization calls are packed up to a transcript token budget rather
+# than a fixed count; a talk longer than the whole budget gets its own call
+# and is truncated to fit.
+SUMMARY_TOKEN_BUDGET = 21000
+SUMMARY_MAX_VIDEOS = 6
+TRANSCRIPT_CHAR_LIMIT = SUMMARY_TOKEN_BUDGET * CHARS_PER_TOKEN
 TAG_BATCH_SIZE = 5
 CATEGORY_COUNT_MIN = 8
 CATEGORY_COUNT_MAX = 15
@@ -239,11 +508,11 @@ Respond with ONLY a valid JSON array. No markdown, no explanation.
 {videos_block}
 """
 
-CATEGORY_DISCOVERY_PROMPT = """You are analyzing a collection of {count} TEDx talks from TEDxSTLouis spanning 15 years. Below are summaries and theme tags for every talk.
+CATEGORY_DISCOVERY_PROMPT = """You are analyzing a collection of {count} TEDx talks from TEDxSTLouis spanning 15 years. Their theme tags have been grouped into clusters of related themes; below is each cluster with how many talks it covers and a few example talk titles.
 
 Your task: Identify {min_cat}-{max_cat} EMERGENT CATEGORIES that meaningfully organize these talks. Categories should:
 1. Be discovered from the actual content (not predefined)
-2. Be broad enough that each category contains at least 5 talks
+2. Be broad enough that each category contains at least 5 talks (a category may combine several clusters, and a large cluster may split)
 3. Be specific enough to be useful for a video editor creating themed montages
 4. Have clear, evocative names (e.g., "Reimagining Education" not just "Education")
 5. Cover the full breadth of topics in the corpus
@@ -260,7 +529,37 @@ Respond with ONLY a valid JSON object:
   ]
 }}
 
---- ALL TALK SUMMARIES ---
+--- THEME CLUSTERS ---
+
+{clusters_block}
+"""
+
+# Incremental category expansion: a tagged video counts as unmatched when
+# its best relevance score is below UNMATCHED_RELEVANCE; a new category is
+# only proposed once NEW_CATEGORY_MIN_VIDEOS unmatched talks share a theme.
+UNMATCHED_RELEVANCE = 0.5
+NEW_CATEGORY_MIN_VIDEOS = 5
+
+NEW_CATEGORY_PROMPT = """You are maintaining the category set for a collection of TEDx talks from TEDxSTLouis. The talks below did not fit any existing category well.
+
+EXISTING CATEGORIES (do not duplicate these):
+{categories_block}
+
+Propose NEW categories only for groups of at least {min_videos} of these talks that share a clear theme not covered above. It is fine to propose none. Use the same style as the existing categories (evocative names, useful for themed montages).
+
+Respond with ONLY a valid JSON object:
+{{
+  "categories": [
+    {{
+      "slug": "slug-form-id",
+      "name": "Display Name",
+      "description": "1-2 sentence description of what unifies talks in this category",
+      "related_themes": ["theme1", "theme2"]
+    }}
+  ]
+}}
+
+--- UNMATCHED TALKS ---
 
 {summaries_block}
 """
@@ -283,55 +582,368 @@ Respond with ONLY a valid JSON array. No markdown.
 {videos_block}
 """
 
+SUMMARY_PROMPT_VERSION = template_version(SUMMARY_PROMPT)
+TAG_PROMPT_VERSION = template_version(TAG_PROMPT)
 
-def run_phase2(conn, force_categories: bool = False):
-    """Run all three passes of Phase 2."""
+
+def summary_fingerprint(transcript_hash: str) -> str:
+    return digest(SUMMARY_PROMPT_VERSION, transcript_hash)
+
+
+def category_set_hash(conn) -> str:
+    """Hash of the category definitions videos are tagged against."""
+    return digest(conn.execute(
+        "SELECT slug, name, description FROM categories ORDER BY slug"
+    ).fetchall())
+
+
+def tag_fingerprint(category_hash: str, themes: str | None, summary: str | None) -> str:
+    return digest(TAG_PROMPT_VERSION, category_hash, themes, summary)
+
+
+def _add_tags(writer, cat_lookup: dict, vid_id: int, primary_slug: str,
+              secondary_slugs: list, scores: dict) -> None:
+    """Queue statements replacing a video's tags (unknown slugs are dropped)."""
+    writer.add("DELETE FROM video_categories WHERE video_id = ?", (vid_id,))
+
+    # Insert primary
+    if primary_slug in cat_lookup:
+        writer.add(
+            """INSERT OR IGNORE INTO video_categories
+               (video_id, category_id, is_primary, relevance_score)
+               VALUES (?, ?, 1, ?)""",
+            (vid_id, cat_lookup[primary_slug], scores.get(primary_slug, 0.8)),
+        )
+
+    # Insert secondaries
+    for slug in secondary_slugs:
+        if slug in cat_lookup:
+            writer.add(
+                """INSERT OR IGNORE INTO video_categories
+                   (video_id, category_id, is_primary, relevance_score)
+                   VALUES (?, ?, 0, ?)""",
+                (vid_id, cat_lookup[slug], scores.get(slug, 0.5)),
+            )
+
+
+def tag_examples(conn) -> list[tuple]:
+    """
+    Training examples for tag_classifier.train(): the videos Claude tagged
+    from their current summary against the current categories.
+    """
+    category_hash = category_set_hash(conn)
+    stored = fingerprints.load(conn, fingerprints.TAGS)
+    local = tag_classifier.load(conn)
+    labels = {}  # video_id -> [primary slug, all slugs]
+    for vid_id, slug, is_primary in conn.execute("""
+        SELECT vc.video_id, c.slug, vc.is_primary
+        FROM video_categories vc
+        JOIN categories c ON c.id = vc.category_id
+    """):
+        label = labels.setdefault(vid_id, [None, set()])
+        label[1].add(slug)
+        if is_primary:
+            label[0] = slug
+
+    examples = []
+    for vid_id, themes, summary in conn.execute(
+            "SELECT video_id, themes, summary FROM video_summaries ORDER BY video_id"):
+        label = labels.get(vid_id)
+        fp = tag_fingerprint(category_hash, themes, summary)
+        if label is None or label[0] is None or vid_id in local \
+                or stored.get(vid_id, fp) != fp:
+            continue
+        examples.append((vid_id,
+                         tag_classifier.features(json.loads(themes) if themes else [],
+                                                 summary),
+                         label[0], label[1]))
+    return examples
+
+
+def _tag_locally(conn, tag_rows, local_rows=()) -> tuple[int, list]:
+    """
+    Tag the (video_id, title, themes, summary) rows the local classifier,
+    trained on Claude's tags so far, is confident about. `local_rows` were
+    tagged locally before; those tagged by another model or threshold are
+    predicted again. Returns (videos tagged, rows left for Claude).
+    """
+    logger = logging.getLogger("phase2")
+    cat_lookup = dict(conn.execute(
+        "SELECT slug, id FROM categories ORDER BY slug").fetchall())
+    with tracing.span("tag_local", videos=len(tag_rows)):
+        model, report = tag_classifier.train(tag_examples(conn), list(cat_lookup))
+        if model is None:
+            logger.info(f"  Local tagger: {report['trained']} Claude-tagged videos, "
+                        f"needs {tag_classifier.MIN_TRAINING_VIDEOS}; "
+                        "all videos go to Claude")
+            return 0, list(tag_rows) + list(local_rows)
+        logger.info(f"  Local tagger: {tag_classifier.describe(report)}")
+
+        category_hash = category_set_hash(conn)
+        threshold = tag_classifier.CONFIDENCE_THRESHOLD
+        recorded = tag_classifier.load(conn)
+        recheck = [r for r in local_rows
+                   if recorded.get(r[0]) != (threshold, model.signature)]
+        if recheck:
+            logger.info(f"  {len(recheck)} locally tagged videos predate this "
+                        "model or threshold; predicting them again")
+        tag_rows = list(tag_rows) + recheck
+        left = []
+        with BatchWriter(conn) as writer:
+            for row in tag_rows:
+                vid_id, _, themes, summary = row
+                primary, secondaries, scores, confidence = model.predict(
+                    tag_classifier.features(json.loads(themes) if themes else [],
+                                            summary))
+                if confidence < threshold:
+                    left.append(row)
+                    continue
+                _add_tags(writer, cat_lookup, vid_id, primary, secondaries, scores)
+                writer.add(fingerprints.UPSERT_SQL, fingerprints.params(
+                    fingerprints.TAGS, vid_id,
+                    tag_fingerprint(category_hash, themes, summary)))
+                writer.add(tag_classifier.RECORD_SQL, tag_classifier.record_params(
+                    vid_id, confidence, threshold, model))
+                writer.commit_point()
+        tracing.set_attrs(local=len(tag_rows) - len(left))
+    logger.info(f"  {len(tag_rows) - len(left)} tagged locally, {len(left)} below "
+                f"confidence {threshold:g} go to Claude")
+    return len(tag_rows) - len(left), left
+
+
+def _tag_videos(conn, tag_rows) -> int:
+    """
+    Tag (video_id, title, themes, summary) rows against all categories,
+    replacing any existing tags of the videos that come back.
+    """
     logger = logging.getLogger("phase2")
 
-    # ── Pass 1: Summarize ─────────────────────────────────────────────
-    logger.info("Phase 2 Pass 1: Summarizing videos...")
+    # Get categories
+    cat_rows = conn.execute(
+        "SELECT id, slug, name, description FROM categories"
+    ).fetchall()
+    cat_lookup = {r[1]: r[0] for r in cat_rows}  # slug -> id
+    category_hash = category_set_hash(conn)
+    current = {r[0]: tag_fingerprint(category_hash, r[2], r[3]) for r in tag_rows}
+
+    categories_block = "\n".join(
+        f"- {r[1]}: {r[2]} -- {r[3]}" for r in cat_rows
+    )
+
+    logger.info(f"  {len(tag_rows)} videos to tag")
+    tagged = 0
+    tagged_ids = set()
+
+    def tag_jobs(rows):
+        jobs = []
+        for batch_start in range(0, len(rows), TAG_BATCH_SIZE):
+            batch = rows[batch_start:batch_start + TAG_BATCH_SIZE]
+
+            blocks = []
+            for vid_id, title, themes, summary in batch:
+                themes_list = json.loads(themes) if themes else []
+                blocks.append(
+                    f"VIDEO_ID: {vid_id}\nTITLE: {title}\n"
+                    f"THEMES: {', '.join(themes_list)}\n"
+                    f"SUMMARY: {summary}"
+                )
+
+            videos_block = "\n---\n".join(blocks)
+            jobs.append((batch, TAG_PROMPT.format(
+                categories_block=categories_block,
+                videos_block=videos_block,
+            )))
+        return jobs
+
+    with tracing.span("tag", videos=len(tag_rows)), BatchWriter(conn) as writer:
+        for row, items in stream_video_results(
+                tag_rows, tag_jobs, writer, fingerprints.TAGS, current,
+                180, logger, "tagging", "  Tagging"):
+            vid_id = row[0]
+            if vid_id in tagged_ids:
+                continue  # tags replace each other; keep the first answer
+            tagged_ids.add(vid_id)
+            item = items[-1]
+            try:
+                _add_tags(writer, cat_lookup, vid_id,
+                          item.get("primary_category", ""),
+                          item.get("secondary_categories", []),
+                          item.get("relevance_scores", {}))
+
+                if vid_id in current:
+                    writer.add(fingerprints.UPSERT_SQL, fingerprints.params(
+                        fingerprints.TAGS, vid_id, current[vid_id]))
+                writer.add(tag_classifier.FORGET_SQL, (vid_id,))
+
+                writer.commit_point()
+                tagged += 1
+
+            except Exception as e:
+                writer.discard()
+                logger.error(f"  Tagging video {vid_id} failed: {e}")
+
+    return tagged
+
+
+def expand_categories(conn) -> list[int]:
+    """
+    Propose new categories for clusters of poorly matched videos.
+
+    Returns the ids of videos that should be re-tagged because new
+    categories were added for their cluster (empty if nothing crossed the
+    NEW_CATEGORY_MIN_VIDEOS threshold or Claude proposed nothing).
+    """
+    logger = logging.getLogger("phase2")
 
-    # Get videos with transcripts but no summaries (skip entertainment —
-    # defense in depth; phase 1 already skips, but this catches the case
-    # where someone manually fetches a transcript for an entertainment video).
     rows = conn.execute("""
+        SELECT vs.video_id, v.title, vs.themes, vs.summary,
+               MAX(vc.relevance_score) AS best
+        FROM video_summaries vs
+        JOIN videos v ON v.id = vs.video_id
+        LEFT JOIN video_categories vc ON vc.video_id = vs.video_id
+        GROUP BY vs.video_id
+        HAVING best IS NULL OR best < ?
+    """, (UNMATCHED_RELEVANCE,)).fetchall()
+    if len(rows) < NEW_CATEGORY_MIN_VIDEOS:
+        logger.info(f"  {len(rows)} unmatched videos, below threshold "
+                    f"({NEW_CATEGORY_MIN_VIDEOS})")
+        return []
+
+    by_id = {r[0]: r for r in rows}
+    themes_by_video = {r[0]: json.loads(r[2]) if r[2] else [] for r in rows}
+    clusters = [c for c in theme_clusters.cluster_themes(themes_by_video)
+                if len(c.video_ids) >= NEW_CATEGORY_MIN_VIDEOS]
+    if not clusters:
+        logger.info(f"  {len(rows)} unmatched videos, no shared theme reaches "
+                    f"{NEW_CATEGORY_MIN_VIDEOS} talks")
+        return []
+
+    candidate_ids = sorted(set().union(*(c.video_ids for c in clusters)))
+    logger.info(f"  {len(clusters)} theme clusters over {len(candidate_ids)} "
+                "unmatched videos; asking Claude for new categories")
+
+    cat_rows = conn.execute(
+        "SELECT slug, name, description FROM categories"
+    ).fetchall()
+    categories_block = "\n".join(f"- {r[0]}: {r[1]} -- {r[2]}" for r in cat_rows)
+    summaries_block = "\n---\n".join(
+        f"VIDEO: {by_id[vid][1]}\n"
+        f"THEMES: {', '.join(themes_by_video[vid])}\n"
+        f"SUMMARY: {(by_id[vid][3] or '')[:200]}\n"
+        for vid in candidate_ids
+    )
+    with tracing.span("expand", candidates=len(candidate_ids)):
+        result = call_claude_json(NEW_CATEGORY_PROMPT.format(
+            categories_block=categories_block,
+            min_videos=NEW_CATEGORY_MIN_VIDEOS,
+            summaries_block=summaries_block,
+        ), timeout=240)
+
+    added = 0
+    for cat in result.get("categories", []) if isinstance(result, dict) else []:
+        cur = conn.execute(
+            """INSERT OR IGNORE INTO categories (slug, name, description, related_themes)
+               VALUES (?, ?, ?, ?)""",
+            (
+                cat["slug"],
+                cat["name"],
+                cat.get("description", ""),
+                json.dumps(cat.get("related_themes", [])),
+            ),
+        )
+        added += cur.rowcount
+    conn.commit()
+    logger.info(f"  Added {added} new categories")
+    return candidate_ids if added else []
+
+
+def run_phase2(conn, force_categories: bool = False):
+    """
+    Run the passes of Phase 2.
+
+    Without --force this is incremental: only new videos are summarized
+    and tagged against the existing categories, and new categories are
+    proposed only when enough unmatched talks share a theme (pass 4).
+    Summaries and tags whose input fingerprint changed (re-fetched
+    transcript, edited prompt, changed category set) are redone.
+    """
+    summarized = summarize_videos(conn)
+    discovered = discover_categories(conn, force_categories)
+    tagged = tag_videos(conn, discovered)
+    return {"summarized": summarized, "tagged": tagged}
+
+
+def summarize_videos(conn, video_ids=None) -> int:
+    """
+    Phase 2 pass 1: summarize videos (among `video_ids`, if given) whose
+    summary is missing or stale.
+    """
+    logger = logging.getLogger("phase2")
+    logger.info("Phase 2 Pass 1: Summarizing videos...")
+
+    # Get videos with transcripts but no summary, or a summary of an older
+    # transcript/prompt (skip entertainment — defense in depth; phase 1
+    # already skips, but this catches the case where someone manually
+    # fetches a transcript for an entertainment video).
+    candidates = conn.execute("""
+        SELECT t.video_id FROM transcripts t
+        JOIN videos v ON v.id = t.video_id
+        WHERE v.format != 'entertainment'
+        ORDER BY t.video_id
+    """).fetchall()
+    if video_ids is not None:
+        wanted = set(video_ids)
+        candidates = [r for r in candidates if r[0] in wanted]
+    transcript_hashes = fingerprints.transcript_hashes(conn, [r[0] for r in candidates])
+    summary_fps = {r[0]: summary_fingerprint(transcript_hashes[r[0]])
+                   for r in candidates}
+    stale = set(fingerprints.select_stale(
+        conn, fingerprints.SUMMARY, summary_fps,
+        (r[0] for r in conn.execute("SELECT video_id FROM video_summaries")),
+    ))
+    rows = [r for r in conn.execute("""
         SELECT t.video_id, v.youtube_id, v.title, t.full_text
         FROM transcripts t
         JOIN videos v ON v.id = t.video_id
-        LEFT JOIN video_summaries vs ON vs.video_id = t.video_id
-        WHERE vs.id IS NULL AND v.format != 'entertainment'
         ORDER BY t.video_id
-    """).fetchall()
+    """) if r[0] in stale]
 
     logger.info(f"  {len(rows)} videos to summarize")
     summarized = 0
 
-    for batch_start in range(0, len(rows), SUMMARY_BATCH_SIZE):
-        batch = rows[batch_start:batch_start + SUMMARY_BATCH_SIZE]
-        progress(batch_start + len(batch), len(rows), "  Summarizing")
-
-        blocks = []
-        for vid_id, yt_id, title, full_text in batch:
-            text = full_text[:TRANSCRIPT_CHAR_LIMIT]
-            blocks.append(
-                f"VIDEO_ID: {vid_id}\nTITLE: {title}\nTRANSCRIPT:\n{text}\n"
-            )
-
-        videos_block = "\n---\n".join(blocks)
-        prompt = SUMMARY_PROMPT.format(videos_block=videos_block)
-
-        try:
-            results = call_claude_json(prompt, timeout=180)
-            if not isinstance(results, list):
-                results = [results]
-
-            now = datetime.now(timezone.utc).isoformat()
-            for item in results:
-                vid_id = item.get("video_id")
-                if vid_id is None:
-                    continue
-                conn.execute(
-                    """INSERT OR IGNORE INTO video_summaries
+    def summary_jobs(batch_rows):
+        video_blocks = [
+            (r, f"VIDEO_ID: {r[0]}\nTITLE: {r[2]}\nTRANSCRIPT:\n"
+                f"{r[3][:TRANSCRIPT_CHAR_LIMIT]}\n")
+            for r in batch_rows
+        ]
+        planned = plan_batches(
+            video_blocks,
+            [estimate_tokens(block) for _, block in video_blocks],
+            budget=SUMMARY_TOKEN_BUDGET,
+            max_items=SUMMARY_MAX_VIDEOS,
+        )
+        logger.debug(f"  Packed {len(batch_rows)} videos into {len(planned)} calls "
+                     f"(budget {SUMMARY_TOKEN_BUDGET:,} tokens each)")
+        return [
+            ([r for r, _ in packed],
+             SUMMARY_PROMPT.format(
+                 videos_block="\n---\n".join(block for _, block in packed)))
+            for packed in planned
+        ]
+
+    # Claude calls run concurrently and stream; each summary is written as
+    # soon as it arrives, on this thread's connection only, one commit
+    # point per video.
+    with tracing.span("summarize", videos=len(rows)), BatchWriter(conn) as writer:
+        for row, items in stream_video_results(
+                rows, summary_jobs, writer, fingerprints.SUMMARY, summary_fps,
+                180, logger, "summarization", "  Summarizing"):
+            vid_id = row[0]
+            item = items[-1]
+            try:
+                writer.add(
+                    """INSERT OR REPLACE INTO video_summaries
                        (video_id, summary, themes, key_quotes, tone, summarized_at)
                        VALUES (?, ?, ?, ?, ?, ?)""",
                     (
@@ -340,22 +952,35 @@ def run_phase2(conn, force_categories: bool = False):
                         json.dumps(item.get("themes", [])),
                         json.dumps(item.get("key_quotes", [])),
                         item.get("tone", ""),
-                        now,
+                        datetime.now(timezone.utc).isoformat(),
                     ),
                 )
-            conn.commit()
-            summarized += len(results)
+                if vid_id in summary_fps:
+                    writer.add(fingerprints.UPSERT_SQL, fingerprints.params(
+                        fingerprints.SUMMARY, vid_id, summary_fps[vid_id]))
+                writer.commit_point()
+                summarized += 1
 
-        except Exception as e:
-            logger.error(f"  Batch summarization failed: {e}")
+            except Exception as e:
+                writer.discard()
+                logger.error(f"  Summarizing video {vid_id} failed: {e}")
 
-    print()
     logger.info(f"  Pass 1 complete: {summarized} summarized")
+    return summarized
 
-    # ── Pass 2: Discover Categories ───────────────────────────────────
+
+def discover_categories(conn, force_categories: bool = False) -> bool:
+    """
+    Phase 2 pass 2: propose categories from the clustered themes of all
+    summaries (see theme_clusters.py), unless some exist already (or with
+    `force_categories`, replacing them). Returns whether categories were
+    discovered.
+    """
+    logger = logging.getLogger("phase2")
     logger.info("Phase 2 Pass 2: Discovering categories...")
 
     existing_cats = conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0]
+    discovered = False
     if existing_cats > 0 and not force_categories:
         logger.info(f"  {existing_cats} categories already exist, skipping "
                     "(use --force to regenerate)")
@@ -365,42 +990,40 @@ def run_phase2(conn, force_categories: bool = False):
             conn.execute("DELETE FROM video_categories")
             conn.execute("DELETE FROM clips")
             conn.execute("DELETE FROM categories")
+            fingerprints.clear(conn, fingerprints.TAGS, fingerprints.CLIPS)
+            tag_classifier.clear(conn)
             conn.commit()
 
-        # Build summaries block from all video_summaries
+        # Cluster the theme phrases of all summaries locally; Claude only
+        # sees one digest per cluster, so the prompt does not grow with
+        # the number of talks
         summary_rows = conn.execute("""
-            SELECT vs.video_id, v.title,
-                   GROUP_CONCAT(s.first_name || ' ' || s.last_name, ', ') as speakers,
-                   vs.themes, vs.summary
+            SELECT vs.video_id, v.title, vs.themes
             FROM video_summaries vs
             JOIN videos v ON v.id = vs.video_id
-            LEFT JOIN video_speakers vsp ON vsp.video_id = v.id
-            LEFT JOIN speakers s ON s.id = vsp.speaker_id
-            GROUP BY vs.video_id
         """).fetchall()
-
-        summaries = []
-        for vid_id, title, speakers, themes, summary in summary_rows:
-            themes_list = json.loads(themes) if themes else []
-            # Use only title, speaker, themes, and a truncated summary
-            # to keep the total prompt size manageable for 174 videos
-            short_summary = summary[:200] if summary else ""
-            summaries.append(
-                f"VIDEO: {title} by {speakers or 'Unknown'}\n"
-                f"THEMES: {', '.join(themes_list)}\n"
-                f"SUMMARY: {short_summary}\n"
-            )
-
-        summaries_block = "\n---\n".join(summaries)
-        logger.info(f"  Prompt size: {len(summaries_block):,} chars for {len(summaries)} videos")
+        titles = {vid_id: title for vid_id, title, _ in summary_rows}
+        themes_by_video = {vid_id: json.loads(themes) if themes else []
+                           for vid_id, _, themes in summary_rows}
+
+        with tracing.span("theme_clusters", videos=len(summary_rows)):
+            clusters = theme_clusters.cluster_themes(themes_by_video)
+            digests = theme_clusters.cluster_digests(clusters, titles)
+            tracing.set_attrs(clusters=len(clusters), digests=len(digests))
+
+        clusters_block = "\n---\n".join(digests)
+        logger.info(f"  {len(clusters)} theme clusters over {len(summary_rows)} "
+                    f"videos; prompt size: {len(clusters_block):,} chars for "
+                    f"{len(digests)} digests")
         prompt = CATEGORY_DISCOVERY_PROMPT.format(
-            count=len(summaries),
+            count=len(summary_rows),
             min_cat=CATEGORY_COUNT_MIN,
             max_cat=CATEGORY_COUNT_MAX,
-            summaries_block=summaries_block,
+            clusters_block=clusters_block,
         )
 
-        result = call_claude_json(prompt, timeout=600)
+        with tracing.span("discover", videos=len(summary_rows)):
+            result = call_claude_json(prompt, timeout=300)
         cats = result.get("categories", [])
 
         for cat in cats:
@@ -415,97 +1038,101 @@ def run_phase2(conn, force_categories: bool = False):
                 ),
             )
         conn.commit()
+        discovered = True
         logger.info(f"  Discovered {len(cats)} categories")
+    return discovered
 
-    # ── Pass 3: Tag Videos ────────────────────────────────────────────
-    logger.info("Phase 2 Pass 3: Tagging videos...")
 
-    # Get categories
-    cat_rows = conn.execute(
-        "SELECT id, slug, name, description FROM categories"
-    ).fetchall()
-    cat_lookup = {r[1]: r[0] for r in cat_rows}  # slug -> id
-
-    categories_block = "\n".join(
-        f"- {r[1]}: {r[2]} -- {r[3]}" for r in cat_rows
-    )
+def tag_videos(conn, discovered: bool = False, video_ids=None,
+               expand: bool = True) -> int:
+    """
+    Phase 2 pass 3: tag videos (among `video_ids`, if given) whose tags
+    are missing or stale, then on incremental runs (no categories just
+    `discovered`) pass 4, unless `expand` is off: see expand_and_retag.
+    """
+    logger = logging.getLogger("phase2")
+    logger.info("Phase 2 Pass 3: Tagging videos...")
 
-    # Get videos with summaries but no tags
-    tag_rows = conn.execute("""
+    # Get videos with summaries but no tags, or tags made from an older
+    # summary, prompt or category set
+    summary_rows = conn.execute("""
         SELECT vs.video_id, v.title, vs.themes, vs.summary
         FROM video_summaries vs
         JOIN videos v ON v.id = vs.video_id
-        LEFT JOIN video_categories vc ON vc.video_id = vs.video_id
-        WHERE vc.video_id IS NULL
         ORDER BY vs.video_id
     """).fetchall()
+    category_hash = category_set_hash(conn)
+    stale = set(fingerprints.select_stale(
+        conn, fingerprints.TAGS,
+        {r[0]: tag_fingerprint(category_hash, r[2], r[3]) for r in summary_rows},
+        (r[0] for r in conn.execute("SELECT DISTINCT video_id FROM video_categories")),
+    ))
+    wanted = set(video_ids) if video_ids is not None else None
+    tag_rows = [r for r in summary_rows
+                if r[0] in stale and (wanted is None or r[0] in wanted)]
+    # Local tags are also redone when the model or threshold has changed
+    local = tag_classifier.load(conn)
+    local_rows = [r for r in summary_rows
+                  if r[0] in local and r[0] not in stale
+                  and (wanted is None or r[0] in wanted)]
+    tagged_locally, claude_rows = (_tag_locally(conn, tag_rows, local_rows)
+                                   if tag_rows or local_rows else (0, []))
+    tagged = tagged_locally + _tag_videos(conn, claude_rows)
+    logger.info(f"  Pass 3 complete: {tagged} tagged")
 
-    logger.info(f"  {len(tag_rows)} videos to tag")
-    tagged = 0
-
-    for batch_start in range(0, len(tag_rows), TAG_BATCH_SIZE):
-        batch = tag_rows[batch_start:batch_start + TAG_BATCH_SIZE]
-        progress(batch_start + len(batch), len(tag_rows), "  Tagging")
-
-        blocks = []
-        for vid_id, title, themes, summary in batch:
-            themes_list = json.loads(themes) if themes else []
-            blocks.append(
-                f"VIDEO_ID: {vid_id}\nTITLE: {title}\n"
-                f"THEMES: {', '.join(themes_list)}\n"
-                f"SUMMARY: {summary}"
-            )
-
-        videos_block = "\n---\n".join(blocks)
-        prompt = TAG_PROMPT.format(
-            categories_block=categories_block,
-            videos_block=videos_block,
-        )
-
-        try:
-            results = call_claude_json(prompt, timeout=180)
-            if not isinstance(results, list):
-                results = [results]
-
-            for item in results:
-                vid_id = item.get("video_id")
-                if vid_id is None:
-                    continue
-
-                primary_slug = item.get("primary_category", "")
-                secondary_slugs = item.get("secondary_categories", [])
-                scores = item.get("relevance_scores", {})
-
-                # Insert primary
-                if primary_slug in cat_lookup:
-                    conn.execute(
-                        """INSERT OR IGNORE INTO video_categories
-                           (video_id, category_id, is_primary, relevance_score)
-                           VALUES (?, ?, 1, ?)""",
-                        (vid_id, cat_lookup[primary_slug],
-                         scores.get(primary_slug, 0.8)),
-                    )
-
-                # Insert secondaries
-                for slug in secondary_slugs:
-                    if slug in cat_lookup:
-                        conn.execute(
-                            """INSERT OR IGNORE INTO video_categories
-                               (video_id, category_id, is_primary, relevance_score)
-                               VALUES (?, ?, 0, ?)""",
-                            (vid_id, cat_lookup[slug],
-                             scores.get(slug, 0.5)),
-                        )
+    # ── Pass 4: Expand Categories (incremental runs only) ─────────────
+    if expand and not discovered and tag_rows:
+        expand_and_retag(conn)
 
-            conn.commit()
-            tagged += len(results)
+    return tagged
 
-        except Exception as e:
-            logger.error(f"  Batch tagging failed: {e}")
 
-    print()
-    logger.info(f"  Pass 3 complete: {tagged} tagged")
-    return {"summarized": summarized, "tagged": tagged}
+def expand_and_retag(conn) -> int:
+    """
+    Phase 2 pass 4: add categories for uncovered themes and re-tag the
+    talks they target. Returns the number of talks re-tagged.
+    """
+    logger = logging.getLogger("phase2")
+    logger.info("Phase 2 Pass 4: Checking for uncovered themes...")
+    summary_rows = conn.execute("""
+        SELECT vs.video_id, v.title, vs.themes, vs.summary
+        FROM video_summaries vs
+        JOIN videos v ON v.id = vs.video_id
+        ORDER BY vs.video_id
+    """).fetchall()
+    category_hash = category_set_hash(conn)
+    retag_ids = expand_categories(conn)
+    if not retag_ids:
+        return 0
+    # New categories only target the unmatched talks: everyone else
+    # keeps their tags, restamped against the expanded category set
+    new_hash = category_set_hash(conn)
+    stored = fingerprints.load(conn, fingerprints.TAGS)
+    retag_set = set(retag_ids)
+    with conn:
+        conn.executemany(fingerprints.UPSERT_SQL, [
+            fingerprints.params(fingerprints.TAGS, vid_id,
+                                tag_fingerprint(new_hash, themes, summary))
+            for vid_id, _, themes, summary in summary_rows
+            if vid_id not in retag_set and stored.get(vid_id)
+            == tag_fingerprint(category_hash, themes, summary)
+        ])
+    marks = ",".join("?" * len(retag_ids))
+    conn.execute(
+        f"DELETE FROM video_categories WHERE video_id IN ({marks})",
+        retag_ids,
+    )
+    conn.commit()
+    retag_rows = conn.execute(f"""
+        SELECT vs.video_id, v.title, vs.themes, vs.summary
+        FROM video_summaries vs
+        JOIN videos v ON v.id = vs.video_id
+        WHERE vs.video_id IN ({marks})
+        ORDER BY vs.video_id
+    """, retag_ids).fetchall()
+    _tag_videos(conn, retag_rows)
+    logger.info(f"  Re-tagged {len(retag_rows)} videos against new categories")
+    return len(retag_rows)
 
 
 # ═══════════════════════════════════════════════════════════════════════
@@ -513,12 +1140,14 @@ def run_phase2(conn, force_categories: bool = False):
 # ═══════════════════════════════════════════════════════════════════════
 
 CLIPS_PER_CATEGORY = 5
+CLIP_PROMPT_CHAR_LIMIT = 60000  # transcript excerpts, shared across a category's talks
+CLIP_VIDEO_MIN_CHARS = 5000
 
 CLIP_PROMPT = """You are a video editor's assistant finding the best clips for a TEDx montage themed around: "{category_name}".
 
 Category description: {category_description}
 
-Below are timestamped transcripts from TEDx talks tagged with this category. Each entry has [MM:SS] timestamps.
+Below are timestamped transcript excerpts from TEDx talks tagged with this category, chosen as the passages most related to the theme. Each entry has [MM:SS] timestamps; "..." marks skipped parts of a talk.
 
 Identify the {clips_count} most compelling clips across ALL these talks. Each clip should be a continuous segment (30 seconds to 3 minutes) that powerfully represents the category theme. Pick moments that are emotionally resonant, quotable, or visually impactful for a montage.
 
@@ -537,13 +1166,158 @@ Respond with ONLY a valid JSON array of clip objects, ranked by relevance_score
 {transcripts_block}
 """
 
+CLIP_PROMPT_VERSION = template_version(CLIP_PROMPT)
+
+
+def clip_fingerprint(cat_name: str, cat_desc: str | None, related_themes: str | None,
+                     members: list[tuple], selection: str = "lexical") -> str:
+    """
+    Fingerprint of a category's clips: its definition, its talks (video
+    id, transcript hash, key quotes used for excerpt selection) and how
+    excerpts were selected.
+    """
+    fp_parts = [CLIP_PROMPT_VERSION, cat_name, cat_desc, related_themes,
+                sorted(members)]
+    if selection != "lexical":
+        fp_parts.append(selection)
+    return digest(*fp_parts)
+
+
+def category_members(conn, cat_rows) -> dict[int, list]:
+    """
+    {category id: [(video id, youtube id, title)]} of the talks tagged
+    with each category that have a transcript, most relevant first
+    (entertainment excluded — they don't have categories anyway since
+    phase 2 skips them, but defense in depth).
+    """
+    members = {}
+    for cat_id, *_ in cat_rows:
+        members[cat_id] = conn.execute("""
+            SELECT v.id, v.youtube_id, v.title
+            FROM video_categories vc
+            JOIN videos v ON v.id = vc.video_id
+            JOIN transcripts t ON t.video_id = v.id
+            WHERE vc.category_id = ? AND v.format != 'entertainment'
+            ORDER BY vc.relevance_score DESC
+        """, (cat_id,)).fetchall()
+    return members
+
+
+def summary_key_quotes(conn) -> dict[int, list]:
+    """{video id: key quotes} from the stored summaries."""
+    return {
+        vid_id: json.loads(quotes) if quotes else []
+        for vid_id, quotes in conn.execute(
+            "SELECT video_id, key_quotes FROM video_summaries")
+    }
+
+
+def clip_fingerprints(cat_rows, members: dict, transcript_hashes: dict,
+                      key_quotes: dict, selection: str = "lexical") -> dict[int, str]:
+    """Current clip_fingerprint of each category, as {category id: fingerprint}."""
+    return {
+        cat_id: clip_fingerprint(cat_name, cat_desc, related_themes, [
+            (r[0], transcript_hashes[r[0]], key_quotes.get(r[0], []))
+            for r in members[cat_id]], selection)
+        for cat_id, _, cat_name, cat_desc, related_themes in cat_rows
+    }
+
+
+def iter_clip_transcript_lines(conn, video_rows, themes: list[str],
+                               key_quotes: dict[int, list[str]]):
+    """
+    Stream the transcripts block of a clip prompt line by line: for each
+    talk, the excerpts most related to the category (see
+    transcript_windows.py) within its share of CLIP_PROMPT_CHAR_LIMIT.
+    """
+    per_video_limit = max(CLIP_VIDEO_MIN_CHARS,
+                          CLIP_PROMPT_CHAR_LIMIT // len(video_rows))
+    transcripts = load_transcripts(conn, [r[0] for r in video_rows])
+    for i, (vid_id, yt_id, title) in enumerate(video_rows):
+        if i:
+            yield "\n===\n"
+        transcript = transcripts[vid_id]
+        yield from iter_excerpt_lines(
+            f"VIDEO_ID: {vid_id} | TITLE: {title}",
+            transcript.entries, transcript.normalized,
+            WindowQuery(themes, key_quotes.get(vid_id, [])),
+            per_video_limit,
+        )
+
 
-def run_phase3(conn):
-    """Find best clips for each category."""
+def iter_ranked_clip_lines(conn, index, video_rows, query_text: str, top_windows: int):
+    """
+    Stream the transcripts block of a clip prompt from the `top_windows`
+    windows of the category's talks that are semantically closest to the
+    category (see embedding_index.py). Talks with no selected window are
+    left out.
+    """
+    query_vec = index.embed_text(normalize_text(query_text))
+    ranges: dict[int, list] = {}
+    for row, _ in index.search(query_vec, k=top_windows,
+                               video_ids=[r[0] for r in video_rows]):
+        w = index.window(row)
+        ranges.setdefault(w["video_id"], []).append(
+            (w["first_entry"], w["last_entry"]))
+
+    transcripts = load_transcripts(conn, list(ranges))
+    first_block = True
+    for vid_id, yt_id, title in video_rows:
+        if vid_id not in ranges:
+            continue
+        if not first_block:
+            yield "\n===\n"
+        first_block = False
+        yield from iter_range_lines(f"VIDEO_ID: {vid_id} | TITLE: {title}",
+                                    transcripts[vid_id].entries,
+                                    merge_ranges(ranges[vid_id]))
+
+
+def _clip_block_task(conn, video_rows, themes: list[str],
+                     key_quotes: dict[int, list[str]]) -> str:
+    """Worker task: a category's lexically ranked transcripts block."""
+    return "\n".join(iter_clip_transcript_lines(conn, video_rows, themes, key_quotes))
+
+
+def _align_clips_task(conn, video_ids, clips) -> list[tuple]:
+    """Worker task: (clip, (start, end) or None) for one category's clips."""
+    # Recently used transcripts are memoized by load_transcripts, so a talk
+    # in several categories usually builds its TranscriptIndex only once
+    transcripts = load_transcripts(conn, video_ids)
+    aligned = []
+    for clip in clips:
+        vid_id = _item_video_id(clip)
+        if vid_id is None:
+            continue
+        quote = clip.get("quote_snippet", "")
+        transcript = transcripts.get(vid_id)
+        with tracing.timer("align_ms"):
+            corrected = (correct_timestamps(quote, transcript.index)
+                         if quote and transcript else None)
+        aligned.append((clip, corrected))
+    return aligned
+
+
+def run_phase3(conn, top_windows: int = 0, pool: WorkerPool | None = None):
+    """
+    Find best clips for each category.
+
+    With `top_windows`, each category's prompt carries only that many
+    transcript windows, pre-ranked locally with the embedding index;
+    otherwise each talk gets a share of CLIP_PROMPT_CHAR_LIMIT filled
+    with its lexically most relevant excerpts.
+    """
     logger = logging.getLogger("phase3")
 
+    index = None
+    selection = "lexical"
+    if top_windows:
+        import embedding_index  # needs numpy; only loaded when asked for
+        index = embedding_index.ensure_index(conn)
+        selection = f"semantic:{top_windows}"
+
     cat_rows = conn.execute(
-        "SELECT id, slug, name, description FROM categories"
+        "SELECT id, slug, name, description, related_themes FROM categories"
     ).fetchall()
 
     if not cat_rows:
@@ -552,113 +1326,151 @@ def run_phase3(conn):
 
     stats = {"categories": 0, "clips": 0}
 
-    for cat_id, cat_slug, cat_name, cat_desc in cat_rows:
-        # Check if clips already exist for this category
-        existing = conn.execute(
-            "SELECT COUNT(*) FROM clips WHERE category_id = ?", (cat_id,)
-        ).fetchone()[0]
-
-        if existing > 0:
+    members = category_members(conn, cat_rows)
+
+    # Clips are only regenerated when the category, its member talks or
+    # their transcripts changed since they were generated
+    key_quotes = summary_key_quotes(conn)
+    clip_fps = clip_fingerprints(cat_rows, members, fingerprints.transcript_hashes(conn),
+                                 key_quotes, selection)
+    existing_counts = dict(conn.execute(
+        "SELECT category_id, COUNT(*) FROM clips GROUP BY category_id"
+    ).fetchall())
+    stale = set(fingerprints.select_stale(
+        conn, fingerprints.CLIPS, clip_fps, existing_counts))
+    # Categories are claimed through the job queue, so concurrent runs
+    # split them, and ones that failed MAX_ATTEMPTS times are left alone
+    stale_ids = [r[0] for r in cat_rows if r[0] in stale and members[r[0]]]
+    given_up = set(job_queue.enqueue(
+        conn, fingerprints.CLIPS, {cat_id: clip_fps[cat_id] for cat_id in stale_ids}))
+    leased = set(job_queue.lease(conn, fingerprints.CLIPS, stale_ids, len(stale_ids)))
+
+    planned = []
+    for cat_id, cat_slug, cat_name, cat_desc, related_themes in cat_rows:
+        video_rows = members[cat_id]
+        existing = existing_counts.get(cat_id, 0)
+
+        if cat_id not in stale:
             logger.info(f"  '{cat_name}': {existing} clips already exist, skipping")
             stats["categories"] += 1
             stats["clips"] += existing
             continue
-
-        logger.info(f"  Finding clips for '{cat_name}'...")
-
-        # Get videos tagged with this category (entertainment excluded —
-        # they don't have categories anyway since phase 2 skips them,
-        # but defense in depth).
-        video_rows = conn.execute("""
-            SELECT v.id, v.youtube_id, v.title, t.entries
-            FROM video_categories vc
-            JOIN videos v ON v.id = vc.video_id
-            JOIN transcripts t ON t.video_id = v.id
-            WHERE vc.category_id = ? AND v.format != 'entertainment'
-            ORDER BY vc.relevance_score DESC
-        """, (cat_id,)).fetchall()
+        if existing > 0:
+            logger.info(f"  '{cat_name}': inputs changed, regenerating "
+                        f"{existing} clips")
 
         if not video_rows:
             logger.warning(f"  No videos with transcripts for '{cat_name}'")
             continue
+        if cat_id in given_up:
+            logger.info(f"  '{cat_name}': failed before (unchanged since), skipping")
+            continue
+        if cat_id not in leased:
+            logger.info(f"  '{cat_name}': leased by another worker, skipping")
+            continue
 
-        # Build timestamped transcript blocks
-        # Distribute char limit across videos
-        per_video_limit = max(5000, 60000 // len(video_rows))
-        blocks = []
-
-        for vid_id, yt_id, title, entries_json in video_rows:
-            entries = json.loads(entries_json)
-            lines = [f"VIDEO_ID: {vid_id} | TITLE: {title}"]
-            total_chars = len(lines[0])
-
-            for entry in entries:
-                ts = format_timestamp(entry['start'])
-                line = f"[{ts}] {entry['text']}"
-                total_chars += len(line) + 1
-                if total_chars > per_video_limit:
-                    break
-                lines.append(line)
-
-            blocks.append("\n".join(lines))
-
-        transcripts_block = "\n\n===\n\n".join(blocks)
-        prompt = CLIP_PROMPT.format(
+        logger.info(f"  Finding clips for '{cat_name}'...")
+        themes = (json.loads(related_themes) if related_themes else []) + [cat_name]
+        planned.append((cat_id, cat_name, cat_desc, video_rows, themes))
+
+    # Excerpts are ranked against the category's themes and name plus each
+    # talk's key quotes (on the worker processes, if any), or semantically
+    # against the embedding index loaded here
+    pool = pool or WorkerPool(conn)
+    if index is not None:
+        blocks = [
+            "\n".join(iter_ranked_clip_lines(
+                conn, index, video_rows,
+                " ".join([cat_name, cat_desc or ""] + themes), top_windows))
+            for _, cat_name, cat_desc, video_rows, themes in planned
+        ]
+    else:
+        blocks = pool.map(_clip_block_task, [
+            (video_rows, themes, {r[0]: key_quotes.get(r[0], []) for r in video_rows})
+            for _, _, _, video_rows, themes in planned
+        ])
+    jobs = [
+        ((cat_id, cat_name, video_rows), CLIP_PROMPT.format(
             category_name=cat_name,
             category_description=cat_desc or "",
             clips_count=CLIPS_PER_CATEGORY,
             transcripts_block=transcripts_block,
-        )
-
-        try:
-            raw_clips = call_claude_json(prompt, timeout=240)
-            if not isinstance(raw_clips, list):
+        ))
+        for (cat_id, cat_name, cat_desc, video_rows, _), transcripts_block
+        in zip(planned, blocks)
+    ]
+
+    def answers():
+        # Clips are aligned to their transcripts as each answer arrives
+        for key, raw_clips, error in map_claude_json(jobs, timeout=240):
+            if error is None and not isinstance(raw_clips, list):
                 raw_clips = [raw_clips]
-
-            # Build a lookup of entries per video_id for timestamp correction
-            entries_by_vid = {
-                vid_id: json.loads(entries_json)
-                for vid_id, _, _, entries_json in video_rows
-            }
-
-            now = datetime.now(timezone.utc).isoformat()
-            for clip in raw_clips:
-                vid_id = clip.get("video_id")
-                if vid_id is None:
-                    continue
-
-                # Correct timestamps using transcript entries
-                quote = clip.get("quote_snippet", "")
-                start_time = clip.get("start_time", 0)
-                end_time = clip.get("end_time", 0)
-                entries = entries_by_vid.get(vid_id, [])
-                corrected = correct_timestamps(quote, entries) if quote and entries else None
-                if corrected:
-                    start_time, end_time = corrected
-
-                conn.execute(
-                    """INSERT INTO clips
-                       (video_id, category_id, start_time, end_time,
-                        description, quote_snippet, relevance_score, generated_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        vid_id,
-                        cat_id,
-                        start_time,
-                        end_time,
-                        clip.get("description", ""),
-                        quote,
-                        clip.get("relevance_score", 0),
-                        now,
-                    ),
-                )
-            conn.commit()
-            stats["categories"] += 1
-            stats["clips"] += len(raw_clips)
-            logger.info(f"    Found {len(raw_clips)} clips")
-
-        except Exception as e:
-            logger.error(f"  Clip identification failed for '{cat_name}': {e}")
+            yield (key, error), ([r[0] for r in key[2]],
+                                 raw_clips if error is None else [])
+
+    with tracing.span("find_clips", categories=len(jobs)), \
+            job_queue.held(conn, fingerprints.CLIPS), BatchWriter(conn) as writer:
+        for ((cat_id, cat_name, video_rows), error), aligned, align_error in \
+                pool.imap_unordered(_align_clips_task, answers()):
+            error = error or align_error
+            if error is not None:
+                logger.error(f"  Clip identification failed for '{cat_name}': {error}")
+                writer.add(job_queue.RETRY_SQL, job_queue.retry_params(
+                    fingerprints.CLIPS, cat_id, str(error)))
+                writer.commit_point()
+                continue
+
+            known_ids = {r[0] for r in video_rows}
+            written = 0
+            try:
+                now = datetime.now(timezone.utc).isoformat()
+                # Replace any clips from older inputs in the same unit
+                writer.add("DELETE FROM clips WHERE category_id = ?", (cat_id,))
+                for clip, corrected in aligned:
+                    vid_id = _item_video_id(clip)
+                    if vid_id not in known_ids:
+                        logger.warning(f"    Skipping a clip for '{cat_name}' with "
+                                       f"unknown video_id {clip.get('video_id')!r}")
+                        continue
+                    # Timestamps corrected against the transcript entries
+                    quote = clip.get("quote_snippet", "")
+                    start_time = clip.get("start_time", 0)
+                    end_time = clip.get("end_time", 0)
+                    if corrected:
+                        start_time, end_time = corrected
+
+                    writer.add(
+                        """INSERT INTO clips
+                           (video_id, category_id, start_time, end_time,
+                            description, quote_snippet, relevance_score, generated_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                        (
+                            vid_id,
+                            cat_id,
+                            start_time,
+                            end_time,
+                            clip.get("description", ""),
+                            quote,
+                            clip.get("relevance_score", 0),
+                            now,
+                        ),
+                    )
+                    written += 1
+                writer.add(fingerprints.UPSERT_SQL, fingerprints.params(
+                    fingerprints.CLIPS, cat_id, clip_fps[cat_id]))
+                writer.add(job_queue.DONE_SQL, job_queue.done_params(
+                    fingerprints.CLIPS, cat_id))
+            except Exception as e:
+                # Only the retry is kept: none of this category's rows
+                writer.discard()
+                logger.error(f"  Clip identification failed for '{cat_name}': {e}")
+                writer.add(job_queue.RETRY_SQL, job_queue.retry_params(
+                    fingerprints.CLIPS, cat_id, str(e)))
+            else:
+                stats["categories"] += 1
+                stats["clips"] += written
+                logger.info(f"    Found {written} clips for '{cat_name}'")
+            writer.commit_point()
 
     logger.info(f"Phase 3 complete: {stats}")
     return stats
@@ -669,7 +1481,11 @@ def run_phase3(conn):
 # ═══════════════════════════════════════════════════════════════════════
 
 KEY_MOMENTS_PER_VIDEO = 5
-KEY_MOMENTS_BATCH_SIZE = 3
+# Calls are packed up to a token budget (see batch_planner); a talk whose
+# timestamped transcript exceeds the budget is sent alone, truncated.
+KEY_MOMENTS_TOKEN_BUDGET = 25000
+KEY_MOMENTS_MAX_VIDEOS = 6
+KEY_MOMENTS_CHAR_LIMIT = KEY_MOMENTS_TOKEN_BUDGET * CHARS_PER_TOKEN
 
 KEY_MOMENTS_PROMPT = """You are a video production assistant helping identify the best quotable moments from TEDx talks.
 
@@ -687,21 +1503,73 @@ Return a JSON array. Each element must have exactly these keys: video_id, quote_
 
 {transcripts_block}"""
 
+KEY_MOMENTS_PROMPT_VERSION = template_version(KEY_MOMENTS_PROMPT)
 
-def run_phase4(conn):
-    """Extract 5 key moments per video using Claude."""
+
+def key_moments_fingerprint(transcript_hash: str) -> str:
+    return digest(KEY_MOMENTS_PROMPT_VERSION, transcript_hash)
+
+
+def key_moments_block(vid_id: int, title: str, entries: list[dict]) -> str:
+    """One video's timestamped transcript block for the key moments prompt."""
+    lines = [f"VIDEO_ID: {vid_id} | TITLE: {title}"]
+    # Limit per video to stay within context
+    total_chars = 0
+    for entry in entries:
+        ts = format_timestamp(entry["start"])
+        line = f"[{ts}] {entry['text']}"
+        total_chars += len(line)
+        if total_chars > KEY_MOMENTS_CHAR_LIMIT:
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _key_moments_blocks_task(conn, rows) -> list[str]:
+    """Worker task: key_moments_block of each (video_id, title) row."""
+    transcripts = load_transcripts(conn, [r[0] for r in rows])
+    return [key_moments_block(vid_id, title, transcripts[vid_id].entries)
+            for vid_id, title in rows]
+
+
+def _align_moments_task(conn, row, moments) -> list[tuple]:
+    """Worker task: (moment, (start, end) or None) for one video's moments."""
+    transcript = load_transcripts(conn, [row[0]]).get(row[0])
+    aligned = []
+    for moment in moments:
+        quote = moment.get("quote_text", "")
+        with tracing.timer("align_ms"):
+            corrected = (correct_timestamps(quote, transcript.index)
+                         if quote and transcript else None)
+        aligned.append((moment, corrected))
+    return aligned
+
+
+def run_phase4(conn, pool: WorkerPool | None = None, video_ids=None):
+    """Extract 5 key moments per video (or per one of `video_ids`) using Claude."""
     logger = logging.getLogger("phase4")
 
-    # Get videos with transcripts that don't have key moments yet
-    # (skip entertainment — defense in depth).
-    rows = conn.execute("""
-        SELECT v.id, v.title, t.entries
+    # Get videos with transcripts that don't have key moments yet, or have
+    # moments from an older transcript/prompt (skip entertainment — defense
+    # in depth).
+    candidates = conn.execute("""
+        SELECT v.id, v.title
         FROM videos v
         JOIN transcripts t ON t.video_id = v.id
-        LEFT JOIN video_key_moments km ON km.video_id = v.id
-        WHERE km.video_id IS NULL AND v.format != 'entertainment'
+        WHERE v.format != 'entertainment'
         ORDER BY v.id
     """).fetchall()
+    if video_ids is not None:
+        wanted = set(video_ids)
+        candidates = [r for r in candidates if r[0] in wanted]
+    transcript_hashes = fingerprints.transcript_hashes(conn, [r[0] for r in candidates])
+    moment_fps = {r[0]: key_moments_fingerprint(transcript_hashes[r[0]])
+                  for r in candidates}
+    stale = set(fingerprints.select_stale(
+        conn, fingerprints.KEY_MOMENTS, moment_fps,
+        (r[0] for r in conn.execute("SELECT DISTINCT video_id FROM video_key_moments")),
+    ))
+    rows = [r for r in candidates if r[0] in stale]
 
     if not rows:
         logger.info("All videos already have key moments.")
@@ -710,79 +1578,180 @@ def run_phase4(conn):
     logger.info(f"Phase 4: Extracting key moments for {len(rows)} videos...")
     stats = {"videos": 0, "moments": 0}
 
-    for batch_start in range(0, len(rows), KEY_MOMENTS_BATCH_SIZE):
-        batch = rows[batch_start:batch_start + KEY_MOMENTS_BATCH_SIZE]
-        progress(batch_start + len(batch), len(rows), "  Key moments")
-
-        # Build transcript blocks for this batch
-        blocks = []
-        entries_by_vid = {}
-        for vid_id, title, entries_json in batch:
-            entries = json.loads(entries_json)
-            entries_by_vid[vid_id] = entries
-
-            lines = [f"VIDEO_ID: {vid_id} | TITLE: {title}"]
-            # Limit per video to stay within context
-            total_chars = 0
-            for entry in entries:
-                ts = format_timestamp(entry["start"])
-                line = f"[{ts}] {entry['text']}"
-                total_chars += len(line)
-                if total_chars > 40000:
-                    break
-                lines.append(line)
-            blocks.append("\n".join(lines))
-
-        transcripts_block = "\n\n===\n\n".join(blocks)
-        prompt = KEY_MOMENTS_PROMPT.format(
-            moments_count=KEY_MOMENTS_PER_VIDEO,
-            transcripts_block=transcripts_block,
+    # Build each video's timestamped transcript block, then pack blocks
+    # into calls by estimated size. Blocks are built and quotes aligned
+    # on the worker processes, if any.
+    pool = pool or WorkerPool(conn)
+    blocks = dict(zip((r[0] for r in rows),
+                      pool.map_chunked(_key_moments_blocks_task, rows)))
+
+    def key_moments_jobs(batch_rows):
+        batch_blocks = [(row, blocks[row[0]]) for row in batch_rows]
+        planned = plan_batches(
+            batch_blocks,
+            [estimate_tokens(block) for _, block in batch_blocks],
+            budget=KEY_MOMENTS_TOKEN_BUDGET,
+            max_items=KEY_MOMENTS_MAX_VIDEOS,
         )
+        logger.debug(f"  Packed {len(batch_rows)} videos into {len(planned)} calls "
+                     f"(budget {KEY_MOMENTS_TOKEN_BUDGET:,} tokens each)")
+        return [
+            ([row for row, _ in packed],
+             KEY_MOMENTS_PROMPT.format(
+                 moments_count=KEY_MOMENTS_PER_VIDEO,
+                 transcripts_block="\n\n===\n\n".join(block for _, block in packed),
+             ))
+            for packed in planned
+        ]
+
+    # Videos whose old moments were deleted this run; a video can come back
+    # in pieces and later pieces must not delete the earlier ones, even
+    # before the writer has flushed them.
+    replaced = set()
+    with tracing.span("key_moments", videos=len(rows)), BatchWriter(conn) as writer:
+        for (vid_id, _), aligned in stream_video_results(
+                rows, key_moments_jobs, writer, fingerprints.KEY_MOMENTS,
+                moment_fps, 240, logger, "key moments", "  Key moments",
+                pool=pool, prepare=_align_moments_task):
+            try:
+                now = datetime.now(timezone.utc).isoformat()
+                if vid_id not in replaced:
+                    # Drop moments from older inputs in the same unit
+                    writer.add("DELETE FROM video_key_moments WHERE video_id = ?",
+                               (vid_id,))
+                    if vid_id in moment_fps:
+                        writer.add(fingerprints.UPSERT_SQL, fingerprints.params(
+                            fingerprints.KEY_MOMENTS, vid_id, moment_fps[vid_id]))
+
+                for moment, corrected in aligned:
+                    quote = moment.get("quote_text", "")
+                    start_time = corrected[0] if corrected else 0
+                    end_time = corrected[1] if corrected else 0
+
+                    if not corrected:
+                        logger.warning(f"  No timestamp match for video {vid_id}: {quote[:50]!r}")
+
+                    writer.add(
+                        """INSERT INTO video_key_moments
+                           (video_id, quote_text, context, start_time, end_time, generated_at)
+                           VALUES (?, ?, ?, ?, ?, ?)""",
+                        (
+                            vid_id,
+                            quote,
+                            moment.get("context", ""),
+                            start_time,
+                            end_time,
+                            now,
+                        ),
+                    )
 
-        try:
-            raw_moments = call_claude_json(prompt, timeout=240)
-            if not isinstance(raw_moments, list):
-                raw_moments = [raw_moments]
-
-            now = datetime.now(timezone.utc).isoformat()
-            for moment in raw_moments:
-                vid_id = moment.get("video_id")
-                if vid_id is None:
-                    continue
-
-                quote = moment.get("quote_text", "")
-                entries = entries_by_vid.get(vid_id, [])
-                corrected = correct_timestamps(quote, entries) if quote and entries else None
-                start_time = corrected[0] if corrected else 0
-                end_time = corrected[1] if corrected else 0
+                writer.commit_point()
+                if vid_id not in replaced:
+                    stats["videos"] += 1
+                replaced.add(vid_id)
+                stats["moments"] += len(aligned)
 
-                if not corrected:
-                    logger.warning(f"  No timestamp match for video {vid_id}: {quote[:50]!r}")
+            except Exception as e:
+                writer.discard()
+                logger.error(f"  Key moments failed for video {vid_id}: {e}")
 
-                conn.execute(
-                    """INSERT INTO video_key_moments
-                       (video_id, quote_text, context, start_time, end_time, generated_at)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (
-                        vid_id,
-                        quote,
-                        moment.get("context", ""),
-                        start_time,
-                        end_time,
-                        now,
-                    ),
-                )
+    logger.info(f"Phase 4 complete: {stats}")
+    return stats
 
-            conn.commit()
-            stats["videos"] += len(batch)
-            stats["moments"] += len(raw_moments)
-            logger.info(f"    Batch {batch_start // KEY_MOMENTS_BATCH_SIZE + 1}: {len(raw_moments)} moments")
 
-        except Exception as e:
-            logger.error(f"  Key moments failed for batch starting at {batch_start}: {e}")
+# ═══════════════════════════════════════════════════════════════════════
+# RUN-ALL: Phases as a Stage Graph
+# ═══════════════════════════════════════════════════════════════════════
 
-    print()  # newline after progress bar
-    logger.info(f"Phase 4 complete: {stats}")
+def _transcripts_output(conn, after: int | None) -> tuple[list, int | None]:
+    """Videos whose transcript row was added after row id `after`, and the new last id."""
+    rows = conn.execute("SELECT id, video_id FROM transcripts WHERE id > ? ORDER BY id",
+                        (after or 0,)).fetchall()
+    return [r[1] for r in rows], (rows[-1][0] if rows else after)
+
+
+def run_all(conn, pool: WorkerPool, force_categories: bool = False) -> dict:
+    """
+    Run every phase, each pass a stage of a dependency graph (see
+    pipeline_dag.py): summaries and key moments are made per video while
+    transcripts are still being fetched, and key moments keep going
+    while categories are discovered, videos tagged and clips found.
+    """
+    discovered = {}
+
+    def discover(stage_conn):
+        discovered["categories"] = discover_categories(stage_conn, force_categories)
+        return discovered["categories"]
+
+    stages = [
+        Stage("transcripts", lambda c: run_phase1(c, pool=pool.using(c)),
+              output=_transcripts_output),
+        Stage("summaries", summarize_videos, needs=("transcripts",), streams=True,
+              batch=SUMMARY_MAX_VIDEOS),
+        Stage("key_moments",
+              lambda c, ids=None: run_phase4(c, pool=pool.using(c), video_ids=ids),
+              needs=("transcripts",), streams=True, batch=KEY_MOMENTS_MAX_VIDEOS),
+        Stage("categories", discover, needs=("summaries",)),
+        Stage("tags", lambda c: tag_videos(c, discovered.get("categories", False)),
+              needs=("summaries", "categories")),
+        Stage("clips", lambda c: run_phase3(c, pool=pool.using(c)), needs=("tags",)),
+    ]
+    try:
+        return run_dag(stages, get_db)
+    except KeyboardInterrupt:
+        # The stage threads die with the process; hand their leases back
+        for stage in (TRANSCRIPT_JOBS, fingerprints.SUMMARY, fingerprints.TAGS,
+                      fingerprints.CLIPS, fingerprints.KEY_MOMENTS):
+            job_queue.release(conn, stage)
+        raise
+
+
+def run_stream_event(conn, event_id: int, pool: WorkerPool) -> dict:
+    """
+    Push one event's videos through fetch → summarize → tag → key moments
+    a few at a time (see pipeline_dag.run_stream), so each talk shows up
+    in the web app as soon as its own steps are done. Videos are tagged
+    against the existing categories; uncovered themes are checked once
+    at the end. Clips are per category and left to phase3.
+    """
+    logger = logging.getLogger("stream")
+    event = conn.execute("SELECT name FROM events WHERE id = ?", (event_id,)).fetchone()
+    if event is None:
+        logger.error(f"No event with id {event_id}")
+        return {"error": "No event"}
+    video_ids = [r[0] for r in conn.execute(
+        "SELECT id FROM videos WHERE event_id = ? AND format != 'entertainment' "
+        "ORDER BY id", (event_id,))]
+    logger.info(f"Streaming {len(video_ids)} videos of {event[0]}")
+
+    tagged = []
+
+    def tag(stage_conn, ids):
+        tagged.append(tag_videos(stage_conn, video_ids=ids, expand=False))
+
+    steps = [
+        ("fetch", lambda c, ids: run_phase1(c, pool=pool.using(c), video_ids=ids)),
+        ("summarize", lambda c, ids: summarize_videos(c, video_ids=ids)),
+    ]
+    if conn.execute("SELECT COUNT(*) FROM categories").fetchone()[0]:
+        steps.append(("tag", tag))
+    else:
+        logger.warning("No categories yet, so videos are not tagged "
+                       "(run phase2 to discover them)")
+    steps.append(("key_moments",
+                  lambda c, ids: run_phase4(c, pool=pool.using(c), video_ids=ids)))
+
+    try:
+        stats = run_stream(video_ids, steps, get_db)
+    except KeyboardInterrupt:
+        # The step threads die with the process; hand their leases back
+        for stage in (TRANSCRIPT_JOBS, fingerprints.SUMMARY, fingerprints.TAGS,
+                      fingerprints.KEY_MOMENTS):
+            job_queue.release(conn, stage)
+        raise
+    if sum(tagged):
+        expand_and_retag(conn)
+    logger.info(f"Stream complete: {stats}")
     return stats
 
 
@@ -806,6 +1775,7 @@ def show_status(conn):
     total_tagged = conn.execute(
         "SELECT COUNT(DISTINCT video_id) FROM video_categories"
     ).fetchone()[0]
+    tagged_locally = conn.execute("SELECT COUNT(*) FROM local_tags").fetchone()[0]
     total_clips = conn.execute("SELECT COUNT(*) FROM clips").fetchone()[0]
     total_key_moments = conn.execute("SELECT COUNT(*) FROM video_key_moments").fetchone()[0]
     videos_with_moments = conn.execute(
@@ -820,9 +1790,18 @@ def show_status(conn):
     print(f"  Phase 1 - Transcripts: {total_transcripts}/{total_videos}")
     print(f"  Phase 2 - Summaries:   {total_summaries}/{total_transcripts}")
     print(f"  Phase 2 - Categories:  {total_categories}")
-    print(f"  Phase 2 - Tagged:      {total_tagged}/{total_summaries}")
+    print(f"  Phase 2 - Tagged:      {total_tagged}/{total_summaries}"
+          + (f" ({tagged_locally} by the local tagger)" if tagged_locally else ""))
     print(f"  Phase 3 - Clips:       {total_clips}")
     print(f"  Phase 4 - Key Moments: {total_key_moments} ({videos_with_moments}/{total_videos} videos)")
+    jobs = job_queue.counts(conn)
+    if jobs:
+        print("  Job queue:")
+        for stage, states in sorted(jobs.items()):
+            summary = ", ".join(f"{states[state]} {state}" for state in (
+                job_queue.PENDING, job_queue.LEASED, job_queue.DONE, job_queue.FAILED)
+                if states.get(state))
+            print(f"    {stage:<20} {summary}")
     print(f"{'='*60}\n")
 
     if total_categories > 0:
@@ -839,21 +1818,221 @@ def show_status(conn):
         print()
 
 
+def run_evaluate_tagger(conn):
+    """Print the local tagger's held-out accuracy at several thresholds."""
+    cat_slugs = [r[0] for r in conn.execute("SELECT slug FROM categories ORDER BY slug")]
+    examples = tag_examples(conn)
+    model, report = tag_classifier.train(examples, cat_slugs)
+    if model is None:
+        print(f"Only {report['trained']} Claude-tagged videos to train on; the local "
+              f"tagger needs {tag_classifier.MIN_TRAINING_VIDEOS}.")
+        return
+    print(f"Local tagger: {tag_classifier.describe(report)}\n")
+    held = [e for e in examples if tag_classifier.held_out(e[0])]
+    print(f"  {'threshold':>9}  {'confident':>9}  {'correct':>7}")
+    for threshold in sorted({0.5, 0.6, 0.7, 0.8, 0.9, 0.95,
+                             tag_classifier.CONFIDENCE_THRESHOLD}):
+        r = tag_classifier.evaluate(model, held, threshold)
+        correct = ("-" if r["confident_accuracy"] is None
+                   else f"{r['confident_accuracy']:.0%}")
+        mark = "  <- --tag-confidence" if threshold == tag_classifier.CONFIDENCE_THRESHOLD else ""
+        print(f"  {threshold:>9g}  {r['confident']:>4}/{len(held):<4}  {correct:>7}{mark}")
+
+
+def run_search(conn, query: str, limit: int, kinds: tuple[str, ...],
+               rebuild: bool = False):
+    """Print ranked search hits with timestamps and snippets."""
+    search_index.sync(conn, rebuild=rebuild)
+    t0 = time.perf_counter()
+    hits = search_index.search(conn, query, limit=limit, kinds=kinds)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+
+    for hit in hits:
+        if hit["start_time"] is not None:
+            span = (f"{format_timestamp(hit['start_time'])}-"
+                    f"{format_timestamp(hit['end_time'])}")
+            url = f"https://youtu.be/{hit['youtube_id']}?t={int(hit['start_time'])}"
+        else:
+            span = "-"
+            url = f"https://youtu.be/{hit['youtube_id']}"
+        print(f"{hit['youtube_id']}  {span:>11}  [{hit['kind']}] {hit['title']}")
+        print(f"    {hit['snippet']}")
+        print(f"    {url}")
+    print(f"\n{len(hits)} hits in {elapsed_ms:.1f} ms")
+
+
+def run_similar(conn, clip_id: int | None = None, moment_id: int | None = None,
+                youtube_id: str | None = None, at: float | None = None,
+                text: str | None = None, limit: int = 10):
+    """Print transcript windows most like a clip, key moment, timestamp or text."""
+    import embedding_index  # needs numpy; only loaded when asked for
+
+    index = embedding_index.ensure_index(conn)
+    exclude = None
+    if text:
+        query_vec = index.embed_text(normalize_text(text))
+    else:
+        if clip_id is not None:
+            row = conn.execute("SELECT video_id, start_time, end_time FROM clips "
+                               "WHERE id = ?", (clip_id,)).fetchone()
+        elif moment_id is not None:
+            row = conn.execute("SELECT video_id, start_time, end_time "
+                               "FROM video_key_moments WHERE id = ?",
+                               (moment_id,)).fetchone()
+        else:
+            row = conn.execute("SELECT id, ?, ? FROM videos WHERE youtube_id = ?",
+                               (at, at + embedding_index.WINDOW_SECONDS,
+                                youtube_id)).fetchone()
+        if row is None:
+            print("Not found.", file=sys.stderr)
+            return
+        vid_id, start, end = row
+        query_vec = index.span_vector(vid_id, start, end)
+        if query_vec is None:
+            print("That moment is not in the embedding index (no transcript?).",
+                  file=sys.stderr)
+            return
+        exclude = vid_id  # more like this from *other* talks
+
+    hits = embedding_index.distinct_hits(
+        index, index.search(query_vec, k=limit * 4, exclude_video=exclude), limit)
+    videos = {r[0]: (r[1], r[2]) for r in conn.execute(
+        "SELECT id, youtube_id, title FROM videos")}
+    transcripts = load_transcripts(conn, [w["video_id"] for w, _ in hits])
+    for w, score in hits:
+        yt_id, title = videos[w["video_id"]]
+        entries = transcripts[w["video_id"]].entries[w["first_entry"]:w["last_entry"]]
+        snippet = " ".join(e["text"] for e in entries)
+        print(f"{yt_id}  {format_timestamp(w['start_time'])}-"
+              f"{format_timestamp(w['end_time'])}  {score:.2f}  {title}")
+        print(f"    {snippet[:160]}{'...' if len(snippet) > 160 else ''}")
+        print(f"    https://youtu.be/{yt_id}?t={int(w['start_time'])}")
+
+
+def run_profile(trace_file: str, run: str | None = None):
+    """Print per-stage timings for one run of a --trace file."""
+    header, spans = tracing.read_trace(trace_file, run)
+    if not spans:
+        print(f"No spans for {'run ' + run if run else 'the last run'} in {trace_file}")
+        return
+
+    wall = max(s["start"] + s["ms"] / 1000 for s in spans) - min(s["start"] for s in spans)
+    print(f"\nRun {header['run']}: {' '.join(header.get('argv', []))}")
+    print(f"{len(spans)} spans, {wall:.1f}s wall "
+          f"(concurrent stages can total more than wall time)\n")
+    print(f"{'Stage':<44} {'Count':>6} {'Total s':>9} {'Self s':>8} "
+          f"{'Mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'Max ms':>9}")
+    print("-" * 110)
+    for row in tracing.summarize(spans):
+        print(f"{row['path'][-44:]:<44} {row['count']:>6} "
+              f"{row['total_ms'] / 1000:>9.2f} {row['self_ms'] / 1000:>8.2f} "
+              f"{row['mean_ms']:>9.1f} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['max_ms']:>9.1f}")
+        extras = [f"{attr}={row[attr]:,.0f}" if not attr.endswith("_s")
+                  else f"{attr}={row[attr]:,.1f}"
+                  for attr in tracing.SUM_ATTRS if row.get(attr)]
+        if row["errors"]:
+            extras.append(f"errors={row['errors']}")
+        if extras:
+            print(f"{'':<6}{', '.join(extras)}")
+
+
+def _transcript_input_fingerprints(conn, clip_selections) -> dict[str, list[dict]]:
+    """
+    Current fingerprints of the outputs derived from transcripts, as
+    {kind: [{key: fingerprint}, ...]}, with one clips map per selection.
+    """
+    transcript_hashes = fingerprints.transcript_hashes(conn)
+    cat_rows = conn.execute(
+        "SELECT id, slug, name, description, related_themes FROM categories"
+    ).fetchall()
+    members = category_members(conn, cat_rows)
+    key_quotes = summary_key_quotes(conn)
+    return {
+        fingerprints.SUMMARY: [{vid_id: summary_fingerprint(h)
+                                for vid_id, h in transcript_hashes.items()}],
+        fingerprints.KEY_MOMENTS: [{vid_id: key_moments_fingerprint(h)
+                                    for vid_id, h in transcript_hashes.items()}],
+        fingerprints.CLIPS: [clip_fingerprints(cat_rows, members, transcript_hashes,
+                                               key_quotes, selection)
+                             for selection in clip_selections],
+    }
+
+
+def run_compact_transcripts(conn, top_windows: int = 0):
+    """
+    Rewrite transcripts.entries in compact JSON and repack the sidecar.
+
+    Fingerprints hash the stored entries text, so outputs that were
+    current before the rewrite get their fingerprints (and job queue
+    entries) moved to the new hashes instead of being regenerated.
+    Clips made with `phase3 --top-windows N` are only carried over when
+    the same N is given here.
+    """
+    logger = logging.getLogger("compact")
+    selections = ["lexical"] + ([f"semantic:{top_windows}"] if top_windows else [])
+    size_before = _db_size(conn)
+    before = _transcript_input_fingerprints(conn, selections)
+
+    stats = transcript_store.compact_entries(conn)
+    logger.info(f"{stats['rewritten']}/{stats['transcripts']} transcripts rewritten "
+                f"({stats['bytes_before']:,} -> {stats['bytes_after']:,} bytes of "
+                f"entries), {stats['repacked']} sidecar rows packed")
+
+    after = _transcript_input_fingerprints(conn, selections)
+    carried = 0
+    with conn:
+        for kind, variants in before.items():
+            stored = fingerprints.load(conn, kind)
+            for old_fps, new_fps in zip(variants, after[kind]):
+                for key, old in old_fps.items():
+                    new = new_fps.get(key)
+                    if stored.get(key) != old or new is None or new == old:
+                        continue
+                    conn.execute(fingerprints.UPSERT_SQL,
+                                 fingerprints.params(kind, key, new))
+                    conn.execute("UPDATE pipeline_jobs SET fingerprint = ? "
+                                 "WHERE stage = ? AND key = ? AND fingerprint = ?",
+                                 (new, kind, key, old))
+                    carried += 1
+    logger.info(f"{carried} output fingerprints carried over")
+
+    conn.execute("VACUUM")
+    logger.info(f"Database: {size_before:,} -> {_db_size(conn):,} bytes")
+    return stats
+
+
+def _db_size(conn) -> int:
+    return (conn.execute("PRAGMA page_count").fetchone()[0]
+            * conn.execute("PRAGMA page_size").fetchone()[0])
+
+
 def reset_phase(conn, phase: int):
     """Reset data for a specific phase."""
     if phase == 1:
+        conn.execute("DELETE FROM transcript_packed")
         conn.execute("DELETE FROM transcripts")
+        job_queue.clear(conn, TRANSCRIPT_JOBS)
         print("Phase 1 reset: All transcripts deleted.")
     elif phase == 2:
         conn.execute("DELETE FROM video_categories")
         conn.execute("DELETE FROM categories")
         conn.execute("DELETE FROM video_summaries")
+        fingerprints.clear(conn, fingerprints.SUMMARY, fingerprints.TAGS,
+                           fingerprints.CLIPS)
+        tag_classifier.clear(conn)
+        job_queue.clear(conn, fingerprints.SUMMARY, fingerprints.TAGS,
+                        fingerprints.CLIPS)
         print("Phase 2 reset: Summaries, categories, and tags deleted.")
     elif phase == 3:
         conn.execute("DELETE FROM clips")
+        fingerprints.clear(conn, fingerprints.CLIPS)
+        job_queue.clear(conn, fingerprints.CLIPS)
         print("Phase 3 reset: All clips deleted.")
     elif phase == 4:
         conn.execute("DELETE FROM video_key_moments")
+        fingerprints.clear(conn, fingerprints.KEY_MOMENTS)
+        job_queue.clear(conn, fingerprints.KEY_MOMENTS)
         print("Phase 4 reset: All key moments deleted.")
     else:
         print(f"Invalid phase: {phase}")
@@ -871,53 +2050,164 @@ def main():
         description="TEDxSTLouis Video Categorization & Clip Finder",
     )
     parser.add_argument("-v", "--verbose", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=claude_api.CALL_CONCURRENCY,
+                        help="Max concurrent Claude calls "
+                             f"(default: {claude_api.CALL_CONCURRENCY})")
+    cache_opts = parser.add_mutually_exclusive_group()
+    cache_opts.add_argument("--no-cache", action="store_true",
+                            help="Bypass the Claude response cache")
+    cache_opts.add_argument("--cache-replay", action="store_true",
+                            help="Replay Claude responses from the cache only "
+                                 "(fails on a cache miss)")
+    parser.add_argument("--workers", type=int, default=worker_pool.DEFAULT_WORKERS,
+                        help="Worker processes for the CPU-bound per-video and "
+                             "per-category work of phases 1, 3 and 4; phase 2 "
+                             "(summaries, local tagging, theme clustering) "
+                             "always runs in the main process")
+    parser.add_argument("--claude-backend", choices=claude_api.BACKENDS,
+                        default=claude_api.DEFAULT_BACKEND,
+                        help="How prompts reach Claude "
+                             f"(default: {claude_api.DEFAULT_BACKEND})")
+    parser.add_argument("--tag-confidence", type=float,
+                        default=tag_classifier.CONFIDENCE_THRESHOLD,
+                        help="Confidence the local tagger needs to tag a video "
+                             "without Claude (above 1: always ask Claude; "
+                             f"default: {tag_classifier.CONFIDENCE_THRESHOLD})")
+    parser.add_argument("--trace", metavar="PATH", default=os.environ.get("PIPELINE_TRACE"),
+                        help="Append per-stage timing spans (JSONL) to PATH")
     sub = parser.add_subparsers(dest="command", required=True)
 
-    sub.add_parser("phase1", help="Fetch transcripts from YouTube")
+    p1 = sub.add_parser("phase1", help="Fetch transcripts from YouTube")
+    p1.add_argument("--fetch-workers", type=int, default=TRANSCRIPT_WORKERS,
+                    help=f"Concurrent transcript fetches (default: {TRANSCRIPT_WORKERS})")
 
     p2 = sub.add_parser("phase2", help="AI categorization (summarize + discover + tag)")
     p2.add_argument("--force", action="store_true",
                     help="Force re-discovery of categories")
 
-    sub.add_parser("phase3", help="Identify clips per category")
+    p3 = sub.add_parser("phase3", help="Identify clips per category")
+    p3.add_argument("--top-windows", type=int, default=0,
+                    help="Send only the N transcript windows closest to each "
+                         "category, pre-ranked by the local embedding index "
+                         "(needs numpy; default: lexical excerpts)")
     sub.add_parser("phase4", help="Extract key moments per video")
     sub.add_parser("run-all", help="Run the full pipeline")
+    st = sub.add_parser("stream", help="Fetch, summarize, tag and extract key moments "
+                                       "for one event's videos, each as soon as it can")
+    st.add_argument("--event", type=int, required=True, help="events.id")
     sub.add_parser("status", help="Show pipeline status")
+    sub.add_parser("evaluate-tagger", help="Report the local tagger's accuracy on "
+                                           "held-out Claude tags per confidence threshold")
+
+    sp = sub.add_parser("search", help="Full-text search transcripts, summaries and key moments")
+    sp.add_argument("query", nargs="+")
+    sp.add_argument("--limit", type=int, default=search_index.DEFAULT_LIMIT)
+    sp.add_argument("--kind", choices=search_index.KINDS, action="append",
+                    help="Restrict to a kind of hit (repeatable)")
+    sp.add_argument("--reindex", action="store_true",
+                    help="Rebuild the search index from scratch first")
+
+    sub.add_parser("embed", help="Build the offline embedding index (needs numpy)")
+
+    sm = sub.add_parser("similar", help="Find transcript windows like a clip, "
+                                        "key moment, timestamp or text")
+    target = sm.add_mutually_exclusive_group(required=True)
+    target.add_argument("--clip", type=int, help="clips.id")
+    target.add_argument("--moment", type=int, help="video_key_moments.id")
+    target.add_argument("--video", help="YouTube ID (with --at)")
+    target.add_argument("--text", help="Free text")
+    sm.add_argument("--at", type=float, default=0.0,
+                    help="Seconds into --video (default: 0)")
+    sm.add_argument("--limit", type=int, default=10)
+
+    ct = sub.add_parser("compact-transcripts",
+                        help="One-shot migration: rewrite transcript entries as "
+                             "compact JSON and repack the sidecar")
+    ct.add_argument("--top-windows", type=int, default=0,
+                    help="Also keep clips made with phase3 --top-windows N current")
 
     rs = sub.add_parser("reset", help="Reset a phase's data")
     rs.add_argument("--phase", type=int, required=True, choices=[1, 2, 3, 4])
 
+    pf = sub.add_parser("profile", help="Summarize a trace file per stage")
+    pf.add_argument("trace_file", nargs="?", metavar="TRACE",
+                    help="Trace file (default: the --trace path)")
+    pf.add_argument("--run", help="Run ID (default: the last run in the file)")
+
     args = parser.parse_args()
     setup_logging(verbose=args.verbose)
 
+    if args.command == "profile":
+        trace_file = args.trace_file or args.trace
+        if not trace_file:
+            parser.error("profile needs a trace file (TRACE or --trace)")
+        run_profile(trace_file, run=args.run)
+        return
+
+    tracing.configure(args.trace)
+    cache_mode = "off" if args.no_cache else "replay" if args.cache_replay else None
+    claude_api.configure(concurrency=args.concurrency, cache_mode=cache_mode,
+                         backend=args.claude_backend)
+    tag_classifier.configure(threshold=args.tag_confidence)
+
     conn = get_db()
     ensure_tables(conn)
+    pool = WorkerPool(conn, args.workers)
 
     if args.command == "phase1":
-        run_phase1(conn)
+        with tracing.span("phase1"):
+            run_phase1(conn, workers=args.fetch_workers, pool=pool)
     elif args.command == "phase2":
-        run_phase2(conn, force_categories=args.force)
+        with tracing.span("phase2"):
+            run_phase2(conn, force_categories=args.force)
     elif args.command == "phase3":
-        run_phase3(conn)
+        with tracing.span("phase3"):
+            run_phase3(conn, top_windows=args.top_windows, pool=pool)
     elif args.command == "phase4":
-        run_phase4(conn)
+        with tracing.span("phase4"):
+            run_phase4(conn, pool=pool)
     elif args.command == "run-all":
-        print("\n=== Phase 1: Transcript Collection ===")
-        run_phase1(conn)
-        print("\n=== Phase 2: AI Categorization ===")
-        run_phase2(conn, force_categories=getattr(args, 'force', False))
-        print("\n=== Phase 3: Clip Identification ===")
-        run_phase3(conn)
-        print("\n=== Phase 4: Key Moments ===")
-        run_phase4(conn)
+        with tracing.span("run_all"):
+            run_all(conn, pool, force_categories=getattr(args, 'force', False))
         print("\nPipeline complete!")
         show_status(conn)
+    elif args.command == "stream":
+        with tracing.span("stream", event=args.event):
+            run_stream_event(conn, args.event, pool)
     elif args.command == "status":
         show_status(conn)
+    elif args.command == "evaluate-tagger":
+        run_evaluate_tagger(conn)
+    elif args.command == "embed":
+        import embedding_index  # needs numpy; only loaded when asked for
+        embedding_index.build_index(conn)
+    elif args.command == "similar":
+        run_similar(conn, clip_id=args.clip, moment_id=args.moment,
+                    youtube_id=args.video, at=args.at, text=args.text,
+                    limit=args.limit)
+    elif args.command == "search":
+        run_search(conn, " ".join(args.query), limit=args.limit,
+                   kinds=tuple(args.kind or search_index.KINDS),
+                   rebuild=args.reindex)
+    elif args.command == "compact-transcripts":
+        run_compact_transcripts(conn, top_windows=args.top_windows)
     elif args.command == "reset":
         reset_phase(conn, args.phase)
 
+    if args.command in ("phase1", "phase2", "phase4", "run-all", "stream"):
+        with tracing.span("search_sync"):
+            updated = search_index.sync(conn)
+        if updated:
+            logging.getLogger("search").info(f"Search index: {updated} videos updated")
+
+    cache = claude_api.cache_stats()
+    if cache["hits"] or cache["misses"]:
+        logging.getLogger("cache").info(
+            f"Claude response cache: {cache['hits']} hits, {cache['misses']} misses")
+
+    pool.close()
     conn.close()
+    tracing.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+"""Tests for the CLI session pool, run against fake `claude` programs."""
+
+import json
+import sys
+
+import pytest
+
+import claude_api
+
+# Answers each stream-json message in turn with its pid and call number;
+# the prompt "crash" makes it exit mid-call
+SESSION_CLI = """
+import json, os, sys
+for n, line in enumerate(sys.stdin, 1):
+    prompt = json.loads(line)["message"]["content"]
+    if prompt == "crash":
+        sys.exit(3)
+    text = json.dumps({"pid": os.getpid(), "call": n, "prompt": prompt})
+    for i in range(0, len(text), 10):
+        print(json.dumps({"type": "stream_event", "event": {
+            "type": "content_block_delta",
+            "delta": {"type": "text_delta", "text": text[i:i + 10]}}}), flush=True)
+    print(json.dumps({"type": "result", "is_error": False, "result": text}), flush=True)
+"""
+
+# A CLI without stream-json input
+OLD_CLI = """
+import sys
+sys.stderr.write("error: unknown option '--input-format'\\n")
+sys.exit(1)
+"""
+
+# One prompt per process, plain JSON output
+ONE_SHOT_CLI = """
+import json, os, sys
+prompt = sys.stdin.read()
+print(json.dumps({"result": json.dumps({"pid": os.getpid(), "call": 1, "prompt": prompt})}))
+"""
+
+
+@pytest.fixture
+def program(tmp_path):
+    def write(name, source):
+        path = tmp_path / f"{name}.py"
+        path.write_text(source)
+        return [sys.executable, str(path)]
+    return write
+
+
+@pytest.fixture
+def pool(program, monkeypatch):
+    monkeypatch.setattr(claude_api, "STREAM_RESPONSES", False)
+    backends = []
+
+    def make(session_source=SESSION_CLI, **options):
+        backend = claude_api.CLIPoolBackend(
+            size=2, cmd=program("one_shot", ONE_SHOT_CLI),
+            session_cmd=program("session", session_source), **options)
+        backends.append(backend)
+        return backend
+
+    yield make
+    for backend in backends:
+        backend.close()
+
+
+def ask(backend, prompt="hello") -> dict:
+    return json.loads(backend.complete(prompt, timeout=30))
+
+
+def test_session_is_reused_across_calls(pool):
+    backend = pool()
+    first, second = ask(backend, "one"), ask(backend, "two")
+    assert second["pid"] == first["pid"]
+    assert (first["call"], second["call"]) == (1, 2)
+    assert second["prompt"] == "two"
+    assert backend.started == 1
+
+
+def test_answer_streams_in_pieces(pool):
+    backend = pool()
+    pieces = list(backend.stream("hello", timeout=30))
+    assert len(pieces) > 1
+    assert json.loads("".join(pieces))["prompt"] == "hello"
+
+
+def test_session_is_replaced_after_max_calls(pool):
+    backend = pool(max_calls=2)
+    pids = [ask(backend)["pid"] for _ in range(5)]
+    assert pids[0] == pids[1] != pids[2] == pids[3] != pids[4]
+    assert backend.started == 3
+
+
+def test_session_that_died_while_idle_is_replaced(pool):
+    backend = pool()
+    first = ask(backend)
+    backend._idle[0].proc.kill()
+    backend._idle[0].proc.wait()
+    second = ask(backend)
+    assert second["pid"] != first["pid"]
+    assert second["call"] == 1
+
+
+def test_session_that_dies_mid_call_raises_and_is_not_reused(pool):
+    backend = pool()
+    first = ask(backend)
+    with pytest.raises(claude_api.BackendError, match="exited mid-call"):
+        backend.complete("crash", timeout=30)
+    assert backend._idle == []
+    assert ask(backend)["pid"] != first["pid"]
+
+
+def test_abandoned_answer_ends_the_session(pool):
+    backend = pool()
+    pieces = backend.stream("hello", timeout=30)
+    next(pieces)
+    pieces.close()
+    assert backend._idle == []
+    assert ask(backend)["call"] == 1
+
+
+def test_close_shuts_down_idle_sessions(pool):
+    backend = pool()
+    ask(backend)
+    procs = [session.proc for session in backend._idle]
+    backend.close()
+    assert procs and all(proc.poll() is not None for proc in procs)
+    assert backend._idle == []
+
+
+def test_cli_without_sessions_falls_back_to_one_process_per_call(pool):
+    backend = pool(OLD_CLI)
+    first, second = ask(backend, "one"), ask(backend, "two")
+    assert backend.session_cmd is None
+    assert second["prompt"] == "two" and first["pid"] != second["pid"]
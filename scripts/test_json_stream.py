@@ -0,0 +1,78 @@
+"""Tests for streamed JSON array parsing and stream_claude_json."""
+
+import json
+
+import pytest
+
+import claude_api
+from json_stream import ArrayStream, parse_json_text
+
+ITEMS = [{"video_id": 1, "summary": "a [bracket] in \"quotes\", and a comma"},
+         {"video_id": 2, "summary": "escaped \\ backslash }"},
+         {"video_id": 3, "themes": ["x", {"nested": [1, 2]}]}]
+
+
+def answer(ids) -> str:
+    return json.dumps([{"video_id": v, "summary": f"talk {v}"} for v in ids])
+
+
+def cut_before(text: str, video_id: int) -> str:
+    """`text` up to (not including) the item of `video_id`."""
+    return text[:text.index(f'{{"video_id": {video_id}')]
+
+
+def feed_in_chunks(text: str, size: int) -> tuple[ArrayStream, list]:
+    stream = ArrayStream()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(stream.feed(text[start:start + size]))
+    return stream, items
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_items_survive_any_chunking(size):
+    text = "Here you go:\n```json\n" + json.dumps(ITEMS, indent=2) + "\n```\nDone."
+    stream, items = feed_in_chunks(text, size)
+    assert items == ITEMS
+    assert stream.complete and not stream.errors
+
+
+def test_items_are_handed_over_as_soon_as_they_close():
+    text = json.dumps(ITEMS)
+    second = text.index('{"video_id": 2')
+    stream = ArrayStream()
+    assert stream.feed(text[:second]) == ITEMS[:1]
+    assert stream.feed(text[second:]) == ITEMS[1:]
+
+
+def test_truncated_answer_keeps_the_items_before_the_cut():
+    stream, items = feed_in_chunks(json.dumps(ITEMS)[:-20], 5)
+    assert items == ITEMS[:2]
+    assert not stream.complete
+
+
+def test_malformed_item_is_skipped_and_reported():
+    stream, items = feed_in_chunks('[{"video_id": 1}, {"video_id": oops}, {"video_id": 3}]', 4)
+    assert items == [{"video_id": 1}, {"video_id": 3}]
+    assert stream.complete and len(stream.errors) == 1
+
+
+def test_parse_json_text():
+    assert parse_json_text("```json\n" + json.dumps(ITEMS) + "\n```") == ITEMS
+    assert parse_json_text('Sure: {"categories": []}') == {"categories": []}
+    with pytest.raises(ValueError):
+        parse_json_text(json.dumps(ITEMS)[:-1])
+
+
+def test_truncated_array_yields_items_then_raises_and_is_not_cached(fake_claude):
+    backend = fake_claude(lambda prompt: cut_before(answer([1, 2, 3]), 3),
+                          cached=True, chunk_chars=16)
+    items = []
+    with pytest.raises(claude_api.IncompleteResponse):
+        for item in claude_api.stream_claude_json("VIDEO_ID: 1"):
+            items.append(item)
+    assert [i["video_id"] for i in items] == [1, 2]
+
+    with pytest.raises(claude_api.IncompleteResponse):
+        list(claude_api.stream_claude_json("VIDEO_ID: 1"))
+    assert len(backend.prompts) == 2
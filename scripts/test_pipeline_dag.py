@@ -0,0 +1,76 @@
+"""Tests for run_dag's streaming rounds."""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from pipeline_dag import Stage, run_dag
+
+
+def connect():
+    return sqlite3.connect(":memory:")
+
+
+def test_streaming_stage_gets_new_keys_in_batches():
+    written = []
+    watermarks = []
+    calls = []
+    first_round = threading.Event()
+
+    def upstream(conn):
+        written.extend([1, 2, 3, 4])
+        first_round.wait(5)
+        written.extend([5, 6])  # fewer than a batch: held for the final run
+        time.sleep(0.1)
+
+    def output(conn, after):
+        watermarks.append(after)
+        start = after or 0
+        return written[start:], len(written)
+
+    def downstream(conn, keys=None):
+        calls.append(keys)
+        first_round.set()
+
+    run_dag([Stage("up", upstream, output=output),
+             Stage("down", downstream, needs=("up",), streams=True, batch=3)],
+            connect, poll_seconds=0.01)
+
+    assert calls == [[1, 2, 3, 4], None]
+    # Each poll picked up from where the last one stopped
+    assert watermarks[0] is None
+    assert watermarks[1:] == sorted(watermarks[1:])
+    assert set(watermarks[1:]) <= {4, 6}
+
+
+def test_streaming_needs_keys_from_every_upstream_stage():
+    outputs = {"a": [1, 2, 3], "b": [2, 3, 4]}
+    calls = []
+    done = threading.Event()
+
+    def producer(conn):
+        done.wait(5)
+
+    def output_of(name):
+        return lambda conn, after: (outputs[name][after or 0:], len(outputs[name]))
+
+    def consumer(conn, keys=None):
+        calls.append(keys)
+        done.set()
+
+    run_dag([Stage("a", producer, output=output_of("a")),
+             Stage("b", producer, output=output_of("b")),
+             Stage("c", consumer, needs=("a", "b"), streams=True)],
+            connect, poll_seconds=0.01)
+
+    assert calls[0] == [2, 3]
+    assert calls[-1] is None
+
+
+def test_streaming_from_a_stage_without_output_is_rejected():
+    with pytest.raises(ValueError, match="no output"):
+        run_dag([Stage("up", lambda conn: None),
+                 Stage("down", lambda conn, keys=None: None, needs=("up",),
+                       streams=True)], connect)
@@ -0,0 +1,121 @@
+"""Tests for BatchWriter's handling of units that cannot be written."""
+
+import sqlite3
+
+import pytest
+
+from pipeline_db import BatchWriter, configure_connection
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = configure_connection(sqlite3.connect(tmp_path / "test.db"))
+    conn.executescript("""
+        CREATE TABLE videos (id INTEGER PRIMARY KEY);
+        CREATE TABLE clips (
+            video_id INTEGER NOT NULL REFERENCES videos(id),
+            category_id INTEGER NOT NULL
+        );
+        INSERT INTO videos (id) VALUES (1), (2);
+    """)
+    yield conn
+    conn.close()
+
+
+CLIP_SQL = "INSERT INTO clips (video_id, category_id) VALUES (?, ?)"
+
+
+def clips(conn):
+    return conn.execute(
+        "SELECT video_id, category_id FROM clips ORDER BY category_id, video_id"
+    ).fetchall()
+
+
+def test_bad_unit_is_dropped_and_later_units_are_written(conn):
+    with BatchWriter(conn) as writer:
+        writer.add(CLIP_SQL, (1, 10))
+        writer.commit_point()
+        writer.add(CLIP_SQL, (2, 20))
+        writer.add(CLIP_SQL, (99, 20))  # no such video
+        writer.commit_point()
+        writer.flush()
+        assert writer.units_dropped == 1
+
+        writer.add(CLIP_SQL, (2, 30))
+        writer.commit_point()
+        writer.flush()  # the dropped unit is not replayed
+
+    assert writer.units_dropped == 1
+    assert clips(conn) == [(1, 10), (2, 30)]
+
+
+def test_bad_unit_at_exit_does_not_raise(conn):
+    with BatchWriter(conn) as writer:
+        writer.add(CLIP_SQL, (99, 10))
+        writer.commit_point()
+        writer.add(CLIP_SQL, (1, 20))
+        writer.commit_point()
+
+    assert writer.units_dropped == 1
+    assert clips(conn) == [(1, 20)]
+
+
+def test_discard_drops_the_open_unit_only(conn):
+    with BatchWriter(conn) as writer:
+        writer.add(CLIP_SQL, (1, 10))
+        writer.commit_point()
+        writer.add(CLIP_SQL, (2, 20))
+        writer.discard()
+        writer.add(CLIP_SQL, (2, 30))
+        writer.commit_point()
+
+    assert clips(conn) == [(1, 10), (2, 30)]
+
+
+DELETE_SQL = "DELETE FROM clips WHERE video_id = ?"
+
+
+def test_units_replacing_the_same_rows_apply_in_order(conn):
+    with BatchWriter(conn) as writer:
+        for category in (10, 20, 30):
+            writer.add(DELETE_SQL, (1,))
+            writer.add(CLIP_SQL, (1, category))
+            writer.add(CLIP_SQL, (2, category))
+            writer.commit_point()
+
+    assert clips(conn) == [(2, 10), (2, 20), (1, 30), (2, 30)]
+
+
+def test_statement_order_within_a_unit_is_kept(conn):
+    with BatchWriter(conn) as writer:
+        writer.add(CLIP_SQL, (1, 10))
+        writer.add(DELETE_SQL, (1,))
+        writer.add(CLIP_SQL, (1, 20))
+        writer.commit_point()
+
+    assert clips(conn) == [(1, 20)]
+
+
+def test_units_replacing_the_same_rows_apply_in_order_one_at_a_time(conn):
+    with BatchWriter(conn) as writer:
+        writer.add(DELETE_SQL, (1,))
+        writer.add(CLIP_SQL, (1, 10))
+        writer.commit_point()
+        writer.add(DELETE_SQL, (2,))
+        writer.add(CLIP_SQL, (2, 99))
+        writer.add(CLIP_SQL, (99, 99))  # no such video
+        writer.commit_point()
+        writer.add(DELETE_SQL, (1,))
+        writer.add(CLIP_SQL, (1, 20))
+        writer.commit_point()
+
+    assert writer.units_dropped == 1
+    assert clips(conn) == [(1, 20)]
+
+
+def test_database_errors_still_raise(conn):
+    writer = BatchWriter(conn)
+    writer.add("INSERT INTO missing_table VALUES (?)", (1,))
+    writer.commit_point()
+    with pytest.raises(sqlite3.OperationalError):
+        writer.flush()
@@ -0,0 +1,161 @@
+"""Tests for stream_video_results' retry rounds and partial answers."""
+
+import json
+import logging
+import re
+
+import claude_api
+import job_queue
+import tedx_pipeline
+from pipeline_db import BatchWriter
+
+STAGE = "summary"
+
+
+def ids_in(prompt: str) -> list[int]:
+    return [int(v) for v in re.findall(r"VIDEO_ID: (\d+)", prompt)]
+
+
+def answer(ids) -> str:
+    return json.dumps([{"video_id": v, "summary": f"talk {v}"} for v in ids])
+
+
+def cut_before(text: str, video_id: int) -> str:
+    """`text` up to (not including) the item of `video_id`."""
+    return text[:text.index(f'{{"video_id": {video_id}')]
+
+
+def build_jobs(rows):
+    return [(rows, "\n".join(f"VIDEO_ID: {r[0]}" for r in rows))]
+
+
+def run(db, rows, write=None) -> dict:
+    results = {}
+    with BatchWriter(db) as writer:
+        for row, items in tedx_pipeline.stream_video_results(
+                rows, build_jobs, writer, STAGE, {r[0]: "fp" for r in rows},
+                30, logging.getLogger("test"), "test", "  Test"):
+            results[row[0]] = items
+            if write is not None:
+                write(writer, row, items)
+            writer.commit_point()
+    return results
+
+
+def job_states(db) -> dict:
+    return dict(db.execute("SELECT key, state FROM pipeline_jobs WHERE stage = ?",
+                           (STAGE,)).fetchall())
+
+
+class BreakingBackend(claude_api.FakeBackend):
+    """Streams the first answer up to video 3's item, then drops the connection."""
+
+    broken = False
+
+    def stream(self, prompt, timeout):
+        text = self.complete(prompt, timeout)
+        if self.broken or 3 not in ids_in(prompt):
+            yield text
+            return
+        self.broken = True
+        yield cut_before(text, 3)
+        raise claude_api.BackendError("connection reset")
+
+
+def test_videos_cut_off_a_truncated_answer_are_retried(db, fake_claude):
+    def responder(prompt):
+        ids = ids_in(prompt)
+        return cut_before(answer(ids), 3) if len(ids) == 3 else answer(ids)
+
+    backend = fake_claude(responder, chunk_chars=16)
+    results = run(db, [(1, "a"), (2, "b"), (3, "c")])
+
+    assert sorted(results) == [1, 2, 3]
+    # Video 1 was complete once video 2 began; 2 may have been cut short,
+    # so it and 3 are asked for again, each on its own
+    assert [ids_in(p) for p in backend.prompts] == [[1, 2, 3], [2], [3]]
+    assert set(job_states(db).values()) == {job_queue.DONE}
+
+
+def test_stream_failing_partway_keeps_the_finished_videos(db, fake_claude):
+    backend = fake_claude(lambda prompt: answer(ids_in(prompt)), cached=True,
+                          backend_class=BreakingBackend)
+    results = run(db, [(1, "a"), (2, "b"), (3, "c")])
+
+    assert sorted(results) == [1, 2, 3]
+    assert [ids_in(p) for p in backend.prompts] == [[1, 2, 3], [2], [3]]
+    assert results[1] == [{"video_id": 1, "summary": "talk 1"}]
+
+    # The broken answer was not cached: asking again reaches the backend
+    list(claude_api.stream_claude_json(backend.prompts[0]))
+    assert len(backend.prompts) == 4
+
+
+def test_unwritable_video_rolls_back_without_losing_the_others(db, fake_claude):
+    db.executescript("""
+        CREATE TABLE videos (id INTEGER PRIMARY KEY);
+        CREATE TABLE summaries (
+            video_id INTEGER PRIMARY KEY REFERENCES videos(id),
+            summary TEXT NOT NULL
+        );
+        INSERT INTO videos (id) VALUES (1), (3);
+    """)
+    fake_claude(lambda prompt: answer(ids_in(prompt)))
+
+    def write(writer, row, items):
+        writer.add("INSERT INTO summaries (video_id, summary) VALUES (?, ?)",
+                   (row[0], items[-1]["summary"]))
+
+    results = run(db, [(1, "a"), (2, "b"), (3, "c")], write)
+
+    assert sorted(results) == [1, 2, 3]
+    assert db.execute("SELECT video_id FROM summaries ORDER BY video_id").fetchall() \
+        == [(1,), (3,)]
+    # Video 2's unit, its job's completion included, was dropped whole
+    states = job_states(db)
+    assert states[1] == states[3] == job_queue.DONE
+    assert states[2] != job_queue.DONE
+
+
+def test_skipped_video_is_asked_again_past_the_cache(db, fake_claude):
+    asked = {}
+
+    def responder(prompt):
+        # Leaves video 2 out of its first two answers
+        ids = ids_in(prompt)
+        asked[2] = asked.get(2, 0) + (2 in ids)
+        return answer([v for v in ids if v != 2 or asked[2] > 2])
+
+    backend = fake_claude(responder, cached=True)
+    rows = [(1, "a"), (2, "b"), (3, "c")]
+    results = run(db, rows)
+
+    assert sorted(results) == [1, 2, 3]
+    assert len(backend.prompts) == tedx_pipeline.ITEM_ATTEMPTS
+    assert set(job_states(db).values()) == {job_queue.DONE}
+
+
+def test_answer_that_skipped_a_video_is_not_replayed(db, fake_claude):
+    def responder(prompt):
+        return answer([v for v in ids_in(prompt) if v != 2])
+
+    backend = fake_claude(responder, cached=True)
+    run(db, [(1, "a"), (2, "b")])
+    assert job_states(db)[2] == job_queue.FAILED
+    sent = len(backend.prompts)
+
+    # The first answer was dropped from the cache, so a new run asks again
+    db.execute("DELETE FROM pipeline_jobs")
+    db.commit()
+    run(db, [(1, "a"), (2, "b")])
+    assert len(backend.prompts) == 2 * sent
+
+
+def test_refresh_asks_again_and_replaces_the_cached_answer(fake_claude):
+    backend = fake_claude(lambda prompt: answer([len(backend.prompts)]), cached=True)
+    first = list(claude_api.stream_claude_json("VIDEO_ID: 1"))
+    assert list(claude_api.stream_claude_json("VIDEO_ID: 1")) == first
+    fresh = list(claude_api.stream_claude_json("VIDEO_ID: 1", refresh=True))
+    assert fresh != first
+    assert list(claude_api.stream_claude_json("VIDEO_ID: 1")) == fresh
+    assert len(backend.prompts) == 2
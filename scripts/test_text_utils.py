@@ -0,0 +1,152 @@
+"""
+Regression tests for quote alignment: TranscriptIndex must give the same
+(start, end) spans as the original sliding-window correct_timestamps.
+"""
+
+import random
+
+import pytest
+
+from text_utils import TranscriptIndex, correct_timestamps, normalize_text
+
+# Few words, so random quotes and transcripts overlap a lot and ties,
+# repeats and near misses are common
+WORDS = ("the", "and", "city", "garden", "music", "hope", "we", "it's",
+         "café", "naïve", "Zürich", "42")
+NOISE = ("", "[Applause]", "(Laughter)", "--", "!", "   ")
+
+
+def reference_correct_timestamps(quote_text, entries):
+    """correct_timestamps as it was before TranscriptIndex (kept verbatim)."""
+    if not quote_text or not entries:
+        return None
+
+    norm_quote = normalize_text(quote_text)
+    if not norm_quote:
+        return None
+
+    segments = []
+    concat = ""
+    for i, entry in enumerate(entries):
+        norm = normalize_text(entry.get("text", ""))
+        if not norm:
+            continue
+        char_start = len(concat)
+        if concat:
+            concat += " "
+            char_start += 1
+        concat += norm
+        segments.append((char_start, len(concat), i))
+
+    pos = concat.find(norm_quote)
+    if pos != -1:
+        match_end = pos + len(norm_quote)
+        first_entry = None
+        last_entry = None
+        for char_start, char_end, idx in segments:
+            if char_end > pos and char_start < match_end:
+                if first_entry is None:
+                    first_entry = idx
+                last_entry = idx
+        if first_entry is not None and last_entry is not None:
+            start_entry = entries[first_entry]
+            end_entry = entries[last_entry]
+            start = start_entry["start"]
+            end = end_entry["start"] + end_entry.get("duration", 2.0)
+            return (start, end)
+
+    quote_words = norm_quote.split()
+    if not quote_words:
+        return None
+
+    window = len(quote_words)
+    best_score = 0.0
+    best_span = None
+
+    all_words = []
+    for i, entry in enumerate(entries):
+        for w in normalize_text(entry.get("text", "")).split():
+            all_words.append((w, i))
+
+    if len(all_words) < window:
+        window = len(all_words)
+
+    quote_set = set(quote_words)
+
+    for start_pos in range(len(all_words) - window + 1):
+        window_words = [w for w, _ in all_words[start_pos:start_pos + window]]
+        overlap = sum(1 for w in window_words if w in quote_set)
+        score = overlap / len(quote_words)
+        if score > best_score:
+            best_score = score
+            best_span = (all_words[start_pos][1], all_words[start_pos + window - 1][1])
+
+    if best_score >= 0.6 and best_span is not None:
+        first_idx, last_idx = best_span
+        start_entry = entries[first_idx]
+        end_entry = entries[last_idx]
+        start = start_entry["start"]
+        end = end_entry["start"] + end_entry.get("duration", 2.0)
+        return (start, end)
+
+    return None
+
+
+def random_entries(rng: random.Random) -> list[dict]:
+    entries = []
+    t = 0.0
+    for _ in range(rng.randint(0, 25)):
+        if rng.random() < 0.15:
+            text = rng.choice(NOISE)
+        else:
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 5)))
+            if rng.random() < 0.3:
+                text = text.upper() + rng.choice(".,?!")
+        entry = {"text": text, "start": round(t, 2)}
+        if rng.random() < 0.9:
+            entry["duration"] = round(rng.uniform(0.5, 4.0), 2)
+        entries.append(entry)
+        t += rng.uniform(0.5, 4.0)
+    return entries
+
+
+def random_quote(rng: random.Random, entries: list[dict]) -> str:
+    words = normalize_text(" ".join(e["text"] for e in entries)).split()
+    kind = rng.random()
+    if words and kind < 0.7:
+        # A stretch of the transcript, maybe with words swapped or dropped
+        i = rng.randrange(len(words))
+        quote = words[i:i + rng.randint(1, 12)]
+        for k in range(len(quote)):
+            if rng.random() < 0.25:
+                quote[k] = rng.choice(WORDS + ("unseen", "other"))
+        if len(quote) > 2 and rng.random() < 0.3:
+            del quote[rng.randrange(len(quote))]
+        text = " ".join(quote)
+        return text.title() + "." if rng.random() < 0.3 else text
+    if kind < 0.9:
+        return " ".join(rng.choice(WORDS + ("unseen",)) for _ in range(rng.randint(1, 8)))
+    return rng.choice(NOISE)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_index_matches_the_original_algorithm(seed):
+    rng = random.Random(seed)
+    for _ in range(100):
+        entries = random_entries(rng)
+        index = TranscriptIndex(entries)
+        for _ in range(5):
+            quote = random_quote(rng, entries)
+            expected = reference_correct_timestamps(quote, entries)
+            assert correct_timestamps(quote, entries) == expected, (quote, entries)
+            assert correct_timestamps(quote, index) == expected, (quote, entries)
+
+
+def test_exact_quote_spans_its_entries():
+    entries = [{"text": "Hello there,", "start": 1.0, "duration": 2.0},
+               {"text": "--", "start": 3.0, "duration": 1.0},
+               {"text": "general Kenobi!", "start": 4.0}]
+    assert correct_timestamps("there -- general", entries) == (1.0, 6.0)
+    assert correct_timestamps("HELLO", entries) == (1.0, 3.0)
+    assert correct_timestamps("nothing like it", entries) is None
+    assert correct_timestamps("", entries) is None
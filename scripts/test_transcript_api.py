@@ -0,0 +1,151 @@
+"""Tests for TranscriptFetcher against a local stub of YouTube's transcript endpoints."""
+
+import json
+import re
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from transcript_api import TranscriptFetcher, is_throttled
+
+VIDEO_IDS = [f"vid{n:08d}" for n in range(40)]
+
+
+class StubYouTube(BaseHTTPRequestHandler):
+    """
+    Serves the watch page, player and timedtext requests the transcript
+    library makes, answering 429 to the first `server.throttle` requests.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, body: str, content_type: str = "text/html") -> None:
+        data = body.encode()
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _throttled(self) -> bool:
+        server = self.server
+        with server.lock:
+            server.clients.add(self.client_address)
+            if server.throttle > 0:
+                server.throttle -= 1
+                server.throttled += 1
+                self._send(429, "Too Many Requests")
+                return True
+        return False
+
+    def do_GET(self):
+        if self._throttled():
+            return
+        if self.path.startswith("/watch"):
+            return self._send(200, '<html>"INNERTUBE_API_KEY": "stub-key"</html>')
+        if self.path.startswith("/api/timedtext"):
+            video_id = re.search(r"v=([\w-]+)", self.path).group(1)
+            with self.server.lock:
+                self.server.served[video_id] += 1
+            lines = "".join(f'<text start="{i * 2}.5" dur="2.0">line {i} of {video_id}</text>'
+                            for i in range(5))
+            return self._send(200, f"<transcript>{lines}</transcript>", "text/xml")
+        self._send(404, "not found")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self._throttled():
+            return
+        video_id = body["videoId"]
+        self._send(200, json.dumps({
+            "playabilityStatus": {"status": "OK"},
+            "captions": {"playerCaptionsTracklistRenderer": {"captionTracks": [{
+                "baseUrl": f"https://www.youtube.com/api/timedtext?v={video_id}",
+                "name": {"runs": [{"text": "English"}]},
+                "languageCode": "en",
+                "kind": "asr",
+            }]}},
+        }), "application/json")
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubYouTube)
+    server.lock = threading.Lock()
+    server.throttle = 0
+    server.throttled = 0
+    server.served = Counter()
+    server.clients = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def fetcher_for(stub, **options) -> TranscriptFetcher:
+    options = {"workers": 4, "initial_delay": 0.01, "min_delay": 0.002,
+               "max_delay": 1.0, "max_attempts": 8, **options}
+    return TranscriptFetcher(base_url=stub.url, **options)
+
+
+def test_every_video_is_fetched_once(stub):
+    fetcher = fetcher_for(stub)
+    results = {vid: (data, error) for vid, data, error in fetcher.fetch_many(VIDEO_IDS)}
+
+    assert sorted(results) == VIDEO_IDS
+    for vid, (data, error) in results.items():
+        assert error is None
+        assert data["language"] == "en"
+        assert data["entries"][0] == {"text": f"line 0 of {vid}", "start": 0.5,
+                                      "duration": 2.0}
+    assert set(stub.served.values()) == {1}
+    # Each worker thread keeps its session's connection alive between requests
+    assert len(stub.clients) <= fetcher.workers
+
+
+def test_rate_drops_while_throttled_and_recovers(stub):
+    stub.throttle = 4
+    fetcher = fetcher_for(stub)
+    delays = []
+    on_throttle = fetcher.limiter.on_throttle
+
+    def record():
+        on_throttle()
+        delays.append(fetcher.limiter.delay)
+
+    fetcher.limiter.on_throttle = record
+    results = list(fetcher.fetch_many(VIDEO_IDS))
+
+    assert stub.throttled == 4
+    # Each 429 doubled the interval between requests
+    assert delays == pytest.approx([0.02, 0.04, 0.08, 0.16], rel=0.2)
+    # and the successes that followed brought it most of the way back
+    assert fetcher.limiter.delay < max(delays) / 20
+    assert all(error is None for _, _, error in results)
+    assert sorted(stub.served) == VIDEO_IDS
+    assert set(stub.served.values()) == {1}
+
+
+def test_throttling_past_the_attempt_budget_fails_the_video(stub):
+    stub.throttle = 3
+    fetcher = fetcher_for(stub, workers=1, max_attempts=3)
+    [(vid, data, error)] = fetcher.fetch_many(VIDEO_IDS[:1])
+    assert data is None and is_throttled(error)
+    assert stub.served[vid] == 0
+
+
+def test_is_throttled():
+    response = requests.Response()
+    response.status_code = 429
+    assert is_throttled(requests.HTTPError(response=response))
+    response.status_code = 404
+    assert not is_throttled(requests.HTTPError(response=response))
+    assert not is_throttled(ValueError("429"))
@@ -0,0 +1,122 @@
+"""Tests for transcripts.entries encoding, the packed sidecar and compact-transcripts."""
+
+import json
+import logging
+
+import pytest
+
+import fingerprints
+import tedx_pipeline
+import transcript_store
+from transcript_store import decode_entries, encode_entries, load_transcripts
+
+# Timings as the transcript library and older pipeline versions stored
+# them: whole milliseconds, finer fractions, float noise, missing durations
+ENTRIES = [
+    {"text": "Bonjour, Zürich — “quotes” & <tags>", "start": 0.0, "duration": 2.5},
+    {"text": "[Applause]", "start": 2.5, "duration": 0.1 + 0.2},
+    {"text": "line\nbreak \\ backslash \"quoted\"", "start": 12.345, "duration": 1.005},
+    {"text": "emoji 🎤 and tab\t", "start": 3599.999},
+    {"text": "", "start": 4000.0001, "duration": 1e-3},
+    {"text": "last", "start": 5000, "duration": 2},
+]
+
+
+@pytest.fixture(autouse=True)
+def fresh_memo():
+    transcript_store.clear_memo()
+    yield
+    transcript_store.clear_memo()
+
+
+@pytest.fixture
+def store(db):
+    db.execute("CREATE TABLE videos (id INTEGER PRIMARY KEY)")
+    tedx_pipeline.ensure_tables(db)
+    return db
+
+
+def add_transcript(conn, video_id: int, entries_json: str) -> None:
+    conn.execute("INSERT INTO videos (id) VALUES (?)", (video_id,))
+    conn.execute(
+        "INSERT INTO transcripts (video_id, language, full_text, entries, fetched_at) "
+        "VALUES (?, 'en', '', ?, '2026-01-01')", (video_id, entries_json))
+    conn.commit()
+
+
+def stored_entries(conn) -> dict[int, str]:
+    return dict(conn.execute("SELECT video_id, entries FROM transcripts"))
+
+
+def test_encoded_entries_parse_back_unchanged():
+    text = encode_entries(ENTRIES)
+    # The web app JSON.parses this text; Python's parser reads the same doubles
+    assert json.loads(text) == ENTRIES
+    assert decode_entries(text) == ENTRIES
+    assert encode_entries(decode_entries(text)) == text
+
+
+def test_sidecar_keeps_timings_exact(store):
+    add_transcript(store, 1, encode_entries(ENTRIES))
+    first = load_transcripts(store, [1])[1].entries
+    transcript_store.clear_memo()
+    from_sidecar = load_transcripts(store, [1])[1].entries
+
+    assert first == from_sidecar == ENTRIES
+    # Millisecond packing gives back the very floats that went in (integer
+    # timings come back as floats, which JSON.parse reads as the same number)
+    assert json.loads(encode_entries(from_sidecar)) == json.loads(stored_entries(store)[1])
+
+
+@pytest.mark.parametrize("entries", [
+    [{"text": "a", "start": ms / 1000, "duration": 1.0} for ms in range(0, 100_000, 7)],
+    [{"text": "a", "start": n * 0.1, "duration": 0.1} for n in range(1000)],
+])
+def test_millisecond_rounding_is_stable(entries):
+    packed = transcript_store.pack_entries(entries)
+    unpacked, _ = transcript_store.unpack_entries(packed)
+    assert unpacked == entries
+    assert transcript_store.pack_entries(unpacked) == packed
+
+
+def test_compact_transcripts_is_idempotent(store, caplog):
+    loose = json.dumps(ENTRIES)  # spaced and ASCII-escaped, as older versions wrote
+    add_transcript(store, 1, loose)
+    add_transcript(store, 2, encode_entries(ENTRIES[:2]))
+    old_hash = fingerprints.transcript_hashes(store)[1]
+    store.execute(fingerprints.UPSERT_SQL, fingerprints.params(
+        fingerprints.SUMMARY, 1, tedx_pipeline.summary_fingerprint(old_hash)))
+    store.commit()
+
+    with caplog.at_level(logging.INFO, logger="compact"):
+        first = tedx_pipeline.run_compact_transcripts(store)
+    after_first = stored_entries(store)
+    summary_fps = fingerprints.load(store, fingerprints.SUMMARY)
+    second = tedx_pipeline.run_compact_transcripts(store)
+
+    assert (first["rewritten"], first["repacked"]) == (1, 2)
+    assert after_first[1] == encode_entries(ENTRIES) != loose
+    assert json.loads(after_first[1]) == ENTRIES
+    assert "1 output fingerprints carried over" in caplog.text
+    assert summary_fps[1] == tedx_pipeline.summary_fingerprint(
+        fingerprints.transcript_hashes(store)[1])
+
+    assert (second["rewritten"], second["repacked"]) == (0, 0)
+    assert second["bytes_before"] == second["bytes_after"] == first["bytes_after"]
+    assert stored_entries(store) == after_first
+    assert fingerprints.load(store, fingerprints.SUMMARY) == summary_fps
+    assert load_transcripts(store, [1])[1].entries == ENTRIES
+
+
+def test_memo_keeps_only_the_most_recently_used(store, monkeypatch):
+    monkeypatch.setattr(transcript_store, "MEMO_SIZE", 2)
+    for video_id in (1, 2, 3):
+        add_transcript(store, video_id, encode_entries(ENTRIES))
+    first = load_transcripts(store, [1, 2])
+    assert load_transcripts(store, [1])[1] is first[1]  # 1 is now the most recent
+
+    load_transcripts(store, [3])
+    assert len(transcript_store._memo) == 2
+    assert load_transcripts(store, [1])[1] is first[1]
+    again = load_transcripts(store, [2])[2]
+    assert again is not first[2] and again.entries == ENTRIES
@@ -3,10 +3,15 @@ text_utils.py — Utilities for matching quote text to transcript entries.
 
 Used to correct Claude-estimated clip timestamps by aligning quote text
 against the precise start/duration values from YouTube transcript entries.
+
+Callers matching several quotes against the same transcript should build a
+TranscriptIndex once and pass it to correct_timestamps() in place of the
+entries list, so the transcript is normalized and indexed only once.
 """
 
 import re
 import unicodedata
+from bisect import bisect_left, bisect_right
 
 
 def normalize_text(text: str) -> str:
@@ -19,7 +24,132 @@ def normalize_text(text: str) -> str:
     return text
 
 
-def correct_timestamps(quote_text: str, entries: list[dict]) -> tuple[float, float] | None:
+class TranscriptIndex:
+    """
+    A transcript normalized once and indexed for repeated quote matching.
+
+    Holds the concatenated normalized text with per-entry character offsets
+    (for the substring strategy) and the flat word sequence with an inverted
+    word -> positions index (for the word-overlap strategy).
+
+    `normalized` may supply normalize_text() of each entry's text, when
+    the caller already has it (see transcript_store.py).
+    """
+
+    def __init__(self, entries: list[dict], normalized: list[str] | None = None):
+        self.entries = entries
+        if normalized is None:
+            normalized = [normalize_text(e.get("text", "")) for e in entries]
+
+        # Concatenated normalized text; entry i spans seg_starts[k]..seg_ends[k]
+        # where seg_entries[k] == i (entries that normalize to "" are skipped)
+        parts = []
+        self.seg_starts = []
+        self.seg_ends = []
+        self.seg_entries = []
+        # Flat word list, as entry indices, plus word -> [positions]
+        self.word_entries = []
+        self.positions = {}
+
+        offset = 0
+        for i, norm in enumerate(normalized):
+            if not norm:
+                continue
+            if parts:
+                offset += 1  # joining space
+            self.seg_starts.append(offset)
+            offset += len(norm)
+            self.seg_ends.append(offset)
+            self.seg_entries.append(i)
+            parts.append(norm)
+
+            for w in norm.split():
+                self.positions.setdefault(w, []).append(len(self.word_entries))
+                self.word_entries.append(i)
+
+        self.concat = " ".join(parts)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _span(self, first_idx: int, last_idx: int) -> tuple[float, float]:
+        start_entry = self.entries[first_idx]
+        end_entry = self.entries[last_idx]
+        start = start_entry["start"]
+        end = end_entry["start"] + end_entry.get("duration", 2.0)
+        return (start, end)
+
+    def find_exact(self, norm_quote: str) -> tuple[float, float] | None:
+        """Strategy 1: substring match against the concatenated text."""
+        pos = self.concat.find(norm_quote)
+        if pos == -1:
+            return None
+        match_end = pos + len(norm_quote)
+        # Segments are sorted and disjoint: the first overlapping one is the
+        # first that ends after pos, the last is the last that starts before
+        # match_end.
+        first = bisect_right(self.seg_ends, pos)
+        last = bisect_left(self.seg_starts, match_end) - 1
+        if first >= len(self.seg_entries) or last < first:
+            return None
+        return self._span(self.seg_entries[first], self.seg_entries[last])
+
+    def find_overlap(self, quote_words: list[str],
+                     threshold: float = 0.6) -> tuple[float, float] | None:
+        """
+        Strategy 2: the earliest window of len(quote_words) transcript words
+        with the highest count of words from the quote, if that count reaches
+        `threshold` of the quote length.
+
+        Only windows that begin where a matching word enters are scored,
+        since the window count can only rise at those offsets; each is scored
+        with a rolling two-pointer count over the sorted hit positions.
+        """
+        n_words = len(self.word_entries)
+        if not quote_words or not n_words:
+            return None
+        window = min(len(quote_words), n_words)
+
+        hits = sorted(p for w in set(quote_words) for p in self.positions.get(w, ()))
+        if not hits:
+            return None
+
+        best_count = 0
+        best_start = None
+        lo = hi = 0  # hits[lo:hi] are inside the current window
+        last_start = -1
+        for h in hits:
+            start = max(0, h - window + 1)
+            if start == last_start:
+                continue
+            last_start = start
+            end = start + window  # exclusive
+            while hi < len(hits) and hits[hi] < end:
+                hi += 1
+            while lo < hi and hits[lo] < start:
+                lo += 1
+            count = hi - lo
+            if count > best_count:
+                best_count = count
+                best_start = start
+
+        if best_start is None or best_count / len(quote_words) < threshold:
+            return None
+        return self._span(self.word_entries[best_start],
+                          self.word_entries[best_start + window - 1])
+
+    def match(self, quote_text: str) -> tuple[float, float] | None:
+        """Best (start_time, end_time) span for the quote, or None."""
+        if not quote_text or not self.entries:
+            return None
+        norm_quote = normalize_text(quote_text)
+        if not norm_quote:
+            return None
+        return self.find_exact(norm_quote) or self.find_overlap(norm_quote.split())
+
+
+def correct_timestamps(quote_text: str,
+                       entries: "list[dict] | TranscriptIndex") -> tuple[float, float] | None:
     """
     Find the best matching span in transcript entries for the given quote text.
 
@@ -29,81 +159,9 @@ def correct_timestamps(quote_text: str, entries: list[dict]) -> tuple[float, flo
     Strategy 2 fallback: sliding window word overlap (>=60% threshold).
 
     Each entry is expected to have keys: 'start', 'duration', 'text'.
+    `entries` may also be a prebuilt TranscriptIndex.
     """
     if not quote_text or not entries:
         return None
-
-    norm_quote = normalize_text(quote_text)
-    if not norm_quote:
-        return None
-
-    # ── Strategy 1: substring match on concatenated normalized text ──────────
-    # Build a list of (char_start, char_end, entry_index) to map positions back
-    segments = []  # (char_start, char_end, entry_index)
-    concat = ""
-    for i, entry in enumerate(entries):
-        norm = normalize_text(entry.get("text", ""))
-        if not norm:
-            continue
-        char_start = len(concat)
-        if concat:
-            concat += " "
-            char_start += 1
-        concat += norm
-        segments.append((char_start, len(concat), i))
-
-    pos = concat.find(norm_quote)
-    if pos != -1:
-        match_end = pos + len(norm_quote)
-        first_entry = None
-        last_entry = None
-        for char_start, char_end, idx in segments:
-            # Entry overlaps with match span
-            if char_end > pos and char_start < match_end:
-                if first_entry is None:
-                    first_entry = idx
-                last_entry = idx
-        if first_entry is not None and last_entry is not None:
-            start_entry = entries[first_entry]
-            end_entry = entries[last_entry]
-            start = start_entry["start"]
-            end = end_entry["start"] + end_entry.get("duration", 2.0)
-            return (start, end)
-
-    # ── Strategy 2: sliding window word overlap ──────────────────────────────
-    quote_words = norm_quote.split()
-    if not quote_words:
-        return None
-
-    window = len(quote_words)
-    best_score = 0.0
-    best_span = None
-
-    # Build word list with entry indices
-    all_words = []  # (word, entry_index)
-    for i, entry in enumerate(entries):
-        for w in normalize_text(entry.get("text", "")).split():
-            all_words.append((w, i))
-
-    if len(all_words) < window:
-        window = len(all_words)
-
-    quote_set = set(quote_words)
-
-    for start_pos in range(len(all_words) - window + 1):
-        window_words = [w for w, _ in all_words[start_pos:start_pos + window]]
-        overlap = sum(1 for w in window_words if w in quote_set)
-        score = overlap / len(quote_words)
-        if score > best_score:
-            best_score = score
-            best_span = (all_words[start_pos][1], all_words[start_pos + window - 1][1])
-
-    if best_score >= 0.6 and best_span is not None:
-        first_idx, last_idx = best_span
-        start_entry = entries[first_idx]
-        end_entry = entries[last_idx]
-        start = start_entry["start"]
-        end = end_entry["start"] + end_entry.get("duration", 2.0)
-        return (start, end)
-
-    return None
+    index = entries if isinstance(entries, TranscriptIndex) else TranscriptIndex(entries)
+    return index.match(quote_text)
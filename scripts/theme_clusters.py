@@ -0,0 +1,197 @@
+"""
+theme_clusters.py — Group talks' theme phrases locally before category discovery.
+
+Category discovery used to send Claude the title, themes and summary of
+every talk in one prompt, which grows with the corpus. Instead the theme
+phrases from video_summaries are clustered here, and Claude is shown one
+short digest per cluster (its most common phrases, how many talks use
+them, a few titles), so the prompt is bounded by MAX_CLUSTERS however
+many talks there are.
+
+Each distinct (normalized) phrase is a vector of two equally weighted
+unit parts: TF-IDF over its content words, with document frequency
+counted over talks, so a word shared by half the corpus ("community",
+"change") links phrases less than a rare one; and the talks using it,
+so phrases that keep being given to the same talks ("mental health",
+"anxiety") are alike without sharing a word. Phrases are merged by
+average-linkage agglomerative clustering on cosine similarity, each
+phrase weighted by the number of talks using it, until no two clusters
+are MERGE_SIMILARITY alike. Only clusters that
+share a word are ever compared, so this stays cheap in pure Python for
+thousands of phrases.
+
+A talk has several themes and so can be in several clusters; digests
+count distinct talks.
+"""
+
+import heapq
+import math
+from collections import Counter
+
+from text_utils import normalize_text
+from transcript_windows import STOPWORDS
+
+MERGE_SIMILARITY = 0.15  # lowest average cosine at which clusters merge
+CONTEXT_WEIGHT = 0.5     # share of the similarity coming from shared talks
+MIN_CLUSTER_TALKS = 2    # smaller clusters are folded into one "other" digest
+MAX_CLUSTERS = 40        # digests shown, largest first
+DIGEST_THEMES = 8        # phrases listed per digest
+DIGEST_TITLES = 3        # sample talk titles per digest
+OTHER_THEMES = 40        # phrases listed in the "other" digest
+
+
+def _terms(phrase: str) -> list[str]:
+    """Content words of a normalized phrase, with plural -s stripped."""
+    terms = []
+    for word in phrase.split():
+        if len(word) <= 2 or word in STOPWORDS or word.isdigit():
+            continue
+        if len(word) > 4 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+class ThemeCluster:
+    """A group of theme phrases and the talks that use them."""
+
+    def __init__(self, phrases: Counter, talks: Counter):
+        self.phrases = phrases  # phrase -> number of talks using it
+        self.talks = talks      # video_id -> number of its phrases in here
+        self.video_ids = set(talks)
+
+    def top_phrases(self, n: int) -> list[str]:
+        return [p for p, _ in sorted(self.phrases.items(),
+                                     key=lambda kv: (-kv[1], kv[0]))[:n]]
+
+
+def cluster_themes(themes_by_video: dict[int, list[str]]) -> list[ThemeCluster]:
+    """
+    Cluster the theme phrases of {video_id: [theme, ...]}; returns the
+    clusters, the ones covering the most talks first.
+    """
+    videos_by_phrase: dict[str, set[int]] = {}
+    for vid_id, themes in themes_by_video.items():
+        for theme in themes:
+            phrase = normalize_text(theme)
+            if phrase:
+                videos_by_phrase.setdefault(phrase, set()).add(vid_id)
+    phrases = sorted(videos_by_phrase)
+    if not phrases:
+        return []
+
+    # Document frequency of each term over talks
+    df = Counter()
+    for vid_id, themes in themes_by_video.items():
+        df.update({t for theme in themes for t in _terms(normalize_text(theme))})
+    n_talks = max(1, len(themes_by_video))
+
+    # Per cluster: weight (talks using its phrases) and the weighted sum of
+    # its phrases' unit vectors; average linkage between A and B is then
+    # sum_a . sum_b / (weight_a * weight_b)
+    sums: dict[int, dict[str | int, float]] = {}
+    weights: dict[int, int] = {}
+    members: dict[int, list[str]] = {}
+    postings: dict[str | int, set[int]] = {}
+    for i, phrase in enumerate(phrases):
+        tf = Counter(_terms(phrase))
+        words = {t: c * (math.log(n_talks / df[t]) + 1.0) for t, c in tf.items()}
+        norm = math.sqrt(sum(v * v for v in words.values())) or 1.0
+        talks = videos_by_phrase[phrase]
+        weight = len(talks)
+        vec = {t: weight * v / norm * math.sqrt(1.0 - CONTEXT_WEIGHT)
+               for t, v in words.items()}
+        # Talk features are keyed by id (ints, so apart from the words)
+        share = weight * math.sqrt(CONTEXT_WEIGHT / weight)
+        vec.update((vid_id, share) for vid_id in talks)
+        sums[i] = vec
+        weights[i] = weight
+        members[i] = [phrase]
+        for t in vec:
+            postings.setdefault(t, set()).add(i)
+
+    def similarity(a: int, b: int) -> float:
+        sa, sb = sums[a], sums[b]
+        if len(sa) > len(sb):
+            sa, sb = sb, sa
+        dot = sum(v * sb.get(t, 0.0) for t, v in sa.items())
+        return dot / (weights[a] * weights[b])
+
+    def neighbours(a: int) -> set[int]:
+        found = set()
+        for t in sums[a]:
+            found |= postings[t]
+        found.discard(a)
+        return found
+
+    heap = []
+    for a in sums:
+        for b in neighbours(a):
+            if a < b:
+                sim = similarity(a, b)
+                if sim >= MERGE_SIMILARITY:
+                    heap.append((-sim, a, b))
+    heapq.heapify(heap)
+
+    next_id = len(phrases)
+    while heap:
+        _, a, b = heapq.heappop(heap)
+        if a not in sums or b not in sums:
+            continue  # one side was merged already
+        c = next_id
+        next_id += 1
+        merged = dict(sums.pop(a))
+        for t, v in sums.pop(b).items():
+            merged[t] = merged.get(t, 0.0) + v
+        sums[c] = merged
+        weights[c] = weights.pop(a) + weights.pop(b)
+        members[c] = members.pop(a) + members.pop(b)
+        for t in merged:
+            posting = postings[t]
+            posting.discard(a)
+            posting.discard(b)
+            posting.add(c)
+        for d in neighbours(c):
+            sim = similarity(c, d)
+            if sim >= MERGE_SIMILARITY:
+                heapq.heappush(heap, (-sim, d, c))
+
+    clusters = []
+    for phrase_list in members.values():
+        clusters.append(ThemeCluster(
+            Counter({p: len(videos_by_phrase[p]) for p in phrase_list}),
+            Counter(v for p in phrase_list for v in videos_by_phrase[p])))
+    clusters.sort(key=lambda c: (-len(c.video_ids), c.top_phrases(1)))
+    return clusters
+
+
+def cluster_digests(clusters: list[ThemeCluster], titles: dict[int, str]) -> list[str]:
+    """
+    One prompt block per cluster of at least MIN_CLUSTER_TALKS talks (at
+    most MAX_CLUSTERS of them), plus one listing the most common phrases
+    of all the others.
+    """
+    large = [c for c in clusters if len(c.video_ids) >= MIN_CLUSTER_TALKS]
+    shown = large[:MAX_CLUSTERS]
+    rest = large[MAX_CLUSTERS:] + [c for c in clusters
+                                   if len(c.video_ids) < MIN_CLUSTER_TALKS]
+    digests = []
+    for n, cluster in enumerate(shown, 1):
+        # The talks using most of the cluster's phrases
+        sample = sorted(cluster.talks, key=lambda v: (-cluster.talks[v], v))[:DIGEST_TITLES]
+        digests.append(
+            f"CLUSTER {n} ({len(cluster.video_ids)} talks)\n"
+            f"THEMES: {', '.join(cluster.top_phrases(DIGEST_THEMES))}\n"
+            f"EXAMPLE TALKS: {'; '.join(titles.get(v, '?') for v in sample)}\n"
+        )
+    if rest:
+        other = Counter()
+        for cluster in rest:
+            other.update(cluster.phrases)
+        talks = set().union(*(c.video_ids for c in rest))
+        top = [p for p, _ in sorted(other.items(), key=lambda kv: (-kv[1], kv[0]))]
+        digests.append(
+            f"OTHER THEMES ({len(talks)} talks, {len(other)} phrases)\n"
+            f"THEMES: {', '.join(top[:OTHER_THEMES])}\n"
+        )
+    return digests
@@ -0,0 +1,262 @@
+"""
+tracing.py — Structured per-stage timing spans written to a JSONL trace.
+
+    tracing.configure("trace.jsonl")       # once per run; off by default
+    with tracing.span("phase3"):
+        with tracing.span("batch", items=5) as s:
+            ...
+            s.set(response_chars=1234)
+            with tracing.timer("align_ms"):  # accumulate into the span
+                correct_timestamps(...)
+
+Spans nest per thread. Work handed to another thread (e.g. Claude calls
+on map_claude_json's pool) is attached to the submitting span with
+tracing.attach(parent). Each finished span becomes one JSON line:
+
+    {"run": ..., "id": 7, "parent": 3, "name": "claude_call",
+     "thread": "claude_0", "start": <epoch s>, "ms": 5123.4, ...attrs}
+
+A run starts with a {"type": "run"} header line; `tedx_pipeline.py
+profile` summarizes a trace (see summarize()). When tracing is not
+configured every call is a cheap no-op.
+"""
+
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_lock = threading.Lock()
+_file = None
+_run_id = None
+_ids = itertools.count(1)
+_local = threading.local()
+
+
+class Span:
+    __slots__ = ("id", "parent", "name", "attrs")
+
+    def __init__(self, span_id: int, parent: int | None, name: str, attrs: dict):
+        self.id = span_id
+        self.parent = parent
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def add(self, key: str, amount: float) -> None:
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+
+class _NullSpan:
+    """Stand-in returned while tracing is off."""
+
+    id = None
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def add(self, key: str, amount: float) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def configure(path: str | None) -> None:
+    """Start appending spans to `path` (None turns tracing off)."""
+    global _file, _run_id
+    close()
+    if not path:
+        return
+    _file = open(path, "a", encoding="utf-8")
+    _run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}"
+    _write({"type": "run", "run": _run_id, "argv": sys.argv[1:],
+            "start": time.time()})
+
+
+def close() -> None:
+    global _file
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file = None
+
+
+def enabled() -> bool:
+    return _file is not None
+
+
+def _write(record: dict) -> None:
+    line = json.dumps(record, default=str)
+    with _lock:
+        if _file is not None:
+            _file.write(line + "\n")
+            _file.flush()
+
+
+def _stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def current():
+    """The innermost open span on this thread (NULL_SPAN if none/off)."""
+    stack = _stack()
+    return stack[-1] if stack else NULL_SPAN
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block as a child of the current span."""
+    if _file is None:
+        yield NULL_SPAN
+        return
+    stack = _stack()
+    s = Span(next(_ids), stack[-1].id if stack else None, name, attrs)
+    stack.append(s)
+    wall = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        ms = (time.perf_counter() - t0) * 1000
+        stack.pop()
+        _write({"run": _run_id, "id": s.id, "parent": s.parent, "name": name,
+                "thread": threading.current_thread().name,
+                "start": wall, "ms": round(ms, 3), **s.attrs})
+
+
+@contextmanager
+def attach(parent):
+    """Make `parent` (a span from another thread) current on this thread."""
+    if _file is None or parent is NULL_SPAN:
+        yield
+        return
+    stack = _stack()
+    stack.append(parent)
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def add(key: str, amount: float) -> None:
+    """Accumulate a number on the current span."""
+    current().add(key, amount)
+
+
+def set_attrs(**attrs) -> None:
+    current().set(**attrs)
+
+
+@contextmanager
+def timer(key: str):
+    """Add the block's duration in ms to `key` on the current span."""
+    if _file is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        add(key, (time.perf_counter() - t0) * 1000)
+
+
+# ─── Summaries ────────────────────────────────────────────────────────
+
+def read_trace(path: str, run: str | None = None) -> tuple[dict | None, list[dict]]:
+    """
+    Spans of one run in a trace file: `run` if given, else the last run.
+    Returns (run header, spans).
+    """
+    headers: dict[str, dict] = {}
+    runs: dict[str, list[dict]] = {}
+    last = None
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("type") == "run":
+                last = record["run"]
+                headers[last] = record
+                runs.setdefault(last, [])
+            elif record.get("run") in runs:
+                runs[record["run"]].append(record)
+    run = run or last
+    return headers.get(run), runs.get(run, [])
+
+
+# Span attributes reported as sums in the profile
+SUM_ATTRS = ("prompt_chars", "response_chars", "attempts", "retries", "sleep_s",
+             "slot_wait_s", "parse_ms", "align_ms", "rows", "items")
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[int(pct) - 1]
+
+
+def summarize(spans: list[dict]) -> list[dict]:
+    """
+    Aggregate spans by path (names from the root down, e.g.
+    "phase2/summarize/claude_call"): count, total/self/mean/p50/p95/max ms
+    and sums of SUM_ATTRS. Sorted by total time, descending.
+    """
+    by_id = {s["id"]: s for s in spans}
+    paths: dict[int, str] = {}
+
+    def path_of(s: dict) -> str:
+        if s["id"] not in paths:
+            parent = by_id.get(s.get("parent"))
+            prefix = path_of(parent) + "/" if parent else ""
+            paths[s["id"]] = prefix + s["name"]
+        return paths[s["id"]]
+
+    # Self time excludes children that ran on the same thread; work
+    # attached from a pool overlaps its parent instead of nesting in it
+    child_ms: dict[int, float] = {}
+    for s in spans:
+        parent = by_id.get(s.get("parent"))
+        if parent and parent["thread"] == s["thread"]:
+            child_ms[parent["id"]] = child_ms.get(parent["id"], 0) + s["ms"]
+
+    groups: dict[str, list[dict]] = {}
+    for s in spans:
+        groups.setdefault(path_of(s), []).append(s)
+
+    rows = []
+    for path, group in groups.items():
+        durations = sorted(s["ms"] for s in group)
+        row = {
+            "path": path,
+            "count": len(group),
+            "total_ms": sum(durations),
+            "self_ms": sum(s["ms"] - child_ms.get(s["id"], 0) for s in group),
+            "mean_ms": sum(durations) / len(durations),
+            "p50_ms": _percentile(durations, 50),
+            "p95_ms": _percentile(durations, 95),
+            "max_ms": durations[-1],
+            "errors": sum(1 for s in group if "error" in s),
+        }
+        for attr in SUM_ATTRS:
+            values = [s[attr] for s in group if isinstance(s.get(attr), (int, float))]
+            if values:
+                row[attr] = sum(values)
+        rows.append(row)
+    rows.sort(key=lambda r: -r["total_ms"])
+    return rows
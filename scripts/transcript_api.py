@@ -1,14 +1,34 @@
 """
 YouTube transcript fetching.
 Adapted from d:\\coding\\openbox\\tools\\skills\\youtube_transcript\\main.py
+
+TranscriptFetcher fetches many transcripts on a small thread pool. Each
+worker keeps its own YouTubeTranscriptApi (the library is not thread-safe)
+over a pooled requests.Session that is reused across that worker's calls,
+and all workers share an adaptive rate limiter that backs off when
+YouTube throttles and speeds back up as requests succeed.
 """
 
+import os
 import re
 import logging
-from youtube_transcript_api import YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+from youtube_transcript_api import (
+    YouTubeTranscriptApi, TranscriptsDisabled, NoTranscriptFound,
+    RequestBlocked, YouTubeRequestFailed,
+)
 
 logger = logging.getLogger(__name__)
 
+YOUTUBE_BASE_URL = "https://www.youtube.com"
+
 
 def extract_video_id(url: str) -> str | None:
     """Extract YouTube video ID from various URL formats."""
@@ -23,17 +43,20 @@ def extract_video_id(url: str) -> str | None:
     return None
 
 
-def get_transcript(video_id: str, languages: list[str] | None = None) -> dict:
+def get_transcript(video_id: str, languages: list[str] | None = None,
+                   api: YouTubeTranscriptApi | None = None) -> dict:
     """
     Fetch transcript for a YouTube video.
 
     Returns dict with keys: text, language, is_generated, entries
     entries is a list of {text, start, duration} dicts.
+
+    Pass `api` to reuse an existing client (and its HTTP connections).
     """
     if languages is None:
         languages = ['en']
 
-    api = YouTubeTranscriptApi()
+    api = api or YouTubeTranscriptApi()
     try:
         transcript = api.fetch(video_id, languages=languages)
     except (TranscriptsDisabled, NoTranscriptFound):
@@ -62,3 +85,153 @@ def format_timestamp(seconds: float) -> str:
     if hours > 0:
         return f"{hours:02d}:{minutes:02d}:{secs:02d}"
     return f"{minutes:02d}:{secs:02d}"
+
+
+# ─── Concurrent fetching ──────────────────────────────────────────────
+
+class AdaptiveRateLimiter:
+    """
+    Shared minimum interval between request starts, adjusted AIMD-style:
+    each throttled response multiplies the interval by `backoff`, each
+    success shrinks it by `recovery` down to `min_delay`.
+    """
+
+    def __init__(self, initial_delay: float = 1.0, min_delay: float = 0.2,
+                 max_delay: float = 60.0, backoff: float = 2.0,
+                 recovery: float = 0.9):
+        self.delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.recovery = recovery
+        self._next_start = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> float:
+        """Block until this caller may start a request. Returns seconds slept."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.delay
+        slept = start - now
+        if slept > 0:
+            time.sleep(slept)
+        return slept
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.delay = max(self.min_delay, self.delay * self.recovery)
+
+    def on_throttle(self) -> None:
+        with self._lock:
+            self.delay = min(self.max_delay, max(self.delay, self.min_delay) * self.backoff)
+            # Push everyone back, not just the next request
+            self._next_start = max(self._next_start, time.monotonic() + self.delay)
+            logger.warning(f"YouTube throttling detected, request interval now "
+                           f"{self.delay:.1f}s")
+
+
+def is_throttled(error: Exception) -> bool:
+    """True for errors that mean \"slow down\" rather than \"no transcript\"."""
+    if isinstance(error, RequestBlocked):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in (429, 503)
+    if isinstance(error, YouTubeRequestFailed):
+        return "429" in str(error) or "Too Many Requests" in str(error)
+    return False
+
+
+class _RebaseAdapter(HTTPAdapter):
+    """Sends requests for YOUTUBE_BASE_URL to another host (e.g. a local stub)."""
+
+    def __init__(self, base_url: str, **kwargs):
+        self.base_url = base_url.rstrip("/")
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if request.url.startswith(YOUTUBE_BASE_URL):
+            request.url = self.base_url + request.url[len(YOUTUBE_BASE_URL):]
+        return super().send(request, **kwargs)
+
+
+class TranscriptFetcher:
+    """
+    Fetch transcripts for many videos with `workers` concurrent threads.
+
+    `base_url` (default: $YOUTUBE_BASE_URL) redirects all YouTube requests
+    to another server, so the fetcher can be exercised against a local stub
+    transcript server.
+    """
+
+    def __init__(self, workers: int = 4, initial_delay: float = 1.0,
+                 min_delay: float = 0.2, max_delay: float = 60.0,
+                 max_attempts: int = 4, languages: list[str] | None = None,
+                 base_url: str | None = None):
+        self.workers = max(1, workers)
+        self.max_attempts = max_attempts
+        self.languages = languages
+        self.base_url = base_url or os.environ.get("YOUTUBE_BASE_URL")
+        self.limiter = AdaptiveRateLimiter(initial_delay=initial_delay,
+                                           min_delay=min_delay,
+                                           max_delay=max_delay)
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = requests.Session()
+        if self.base_url:
+            adapter = _RebaseAdapter(self.base_url, pool_maxsize=4)
+        else:
+            adapter = HTTPAdapter(pool_maxsize=4)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _api(self) -> YouTubeTranscriptApi:
+        api = getattr(self._local, "api", None)
+        if api is None:
+            api = self._local.api = YouTubeTranscriptApi(http_client=self._session())
+        return api
+
+    def fetch(self, video_id: str) -> dict:
+        """Fetch one transcript, retrying with backoff while throttled."""
+        with tracing.span("transcript_fetch", video=video_id) as s:
+            for attempt in range(1, self.max_attempts + 1):
+                s.add("sleep_s", self.limiter.wait())
+                s.add("attempts", 1)
+                try:
+                    data = get_transcript(video_id, self.languages, api=self._api())
+                except Exception as e:
+                    if is_throttled(e) and attempt < self.max_attempts:
+                        self.limiter.on_throttle()
+                        s.add("retries", 1)
+                        continue
+                    raise
+                self.limiter.on_success()
+                s.set(response_chars=len(data["text"]))
+                return data
+            raise RuntimeError(f"Transcript fetch for {video_id} exhausted retries")
+
+    def fetch_many(self, video_ids):
+        """
+        Yield (video_id, data, error) in completion order; exactly one of
+        data/error is None.
+        """
+        video_ids = list(video_ids)
+        if not video_ids:
+            return
+        parent = tracing.current()
+
+        def run(vid):
+            with tracing.attach(parent):
+                return self.fetch(vid)
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(video_ids)),
+                                thread_name_prefix="transcripts") as pool:
+            futures = {pool.submit(run, vid): vid for vid in video_ids}
+            for future in as_completed(futures):
+                vid = futures[future]
+                try:
+                    yield vid, future.result(), None
+                except Exception as e:
+                    yield vid, None, e
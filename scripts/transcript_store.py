@@ -0,0 +1,396 @@
+"""
+transcript_store.py — Compact, pre-normalized transcript sidecar.
+
+transcripts.entries holds each transcript as a JSON list of
+{text, start, duration} dicts (the web app reads and writes that format).
+Decoding those multi-hundred-KB blobs is the pipeline's main per-video
+cost, and the same talk is loaded by phase 3 (once per category it is
+tagged with), phase 4 and fix_clip_timestamps.py.
+
+This module keeps a packed copy next to it in `transcript_packed`:
+starts (delta-encoded) and durations as integer milliseconds, raw and
+normalized entry text each concatenated with an array of entry lengths,
+all zlib-compressed. Timings that are not whole milliseconds are kept as
+float64 instead, so packing is lossless. A sidecar row is valid while
+its transcript_id/fetched_at match the transcripts row and its format is
+PACK_FORMAT, so a re-fetch from the web app simply makes it stale and it
+is rebuilt on the next load.
+
+The pipeline writes transcripts.entries with encode_entries (compact
+JSON, as the web app's JSON.stringify writes it) and reads it with
+decode_entries; compact_entries rewrites older, loosely spaced rows and
+repacks every sidecar row in one pass.
+
+The MEMO_SIZE most recently used transcripts are memoized per process,
+so a talk loaded again by the next phase or category is usually not
+decoded twice, while memory stays flat however many videos a run (or a
+`stream`) goes through. Read-only connections (the
+--workers processes) decode stale transcripts without storing the
+packed copy; the writing process packs them on its next load.
+"""
+
+import json
+import math
+import sqlite3
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from datetime import datetime, timezone
+
+from text_utils import TranscriptIndex, normalize_text
+
+PACK_FORMAT = 2
+
+MEMO_SIZE = 64  # decoded transcripts kept per process
+
+# Leading byte of a packed timing array
+_MILLIS = b"m"   # zlib-compressed int32 milliseconds
+_FLOATS = b"d"   # zlib-compressed float64 seconds
+_MISSING_MS = -1  # a missing duration in a millisecond array
+
+
+def ensure_table(conn):
+    columns = {r[1] for r in conn.execute("PRAGMA table_info(transcript_packed)")}
+    if columns and "text_lens" not in columns:
+        # Format 1 layout; the table is only a cache, so start over
+        conn.execute("DROP TABLE transcript_packed")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS transcript_packed (
+            video_id INTEGER PRIMARY KEY REFERENCES videos(id) ON DELETE CASCADE,
+            transcript_id INTEGER NOT NULL,
+            fetched_at TEXT NOT NULL,
+            format INTEGER NOT NULL,
+            starts BLOB NOT NULL,
+            durations BLOB NOT NULL,
+            text BLOB NOT NULL,
+            text_lens BLOB NOT NULL,
+            norm_text BLOB NOT NULL,
+            norm_lens BLOB NOT NULL,
+            packed_at TEXT NOT NULL
+        )
+    """)
+
+
+def encode_entries(entries: list[dict]) -> str:
+    """transcripts.entries text for a list of {text, start, duration} dicts."""
+    return json.dumps(entries, ensure_ascii=False, separators=(",", ":"))
+
+
+def decode_entries(entries_json: str | None) -> list[dict] | None:
+    """Entries from transcripts.entries text; None if missing or malformed."""
+    try:
+        entries = json.loads(entries_json)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    return entries if isinstance(entries, list) else None
+
+
+class Transcript:
+    """A decoded transcript: entries, normalized entry text, lazy index."""
+
+    __slots__ = ("video_id", "entries", "normalized", "_index")
+
+    def __init__(self, video_id: int, entries: list[dict],
+                 normalized: list[str] | None = None):
+        self.video_id = video_id
+        self.entries = entries
+        self.normalized = normalized
+        self._index = None
+
+    @property
+    def index(self) -> TranscriptIndex:
+        """TranscriptIndex over the entries, built on first use."""
+        if self._index is None:
+            self._index = TranscriptIndex(self.entries, normalized=self.normalized)
+        return self._index
+
+
+# (video_id, transcript_id, fetched_at) -> Transcript, least recently used first
+_memo: OrderedDict[tuple, Transcript] = OrderedDict()
+_memo_lock = threading.Lock()  # DAG stages load on several threads
+
+
+def _recall(key: tuple) -> Transcript | None:
+    with _memo_lock:
+        transcript = _memo.get(key)
+        if transcript is not None:
+            _memo.move_to_end(key)
+        return transcript
+
+
+def _remember(key: tuple, transcript: Transcript) -> Transcript:
+    with _memo_lock:
+        _memo[key] = transcript
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+    return transcript
+
+
+def _join(texts: list[str]) -> tuple[bytes, bytes]:
+    lens = array("I", (len(t) for t in texts))
+    return (zlib.compress("".join(texts).encode("utf-8")),
+            zlib.compress(lens.tobytes()))
+
+
+def _split(text_blob: bytes, lens_blob: bytes) -> list[str]:
+    text = zlib.decompress(text_blob).decode("utf-8")
+    lens = array("I")
+    lens.frombytes(zlib.decompress(lens_blob))
+    out = []
+    prev = 0
+    for end in accumulate(lens):
+        out.append(text[prev:end])
+        prev = end
+    return out
+
+
+def _pack_times(values: list, delta: bool) -> bytes:
+    """
+    Timings in seconds (None for missing) as whole milliseconds, each the
+    difference from the previous one with `delta`; as float64 if any is
+    not a whole millisecond.
+    """
+    millis = array("i")
+    try:
+        for v in values:
+            if v is None:
+                millis.append(_MISSING_MS)
+                continue
+            ms = round(v * 1000)
+            if ms / 1000 != v or ms < 0:
+                raise ValueError
+            millis.append(ms)
+    except (ValueError, OverflowError):
+        floats = array("d", (math.nan if v is None else v for v in values))
+        return _FLOATS + zlib.compress(floats.tobytes())
+    if delta:
+        millis = array("i", (b - a for a, b in zip([0] + millis.tolist(), millis)))
+    return _MILLIS + zlib.compress(millis.tobytes())
+
+
+def _unpack_times(blob: bytes, delta: bool) -> list:
+    """Inverse of _pack_times."""
+    raw = zlib.decompress(blob[1:])
+    if blob[:1] == _FLOATS:
+        floats = array("d")
+        floats.frombytes(raw)
+        return [None if math.isnan(v) else v for v in floats]
+    millis = array("i")
+    millis.frombytes(raw)
+    if delta:
+        millis = accumulate(millis)
+    return [None if ms == _MISSING_MS else ms / 1000 for ms in millis]
+
+
+def pack_entries(entries: list[dict], normalized: list[str] | None = None) -> dict:
+    """Pack entries (and their normalized text, if known) into sidecar column values."""
+    texts = [e.get("text", "") or "" for e in entries]
+    if normalized is None:
+        normalized = [normalize_text(t) for t in texts]
+    text, text_lens = _join(texts)
+    norm_text, norm_lens = _join(normalized)
+    # Missing durations decode back to missing (correct_timestamps applies
+    # its own default)
+    durations = [float(e["duration"]) if e.get("duration") is not None else None
+                 for e in entries]
+    return {
+        "starts": _pack_times([float(e["start"]) for e in entries], delta=True),
+        "durations": _pack_times(durations, delta=False),
+        "text": text,
+        "text_lens": text_lens,
+        "norm_text": norm_text,
+        "norm_lens": norm_lens,
+    }
+
+
+def unpack_entries(packed) -> tuple[list[dict], list[str]]:
+    """Inverse of pack_entries: (entries, normalized entry texts)."""
+    starts = _unpack_times(packed["starts"], delta=True)
+    durations = _unpack_times(packed["durations"], delta=False)
+    texts = _split(packed["text"], packed["text_lens"])
+    norms = _split(packed["norm_text"], packed["norm_lens"])
+    entries = []
+    for text, start, duration in zip(texts, starts, durations):
+        entry = {"text": text, "start": start}
+        if duration is not None:
+            entry["duration"] = duration
+        entries.append(entry)
+    return entries, norms
+
+
+# transcript_id is looked up from the transcripts row, so the sidecar row
+# can be queued (e.g. on a BatchWriter) right behind its transcript insert
+PACKED_INSERT_SQL = """
+    INSERT OR REPLACE INTO transcript_packed
+    (video_id, transcript_id, fetched_at, format, starts, durations,
+     text, text_lens, norm_text, norm_lens, packed_at)
+    VALUES (?, (SELECT id FROM transcripts WHERE video_id = ?),
+            ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def packed_params(video_id: int, fetched_at: str, packed: dict) -> tuple:
+    """Parameters for PACKED_INSERT_SQL."""
+    return (
+        video_id, video_id, fetched_at, PACK_FORMAT,
+        packed["starts"], packed["durations"],
+        packed["text"], packed["text_lens"],
+        packed["norm_text"], packed["norm_lens"],
+        datetime.now(timezone.utc).isoformat(),
+    )
+
+
+def write_packed(conn, video_id: int, fetched_at: str, entries: list[dict],
+                 normalized: list[str] | None = None) -> dict:
+    """Store (or replace) the sidecar row for one transcript."""
+    packed = pack_entries(entries, normalized)
+    conn.execute(PACKED_INSERT_SQL, packed_params(video_id, fetched_at, packed))
+    return packed
+
+
+def load_transcripts(conn, video_ids, repack: bool = True) -> dict[int, Transcript]:
+    """
+    Load transcripts for the given video ids as {video_id: Transcript}.
+
+    Served from the in-process memo, then the sidecar table; transcripts
+    with no valid sidecar row are decoded from JSON once and packed for
+    next time, unless `repack` is off (for callers that must not write;
+    the sidecar is then only read, if it exists in the current format).
+    Videos without a transcript (or with unreadable entries) are omitted.
+    """
+    video_ids = list(dict.fromkeys(video_ids))
+    if not video_ids:
+        return {}
+
+    result = {}
+    repacked = False
+    # Stay well under SQLite's bound-parameter limit
+    for chunk_start in range(0, len(video_ids), 500):
+        chunk = video_ids[chunk_start:chunk_start + 500]
+        marks = ",".join("?" * len(chunk))
+        meta = conn.execute(
+            f"SELECT video_id, id, fetched_at FROM transcripts "
+            f"WHERE video_id IN ({marks})", chunk,
+        ).fetchall()
+
+        need = []
+        for vid_id, transcript_id, fetched_at in meta:
+            key = (vid_id, transcript_id, fetched_at)
+            transcript = _recall(key)
+            if transcript is not None:
+                result[vid_id] = transcript
+            else:
+                need.append(key)
+        if not need:
+            continue
+
+        need_ids = [k[0] for k in need]
+        marks = ",".join("?" * len(need_ids))
+        try:
+            packed_rows = {
+                r[0]: r for r in conn.execute(
+                    f"""SELECT video_id, transcript_id, fetched_at, format, starts,
+                               durations, text, text_lens, norm_text, norm_lens
+                        FROM transcript_packed WHERE video_id IN ({marks})""",
+                    need_ids,
+                )
+            }
+        except sqlite3.OperationalError:
+            if repack:
+                raise
+            packed_rows = {}  # no sidecar (or an older one) and we may not build it
+
+        stale = []
+        for key in need:
+            vid_id, transcript_id, fetched_at = key
+            row = packed_rows.get(vid_id)
+            if (row is not None and row[1] == transcript_id
+                    and row[2] == fetched_at and row[3] == PACK_FORMAT):
+                entries, norms = unpack_entries({
+                    "starts": row[4], "durations": row[5],
+                    "text": row[6], "text_lens": row[7],
+                    "norm_text": row[8], "norm_lens": row[9],
+                })
+                result[vid_id] = _remember(key, Transcript(vid_id, entries, norms))
+            else:
+                stale.append(key)
+
+        for vid_id, transcript_id, fetched_at in stale:
+            entries = decode_entries(conn.execute(
+                "SELECT entries FROM transcripts WHERE video_id = ?", (vid_id,)
+            ).fetchone()[0])
+            if entries is None:
+                continue
+            norms = [normalize_text(e.get("text", "") or "") for e in entries]
+            if repack:
+                try:
+                    write_packed(conn, vid_id, fetched_at, entries, norms)
+                    repacked = True
+                except sqlite3.OperationalError as e:
+                    if "readonly" not in str(e):
+                        raise
+            key = (vid_id, transcript_id, fetched_at)
+            result[vid_id] = _remember(key, Transcript(vid_id, entries, norms))
+
+    if repacked:
+        conn.commit()
+    return result
+
+
+def compact_entries(conn, batch: int = 200) -> dict:
+    """
+    One-shot migration: rewrite transcripts.entries rows that are not in
+    encode_entries form (the pipeline used to write loosely spaced,
+    ASCII-escaped JSON) and (re)pack every sidecar row that is stale or
+    of an older format. Entries keep their values and fetched_at, so the
+    web app sees the same transcripts. Returns counts and entries bytes.
+    """
+    stats = {"transcripts": 0, "rewritten": 0, "repacked": 0,
+             "bytes_before": 0, "bytes_after": 0}
+    packed_meta = {
+        vid_id: (transcript_id, fetched_at, fmt)
+        for vid_id, transcript_id, fetched_at, fmt in conn.execute(
+            "SELECT video_id, transcript_id, fetched_at, format FROM transcript_packed")
+    }
+    video_ids = [r[0] for r in conn.execute(
+        "SELECT video_id FROM transcripts ORDER BY video_id")]
+    for chunk_start in range(0, len(video_ids), batch):
+        chunk = video_ids[chunk_start:chunk_start + batch]
+        marks = ",".join("?" * len(chunk))
+        rows = conn.execute(
+            f"SELECT id, video_id, fetched_at, entries FROM transcripts "
+            f"WHERE video_id IN ({marks})", chunk,
+        ).fetchall()
+        with conn:
+            for transcript_id, vid_id, fetched_at, entries_json in rows:
+                stats["transcripts"] += 1
+                size = len(entries_json.encode("utf-8")) if entries_json else 0
+                stats["bytes_before"] += size
+                entries = decode_entries(entries_json)
+                if entries is None:
+                    stats["bytes_after"] += size
+                    continue
+                compact = encode_entries(entries)
+                stats["bytes_after"] += len(compact.encode("utf-8"))
+                if compact != entries_json:
+                    conn.execute("UPDATE transcripts SET entries = ? WHERE id = ?",
+                                 (compact, transcript_id))
+                    stats["rewritten"] += 1
+                if packed_meta.get(vid_id) != (transcript_id, fetched_at, PACK_FORMAT):
+                    write_packed(conn, vid_id, fetched_at, entries)
+                    stats["repacked"] += 1
+    clear_memo()
+    return stats
+
+
+def load_transcript(conn, video_id: int) -> Transcript | None:
+    """Single-video convenience wrapper around load_transcripts."""
+    return load_transcripts(conn, [video_id]).get(video_id)
+
+
+def clear_memo() -> None:
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,182 @@
+"""
+transcript_windows.py — Category-relevant transcript excerpts for clip prompts.
+
+Phase 3 gives each talk a fixed character budget in the clip prompt.
+Taking the start of the transcript until the budget runs out means the
+second half of a long talk never reaches the model. Instead, each
+transcript is cut into windows of consecutive entries, windows are scored
+lexically against the category's related themes and the talk's key
+quotes, and the best-scoring windows that fit the budget are emitted in
+transcript order, with "..." marking skipped stretches.
+
+When nothing scores (e.g. a category with no themes and a talk without
+a summary) the earliest windows win, which reproduces the old
+prefix-of-the-transcript behaviour.
+"""
+
+from collections import Counter
+
+from text_utils import normalize_text
+from transcript_api import format_timestamp
+
+WINDOW_CHARS = 1200      # formatted transcript lines per window (~1-2 minutes)
+THEME_WEIGHT = 2.0       # per matched category theme/name term
+QUOTE_WEIGHT = 1.0       # per matched key-quote term
+QUOTE_MATCH_BONUS = 5.0  # window contains the opening of a key quote
+QUOTE_MATCH_WORDS = 6
+GAP_LINE = "..."
+
+STOPWORDS = frozenset("""
+    a about after all also an and any are as at be because been but by can
+    could did do does for from had has have he her his how i if in into is it
+    its just like me more most my no not now of on one or our out so some
+    than that the their them then there these they this to up us was we were
+    what when where which who will with would you your
+""".split())
+
+
+def _terms(texts) -> set[str]:
+    terms = set()
+    for text in texts:
+        terms.update(w for w in normalize_text(text).split()
+                     if w not in STOPWORDS and len(w) > 2)
+    return terms
+
+
+class WindowQuery:
+    """Weighted query terms for one (category, talk) pair."""
+
+    def __init__(self, themes: list[str], key_quotes: list[str]):
+        self.weights: dict[str, float] = {}
+        for term in _terms(key_quotes):
+            self.weights[term] = QUOTE_WEIGHT
+        for term in _terms(themes):
+            self.weights[term] = THEME_WEIGHT
+        self.quote_openings = []
+        for quote in key_quotes:
+            words = normalize_text(quote).split()
+            if words:
+                self.quote_openings.append(" ".join(words[:QUOTE_MATCH_WORDS]))
+
+    def score(self, norm_texts: list[str]) -> float:
+        """Saturating term-frequency score of one window's normalized text."""
+        text = " ".join(t for t in norm_texts if t)
+        counts = Counter(text.split())
+        score = 0.0
+        for term, weight in self.weights.items():
+            tf = counts.get(term)
+            if tf:
+                score += weight * tf / (tf + 1)
+        for opening in self.quote_openings:
+            if opening in text:
+                score += QUOTE_MATCH_BONUS
+        return score
+
+
+def format_line(entry: dict) -> str:
+    return f"[{format_timestamp(entry['start'])}] {entry['text']}"
+
+
+def split_windows(lines: list[str]) -> list[tuple[int, int]]:
+    """Consecutive line ranges [first, last) of about WINDOW_CHARS each."""
+    windows = []
+    first = 0
+    size = 0
+    for i, line in enumerate(lines):
+        if size and size + len(line) + 1 > WINDOW_CHARS:
+            windows.append((first, i))
+            first, size = i, 0
+        size += len(line) + 1
+    if first < len(lines):
+        windows.append((first, len(lines)))
+    return windows
+
+
+def time_windows(entries: list[dict], seconds: float,
+                 stride: float) -> list[tuple[int, int]]:
+    """
+    Sliding entry ranges [first, last) spanning about `seconds` of talk,
+    a new one starting every `stride` seconds.
+    """
+    windows = []
+    n = len(entries)
+    first = 0
+    while first < n:
+        window_end = entries[first]["start"] + seconds
+        last = first + 1
+        while last < n and entries[last]["start"] < window_end:
+            last += 1
+        windows.append((first, last))
+        if last >= n:
+            break
+        next_start = entries[first]["start"] + stride
+        nxt = first + 1
+        while nxt < last and entries[nxt]["start"] < next_start:
+            nxt += 1
+        first = nxt
+    return windows
+
+
+def select_windows(lines: list[str], normalized: list[str], query: WindowQuery,
+                   budget: int) -> list[tuple[int, int]]:
+    """
+    Highest-scoring windows whose lines fit in `budget` characters,
+    returned in transcript order. Ties go to the earlier window.
+    """
+    windows = split_windows(lines)
+    scored = sorted(
+        ((query.score(normalized[first:last]), first, last)
+         for first, last in windows),
+        key=lambda w: (-w[0], w[1]),
+    )
+    chosen = []
+    used = 0
+    for _, first, last in scored:
+        cost = sum(len(line) + 1 for line in lines[first:last]) + len(GAP_LINE) + 1
+        if used + cost <= budget:
+            chosen.append((first, last))
+            used += cost
+    chosen.sort()
+    return chosen
+
+
+def merge_ranges(ranges) -> list[tuple[int, int]]:
+    """Sort entry ranges and merge the overlapping or adjacent ones."""
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def iter_range_lines(header: str, entries: list[dict], ranges):
+    """
+    Yield the header, then the timestamped lines of the given sorted,
+    disjoint entry ranges, with GAP_LINE wherever entries are skipped.
+    """
+    yield header
+    prev_last = 0
+    for first, last in ranges:
+        if first != prev_last:
+            yield GAP_LINE
+        yield from (format_line(e) for e in entries[first:last])
+        prev_last = last
+    if prev_last != len(entries):
+        yield GAP_LINE
+
+
+def iter_excerpt_lines(header: str, entries: list[dict], normalized: list[str] | None,
+                       query: WindowQuery, budget: int):
+    """
+    Yield the prompt lines for one talk: the header, then the selected
+    windows' timestamped lines with GAP_LINE between non-adjacent windows.
+    """
+    lines = [format_line(e) for e in entries]
+    if normalized is None:
+        normalized = [normalize_text(e.get("text", "")) for e in entries]
+    # Reserve room for the header and a trailing gap marker
+    budget -= len(header) + len(GAP_LINE) + 2
+    yield from iter_range_lines(
+        header, entries, select_windows(lines, normalized, query, budget))
@@ -0,0 +1,153 @@
+"""
+worker_pool.py — Process pool for the CPU-bound parts of the phases.
+
+Claude calls and transcript fetches wait on the network and already run
+on threads, but decoding and normalizing transcripts, ranking clip
+excerpts and aligning quotes to timestamps are pure Python and share one
+core. With `--workers N` those per-video and per-category tasks run on N
+worker processes instead.
+
+Each worker opens its own read-only connection to the database (WAL lets
+it read while the pipeline writes) and sends back plain values; all
+inserts stay with the coordinating process and its BatchWriter, so
+SQLite still sees a single writer. Tasks are module-level functions
+called as fn(conn, *args), with `conn` being the worker's connection.
+
+With one worker (the default) no processes are started and tasks run
+inline on the caller's connection, exactly as before.
+"""
+
+import copy
+import logging
+import multiprocessing
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+from pipeline_db import PRAGMAS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 1
+
+# PRAGMAs a read-only connection can apply (journal mode is the writer's)
+READ_PRAGMAS = tuple(p for p in PRAGMAS if p[0] != "journal_mode") + (
+    ("query_only", "ON"),
+)
+
+_conn = None  # this worker process's read connection
+
+
+def _init_worker(db_path: str) -> None:
+    global _conn
+    _conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    for name, value in READ_PRAGMAS:
+        _conn.execute(f"PRAGMA {name} = {value}")
+
+
+def _run(fn, args):
+    return fn(_conn, *args)
+
+
+class WorkerPool:
+    """
+    Runs tasks on `workers` processes, or inline when workers is 1.
+
+        pool = WorkerPool(conn, 4)
+        prompts = pool.map(build_prompt, [(cat_id, names) for ...])
+        blocks = pool.map_chunked(build_blocks, video_ids)
+        for key, result, error in pool.imap_unordered(align, jobs):
+            ...
+        pool.close()
+    """
+
+    def __init__(self, conn, workers: int = DEFAULT_WORKERS):
+        self.conn = conn
+        self.workers = max(1, workers)
+        self._executor = None
+        self._shared = False
+        if self.workers > 1:
+            db_path = conn.execute("PRAGMA database_list").fetchone()[2]
+            # spawn, not fork: the parent has Claude and fetch threads running
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(db_path,),
+            )
+            logger.debug(f"Started {self.workers} worker processes on {db_path}")
+
+    def using(self, conn) -> "WorkerPool":
+        """
+        This pool's worker processes, running inline tasks on `conn`
+        instead (for callers on another thread). Close the original only.
+        """
+        view = copy.copy(self)
+        view.conn = conn
+        view._shared = True
+        return view
+
+    def submit(self, fn, *args) -> Future:
+        """Run fn(conn, *args); inline tasks are finished when this returns."""
+        if self._executor is not None:
+            return self._executor.submit(_run, fn, args)
+        future = Future()
+        try:
+            future.set_result(fn(self.conn, *args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def map(self, fn, arg_tuples) -> list:
+        """Results of fn(conn, *args) for each args tuple, in order."""
+        futures = [self.submit(fn, *args) for args in arg_tuples]
+        return [f.result() for f in futures]
+
+    def map_chunked(self, fn, items: list) -> list:
+        """
+        fn(conn, chunk) -> list over chunks of `items`, concatenated in
+        order: one chunk inline, a few per worker otherwise, so per-task
+        overhead and batched reads are shared by many items.
+        """
+        if not items:
+            return []
+        size = max(1, -(-len(items) // (self.workers * 4 if self._executor else 1)))
+        results = []
+        for part in self.map(fn, [(items[i:i + size],)
+                                  for i in range(0, len(items), size)]):
+            results.extend(part)
+        return results
+
+    def imap_unordered(self, fn, jobs):
+        """
+        Yield (key, result, error) for (key, args) jobs as their tasks
+        finish. Jobs are pulled lazily, so `jobs` can itself be a stream
+        of results arriving from the network; finished tasks are handed
+        over between arrivals, and the rest once `jobs` is exhausted.
+        """
+        running = {}
+        for key, args in jobs:
+            running[self.submit(fn, *args)] = key
+            done = [f for f in running if f.done()]
+            for future in done:
+                yield self._outcome(running.pop(future), future)
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield self._outcome(running.pop(future), future)
+
+    @staticmethod
+    def _outcome(key, future: Future) -> tuple:
+        error = future.exception()
+        return key, None if error else future.result(), error
+
+    def close(self) -> None:
+        if self._executor is not None and not self._shared:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False